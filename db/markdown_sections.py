@@ -0,0 +1,79 @@
+"""
+Markdown section tokenizer shared by the SQLite importer (db/migrate.py) and
+the Echo chunker (skills/echo/index-sessions.py), so both cut a diary at the
+same headings.
+
+iter_sections() walks the text once, line by line, and yields one section per
+ATX heading (# to ######), running to the next heading of any level, plus a
+level-0 preamble when text comes before the first heading. Lines inside ```
+or ~~~ fences are never headings (a "# comment" in a shell block is code).
+
+Each section is a dict:
+  level       1-6, or 0 for the preamble
+  title       heading text ("" for the preamble)
+  line        0-based line number of the heading
+  start, end  character offsets: text[start:end] is the section
+  body_start  offset just past the heading line
+  text, body  the section with and without its heading line
+"""
+
+import re
+
+# Only heading lines and fence lines can change state. Each pattern starts
+# with a literal "\n", which the regex engine scans for at C speed, so the
+# text is walked once and every other line is skipped without Python code.
+_LINE_RE = re.compile(r"\n(?:(#{1,6})[ \t]+([^\n]+)| {0,3}(`{3,}|~{3,}))")
+
+
+def _section(text, level, title, line, start, body_start, end) -> dict:
+    return {"level": level, "title": title, "line": line, "start": start, "end": end,
+            "body_start": body_start, "text": text[start:end], "body": text[body_start:end]}
+
+
+def iter_sections(text):
+    """Yield the heading-bounded sections of text in order, in a single pass."""
+    level, title, line, start, body_start = 0, "", 0, 0, 0
+    fence = None
+    line_no, counted = 0, 0
+    # Prefix a newline so the first line is found like any other. The "\n"
+    # before a line then sits at that line's own offset in ``text``.
+    padded = "\n" + text
+    for match in _LINE_RE.finditer(padded):
+        hashes, heading, marker = match.groups()
+        if fence is not None:
+            if marker and marker.startswith(fence):
+                fence = None
+            continue
+        if marker:
+            fence = marker
+            continue
+        pos = match.start()
+        if pos > start or level:
+            yield _section(text, level, title, line, start, body_start, pos)
+        line_no += text.count("\n", counted, pos)
+        counted = pos
+        level, title, line = len(hashes), heading.strip(), line_no
+        start, body_start = pos, min(match.end(), len(text))
+    if len(text) > start or level:
+        yield _section(text, level, title, line, start, body_start, len(text))
+
+
+def section_bodies(sections, level=2) -> dict:
+    """Title -> stripped body of the first heading at ``level`` with that title.
+
+    A body takes in its deeper subsections and stops at the next heading of
+    ``level`` or above, so "## Decisions" keeps the "### Why" under it.
+    """
+    bodies = {}
+    current, parts = None, []
+    for section in sections:
+        if 0 < section["level"] <= level:
+            if current is not None and current not in bodies:
+                bodies[current] = "".join(parts).strip()
+            current = section["title"] if section["level"] == level else None
+            parts = [section["body"]]
+        elif current is not None:
+            parts.append(section["text"])
+    if current is not None and current not in bodies:
+        bodies[current] = "".join(parts).strip()
+    return bodies
@@ -1,660 +1,70 @@
 #!/usr/bin/env python
 """
-MemStack SQLite Memory Backend — CLI Helper
-Repository pattern: skills call this script instead of raw file I/O.
+MemStack SQLite Memory Backend — CLI entry point.
 
-Usage:
-    python db/memstack-db.py <command> [args...]
+Skills run this file; the implementation lives in memstack_db.py next to it,
+which in-process callers import directly (`from memstack_db import MemStackDB`).
+See that module for the commands.
 
-Commands:
-    init                          Initialize/migrate the database
-    add-session   <json>          Add a session diary entry
-    add-insight   <json>          Add an insight/decision
-    search        <query> [opts]  Full-text search across all tables
-    get-sessions  <project> [n]   Get recent sessions for a project
-    get-insights  <project>       Get insights for a project
-    get-context   <project>       Get project context
-    set-context   <json>          Upsert project context
-    add-plan-task <json>          Add a task to a project plan
-    get-plan      <project>       Get all plan tasks for a project
-    update-task   <json>          Update a plan task status
-    export-md     <project>       Export project memory as markdown
-    stats                         Show database statistics
+This file is also the daemon's thin client. When `memstack-db.py serve` is
+running, the command line is sent to it as-is and its reply printed, using
+nothing heavier than json, os and socket: memstack_db, sqlite3 and argparse
+are imported only when no daemon takes the command (none running, or it
+declines one it must not run for this caller) and it runs in this process.
 """
 
-import argparse
 import json
 import os
-import sqlite3
 import sys
-from pathlib import Path, PureWindowsPath
 
-DB_DIR = Path(__file__).parent
-DB_PATH = DB_DIR / "memstack.db"
-SCHEMA_PATH = DB_DIR / "schema.sql"
+HERE = os.path.dirname(os.path.abspath(__file__))
+# The same defaults as memstack_db.DB_PATH and SOCKET_PATH.
+DB_PATH = os.path.abspath(os.environ.get("MEMSTACK_SQLITE_PATH")
+                          or os.path.join(HERE, "memstack.db"))
+SOCKET_PATH = os.environ.get("MEMSTACK_SOCKET") or os.path.join(HERE, "memstack.sock")
 
 
-def parse_json_arg(raw: str) -> dict:
-    """Parse JSON input with a clean error on failure."""
-    try:
-        return json.loads(raw)
-    except json.JSONDecodeError as e:
-        print(json.dumps({"ok": False, "error": f"Invalid JSON input: {e}"}))
-        sys.exit(1)
-
-
-def require_fields(data: dict, *fields: str) -> None:
-    """Validate required fields exist in data dict."""
-    for f in fields:
-        if f not in data or data[f] is None:
-            print(json.dumps({"ok": False, "error": f"Missing required field: {f}"}))
-            sys.exit(1)
-
-
-CANONICAL_TYPES = frozenset(
-    {"gotcha", "lesson", "pattern", "warning", "failed_approach", "decision", "architecture"}
-)
-
-# Variant spellings seen in real data, mapped to a canonical type. Canonicals map to
-# themselves; anything not listed passes through unchanged.
-TYPE_ALIASES = {t: t for t in CANONICAL_TYPES}
-TYPE_ALIASES.update(
-    {
-        "bug": "gotcha",
-        "bugfix": "gotcha",
-        "bug-fix": "gotcha",
-        "distribution-bug": "gotcha",
-        "debugging": "gotcha",
-        "prevention": "warning",
-        "correction": "gotcha",
-    }
-)
-
-
-def normalize_type(value: str) -> str:
-    """Map a type variant to its canonical form; unknown types pass through unchanged."""
-    if value is None:
-        return "decision"
-    stripped = str(value).strip()
-    if not stripped:
-        return "decision"
-    return TYPE_ALIASES.get(stripped.lower(), stripped)
-
-
-# Procedural insight types that mirror into the skill-loader's searchable memory.
-# architecture and decision are record, not procedure: bridging 1,000+ decisions
-# would drown FTS retrieval, so they are deliberately excluded.
-BRIDGED_TYPES = frozenset({"gotcha", "lesson", "pattern", "warning", "failed_approach"})
-
-
-def _known_project_dirs(memory_db, project) -> list:
-    """Directories the loader's store already associates with ``project``.
-
-    Prefers find_project_dirs_by_name, which distinguishes "never seen" (0) from
-    "collides with another project" (2+). Older loaders only have
-    resolve_project_dir_by_name, which collapses both to None — there we fall
-    back and simply cannot report ambiguity, which is no worse than before.
-    """
-    finder = getattr(memory_db, "find_project_dirs_by_name", None)
-    if finder is not None:
-        return list(finder(project))
-    single = memory_db.resolve_project_dir_by_name(project)
-    return [single] if single else []
-
-
-def resolve_project_dir(memory_db, project) -> dict:
-    """Decide which project_dir an insight belongs to, or why it cannot bridge.
-
-    Returns {"project_dir": path} on success (plus "autoregistered": path when
-    the project is entering the store for the first time), or {"reason": str}
-    describing exactly which of the three failure modes applied.
-
-    Auto-registration is deliberately gated on the CURRENT WORKING DIRECTORY
-    agreeing with the supplied name. The diary invokes this script from the
-    project root, so cwd is the project — but a name that does NOT match cwd is
-    almost always an ad-hoc label ("general", "test", "SnowTrack+LawnTrack")
-    rather than a real repo, and registering those would pollute cross-project
-    recall permanently. Requiring corroboration from the filesystem the process
-    is actually running in means a project cannot be typo'd into existence.
-    """
-    known = _known_project_dirs(memory_db, project)
-    if len(known) == 1:
-        return {"project_dir": known[0]}
-    if len(known) > 1:
-        return {
-            "reason": "ambiguous project {!r}: {} known paths ({}) — refusing "
-                      "to guess".format(project, len(known), ", ".join(known))
-        }
-
-    name = (project or "").strip()
-    if not name:
-        return {"reason": "unknown project: no project name supplied"}
+def forward(argv):
+    """Run argv on a live daemon: (exit code, stdout text), or None to run it here."""
+    if not argv or os.environ.get("MEMSTACK_NO_DAEMON") or not os.path.exists(SOCKET_PATH):
+        return None
+    import socket  # only once there is a daemon to talk to
 
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
     try:
-        cwd = os.getcwd()
-    except OSError as exc:
-        return {"reason": f"unknown project {name!r}: cwd unavailable ({exc})"}
-
-    canonical = getattr(memory_db, "canonical_project_dir", None)
-    cwd = canonical(cwd) if canonical else cwd
-    cwd_name = PureWindowsPath(cwd).name
-
-    if cwd_name.lower() != name.lower():
-        return {
-            "reason": "unrecognized project {!r}: not in the memory store, and "
-                      "cwd basename is {!r} — not auto-registering".format(name, cwd_name)
-        }
-    return {"project_dir": cwd, "autoregistered": cwd}
-
-
-def bridge_to_loader(project, type_value, content, context, tags, created_at) -> dict:
-    """Mirror a procedural insight into the skill-loader's memory.db; never raises."""
+        sock.settimeout(0.5)
+        sock.connect(SOCKET_PATH)
+    except OSError:
+        sock.close()
+        return None
     try:
-        # 1. Procedural filter: only the five procedure types bridge.
-        if type_value not in BRIDGED_TYPES:
-            return {}
-        # 2. A redirected loader DB would auto-create and silently diverge. Skip.
-        if os.environ.get("MEMSTACK_DB_PATH"):
-            return {"bridge_skipped": "MEMSTACK_DB_PATH is set"}
-        # 3. Guarded import: a machine without the loader is a no-op, not an error.
-        try:
-            from memstack_skill_loader import memory_db
-        except Exception:
-            return {}
-        # 4. Resolve the name against paths the store already knows.
-        #
-        # A name can fail for three different reasons, and they are NOT
-        # interchangeable — reporting all of them as "unknown project" sent a
-        # real investigation looking for a missing registration when the actual
-        # fault was a duplicate. Report each honestly, and auto-register only
-        # the one case where the filesystem corroborates the name.
-        resolution = resolve_project_dir(memory_db, project)
-        project_dir = resolution.get("project_dir")
-        if project_dir is None:
-            return {"bridge_skipped": resolution["reason"]}
-        autoregistered = resolution.get("autoregistered")
-
-        # 5. Derive a title (procedural_memory.title is NOT NULL; insights has none).
-        text = content or ""
-        idx = text.find(". ")
-        if idx != -1 and idx < 120:
-            title = text[:idx]
-        else:
-            title = text[:90]
-        title = title.strip()
-        if title.endswith("."):
-            title = title[:-1]
-        title = " ".join(title.split())
-        if len(title) > 90:
-            cut = title[:90]
-            if " " in cut:
-                cut = cut[:cut.rfind(" ")]
-            title = cut.rstrip() + "..."
-        if not title:
-            title = text[:60]
-
-        # 6. Content: append operative context (procedural_memory has no context col).
-        body = content or ""
-        if context and context.strip():
-            body = body + "\n\nContext: " + context.strip()
-
-        # 7. Tags: comma-separated string -> ordered unique list; empty -> None.
-        tag_list = []
-        for tag in (tags or "").split(","):
-            tag = tag.strip()
-            if tag and tag not in tag_list:
-                tag_list.append(tag)
-        stack_tags = tag_list or None
-
-        # 8-9. created_at passed through verbatim (keyword-only). None -> failure.
-        lesson_id = memory_db.insert_lesson(
-            title,
-            body,
-            type_value,
-            project_dir=project_dir,
-            stack_tags=stack_tags,
-            created_at=created_at,
-        )
-        if lesson_id is None:
-            return {"bridge_failed": True}
-        result = {"bridged": {"project_dir": project_dir, "lesson_id": lesson_id}}
-        if autoregistered:
-            # Surface it: the project just entered cross-project memory for the
-            # first time, and a wrong path here is worth noticing immediately.
-            result["project_autoregistered"] = autoregistered
-        return result
-    except Exception as exc:  # 10. Never raise into the diary save.
-        return {"bridge_error": str(exc)}
-
-
-def get_db():
-    """Get database connection, initializing schema if needed."""
-    is_new = not DB_PATH.exists()
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode = WAL")
-    conn.execute("PRAGMA foreign_keys = ON")
-    if is_new:
-        conn.executescript(SCHEMA_PATH.read_text())
-    return conn
-
-
-def cmd_init(_args):
-    """Initialize or re-apply schema."""
-    conn = get_db()
-    conn.executescript(SCHEMA_PATH.read_text())
-    conn.close()
-    print(json.dumps({"ok": True, "db": str(DB_PATH)}))
-
-
-def cmd_add_session(args):
-    """Add a session diary entry."""
-    data = parse_json_arg(args.json)
-    require_fields(data, "project")
-    conn = get_db()
-    conn.execute(
-        """INSERT INTO sessions (project, date, accomplished, files_changed, commits,
-           decisions, problems, next_steps, duration, raw_markdown)
-           VALUES (:project, :date, :accomplished, :files_changed, :commits,
-           :decisions, :problems, :next_steps, :duration, :raw_markdown)""",
-        {
-            "project": data["project"],
-            "date": data.get("date", ""),
-            "accomplished": data.get("accomplished", ""),
-            "files_changed": data.get("files_changed", ""),
-            "commits": data.get("commits", ""),
-            "decisions": data.get("decisions", ""),
-            "problems": data.get("problems", ""),
-            "next_steps": data.get("next_steps", ""),
-            "duration": data.get("duration", ""),
-            "raw_markdown": data.get("raw_markdown", ""),
-        },
-    )
-    conn.commit()
-    row_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
-    conn.close()
-    print(json.dumps({"ok": True, "id": row_id}))
-
-
-def cmd_add_insight(args):
-    """Add an insight or decision."""
-    data = parse_json_arg(args.json)
-    require_fields(data, "content")
-    raw_type = data.get("type")
-    type_value = normalize_type(raw_type)
-    conn = get_db()
-    conn.execute(
-        """INSERT INTO insights (project, type, content, context, tags)
-           VALUES (:project, :type, :content, :context, :tags)""",
-        {
-            "project": data.get("project"),
-            "type": type_value,
-            "content": data["content"],
-            "context": data.get("context", ""),
-            "tags": data.get("tags", ""),
-        },
-    )
-    conn.commit()
-    row_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
-    # Read the stored timestamp back so the bridge mirrors the ACTUAL created_at.
-    created_at = conn.execute(
-        "SELECT created_at FROM insights WHERE id = ?", (row_id,)
-    ).fetchone()[0]
-    conn.close()
-    response = {"ok": True, "id": row_id}
-    if raw_type is not None and str(raw_type).strip():
-        if type_value in CANONICAL_TYPES:
-            if type_value != str(raw_type).strip().lower():
-                response["type_normalized"] = f"{raw_type} -> {type_value}"
-        else:
-            response["type_unknown"] = type_value
-    # Dual-write procedural insights into the skill-loader's searchable memory.
-    # memstack.db is already committed and closed; the bridge is guarded and
-    # never raises, so a failure here cannot disturb the diary save.
-    response.update(
-        bridge_to_loader(
-            data.get("project"),
-            type_value,
-            data["content"],
-            data.get("context", ""),
-            data.get("tags", ""),
-            created_at,
-        )
-    )
-    print(json.dumps(response))
-
-
-def cmd_search(args):
-    """Full-text search across sessions, insights, and project_context."""
-    query = f"%{args.query}%"
-    limit = args.limit or 10
-    project_filter = args.project
-
-    conn = get_db()
-    results = []
-
-    # Search sessions
-    sql = "SELECT id, project, date, accomplished, decisions, next_steps FROM sessions WHERE "
-    params = []
-    conditions = ["(accomplished LIKE ? OR decisions LIKE ? OR commits LIKE ? OR next_steps LIKE ? OR problems LIKE ?)"]
-    params.extend([query] * 5)
-    if project_filter:
-        conditions.append("project = ?")
-        params.append(project_filter)
-    sql += " AND ".join(conditions) + " ORDER BY date DESC LIMIT ?"
-    params.append(limit)
-
-    for row in conn.execute(sql, params):
-        results.append({
-            "type": "session",
-            "id": row["id"],
-            "project": row["project"],
-            "date": row["date"],
-            "accomplished": (row["accomplished"] or "")[:200],
-            "decisions": (row["decisions"] or "")[:200],
-        })
-
-    # Search insights
-    sql = "SELECT id, project, type, content, tags FROM insights WHERE content LIKE ?"
-    params = [query]
-    if project_filter:
-        sql += " AND project = ?"
-        params.append(project_filter)
-    sql += " ORDER BY created_at DESC LIMIT ?"
-    params.append(limit)
-
-    for row in conn.execute(sql, params):
-        results.append({
-            "type": "insight",
-            "id": row["id"],
-            "project": row["project"],
-            "insight_type": row["type"],
-            "content": row["content"][:200],
-            "tags": row["tags"],
-        })
-
-    conn.close()
-    print(json.dumps({"results": results, "count": len(results)}))
-
-
-def cmd_get_sessions(args):
-    """Get recent sessions for a project."""
-    conn = get_db()
-    limit = args.limit or 5
-    rows = conn.execute(
-        """SELECT id, project, date, accomplished, files_changed, commits,
-           decisions, problems, next_steps, duration
-           FROM sessions WHERE project = ? ORDER BY date DESC LIMIT ?""",
-        (args.project, limit),
-    ).fetchall()
-    conn.close()
-    sessions = [dict(r) for r in rows]
-    print(json.dumps({"sessions": sessions, "count": len(sessions)}))
-
-
-def cmd_get_insights(args):
-    """Get insights for a project."""
-    conn = get_db()
-    rows = conn.execute(
-        "SELECT * FROM insights WHERE project = ? OR project IS NULL ORDER BY created_at DESC",
-        (args.project,),
-    ).fetchall()
-    conn.close()
-    print(json.dumps({"insights": [dict(r) for r in rows], "count": len(rows)}))
-
-
-def cmd_get_context(args):
-    """Get project context."""
-    conn = get_db()
-    row = conn.execute(
-        "SELECT * FROM project_context WHERE project = ?", (args.project,)
-    ).fetchone()
-    conn.close()
-    if row:
-        print(json.dumps(dict(row)))
-    else:
-        print(json.dumps({"project": args.project, "status": "no context saved"}))
-
-
-def cmd_set_context(args):
-    """Upsert project context."""
-    data = parse_json_arg(args.json)
-    require_fields(data, "project")
-    conn = get_db()
-    conn.execute(
-        """INSERT INTO project_context (project, status, current_branch, last_session_date,
-           architecture_decisions, known_issues, backlog, updated_at)
-           VALUES (:project, :status, :current_branch, :last_session_date,
-           :architecture_decisions, :known_issues, :backlog, datetime('now'))
-           ON CONFLICT(project) DO UPDATE SET
-           status = COALESCE(:status, status),
-           current_branch = COALESCE(:current_branch, current_branch),
-           last_session_date = COALESCE(:last_session_date, last_session_date),
-           architecture_decisions = COALESCE(:architecture_decisions, architecture_decisions),
-           known_issues = COALESCE(:known_issues, known_issues),
-           backlog = COALESCE(:backlog, backlog),
-           updated_at = datetime('now')""",
-        {
-            "project": data["project"],
-            "status": data.get("status"),
-            "current_branch": data.get("current_branch"),
-            "last_session_date": data.get("last_session_date"),
-            "architecture_decisions": data.get("architecture_decisions"),
-            "known_issues": data.get("known_issues"),
-            "backlog": data.get("backlog"),
-        },
-    )
-    conn.commit()
-    conn.close()
-    print(json.dumps({"ok": True, "project": data["project"]}))
-
-
-def cmd_add_plan_task(args):
-    """Add a task to a project plan."""
-    data = parse_json_arg(args.json)
-    require_fields(data, "project", "task_number", "description")
-    conn = get_db()
-    conn.execute(
-        """INSERT INTO plans (project, task_number, description, status, blocked_reason)
-           VALUES (:project, :task_number, :description, :status, :blocked_reason)
-           ON CONFLICT(project, task_number) DO UPDATE SET
-           description = :description, status = :status,
-           blocked_reason = :blocked_reason, updated_at = datetime('now')""",
-        {
-            "project": data["project"],
-            "task_number": data["task_number"],
-            "description": data["description"],
-            "status": data.get("status", "pending"),
-            "blocked_reason": data.get("blocked_reason"),
-        },
-    )
-    conn.commit()
-    conn.close()
-    print(json.dumps({"ok": True}))
-
-
-def cmd_get_plan(args):
-    """Get all plan tasks for a project."""
-    conn = get_db()
-    rows = conn.execute(
-        "SELECT * FROM plans WHERE project = ? ORDER BY task_number",
-        (args.project,),
-    ).fetchall()
-    conn.close()
-    tasks = [dict(r) for r in rows]
-    done = sum(1 for t in tasks if t["status"] == "completed")
-    print(json.dumps({"project": args.project, "tasks": tasks, "done": done, "total": len(tasks)}))
-
-
-def cmd_update_task(args):
-    """Update a plan task's status."""
-    data = parse_json_arg(args.json)
-    require_fields(data, "project", "task_number", "status")
-    conn = get_db()
-    cur = conn.execute(
-        """UPDATE plans SET status = :status, blocked_reason = :blocked_reason,
-           updated_at = datetime('now')
-           WHERE project = :project AND task_number = :task_number""",
-        {
-            "project": data["project"],
-            "task_number": data["task_number"],
-            "status": data["status"],
-            "blocked_reason": data.get("blocked_reason"),
-        },
-    )
-    conn.commit()
-    conn.close()
-    if cur.rowcount == 0:
-        print(json.dumps({"ok": False, "error": f"Task not found: {data['project']} #{data['task_number']}"}))
-    else:
-        print(json.dumps({"ok": True}))
-
-
-def cmd_export_md(args):
-    """Export all memory for a project as markdown."""
-    conn = get_db()
-    lines = [f"# Memory Export — {args.project}\n"]
-
-    # Sessions
-    sessions = conn.execute(
-        "SELECT * FROM sessions WHERE project = ? ORDER BY date DESC",
-        (args.project,),
-    ).fetchall()
-    if sessions:
-        lines.append("## Sessions\n")
-        for s in sessions:
-            lines.append(f"### {s['date']}")
-            if s["accomplished"]:
-                lines.append(f"**Accomplished:**\n{s['accomplished']}")
-            if s["commits"]:
-                lines.append(f"**Commits:**\n{s['commits']}")
-            if s["decisions"]:
-                lines.append(f"**Decisions:**\n{s['decisions']}")
-            if s["next_steps"]:
-                lines.append(f"**Next Steps:**\n{s['next_steps']}")
-            lines.append("")
-
-    # Insights
-    insights = conn.execute(
-        "SELECT * FROM insights WHERE project = ? ORDER BY created_at DESC",
-        (args.project,),
-    ).fetchall()
-    if insights:
-        lines.append("## Insights\n")
-        for i in insights:
-            lines.append(f"- **[{i['type']}]** {i['content']}")
-        lines.append("")
-
-    # Context
-    ctx = conn.execute(
-        "SELECT * FROM project_context WHERE project = ?", (args.project,)
-    ).fetchone()
-    if ctx:
-        lines.append("## Project Context\n")
-        lines.append(f"- **Status:** {ctx['status']}")
-        if ctx["current_branch"]:
-            lines.append(f"- **Current Branch:** {ctx['current_branch']}")
-        if ctx["architecture_decisions"]:
-            lines.append(f"- **Architecture Decisions:**\n{ctx['architecture_decisions']}")
-        if ctx["known_issues"]:
-            lines.append(f"- **Known Issues:**\n{ctx['known_issues']}")
-        if ctx["backlog"]:
-            lines.append(f"- **Backlog:**\n{ctx['backlog']}")
-
-    conn.close()
-    print("\n".join(lines))
-
-
-def cmd_stats(_args):
-    """Show database statistics."""
-    conn = get_db()
-    sessions = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
-    insights = conn.execute("SELECT COUNT(*) FROM insights").fetchone()[0]
-    projects = conn.execute("SELECT COUNT(*) FROM project_context").fetchone()[0]
-    plans = conn.execute("SELECT COUNT(*) FROM plans").fetchone()[0]
-
-    by_project = conn.execute(
-        "SELECT project, COUNT(*) as cnt FROM sessions GROUP BY project ORDER BY cnt DESC"
-    ).fetchall()
-
-    conn.close()
-    print(json.dumps({
-        "sessions": sessions,
-        "insights": insights,
-        "projects": projects,
-        "plan_tasks": plans,
-        "sessions_by_project": {r["project"]: r["cnt"] for r in by_project},
-        "db_path": str(DB_PATH),
-        "db_size_kb": round(DB_PATH.stat().st_size / 1024, 1) if DB_PATH.exists() else 0,
-    }))
-
-
-def main():
-    parser = argparse.ArgumentParser(description="MemStack SQLite Memory Backend")
-    sub = parser.add_subparsers(dest="command")
-
-    sub.add_parser("init")
-
-    p = sub.add_parser("add-session")
-    p.add_argument("json")
-
-    p = sub.add_parser("add-insight")
-    p.add_argument("json")
-
-    p = sub.add_parser("search")
-    p.add_argument("query")
-    p.add_argument("--project", default=None)
-    p.add_argument("--limit", type=int, default=10)
-
-    p = sub.add_parser("get-sessions")
-    p.add_argument("project")
-    p.add_argument("--limit", type=int, default=5)
-
-    p = sub.add_parser("get-insights")
-    p.add_argument("project")
-
-    p = sub.add_parser("get-context")
-    p.add_argument("project")
-
-    p = sub.add_parser("set-context")
-    p.add_argument("json")
-
-    p = sub.add_parser("add-plan-task")
-    p.add_argument("json")
-
-    p = sub.add_parser("get-plan")
-    p.add_argument("project")
-
-    p = sub.add_parser("update-task")
-    p.add_argument("json")
-
-    p = sub.add_parser("export-md")
-    p.add_argument("project")
-
-    sub.add_parser("stats")
-
-    args = parser.parse_args()
-    if not args.command:
-        parser.print_help()
-        sys.exit(1)
-
-    cmd_map = {
-        "init": cmd_init,
-        "add-session": cmd_add_session,
-        "add-insight": cmd_add_insight,
-        "search": cmd_search,
-        "get-sessions": cmd_get_sessions,
-        "get-insights": cmd_get_insights,
-        "get-context": cmd_get_context,
-        "set-context": cmd_set_context,
-        "add-plan-task": cmd_add_plan_task,
-        "get-plan": cmd_get_plan,
-        "update-task": cmd_update_task,
-        "export-md": cmd_export_md,
-        "stats": cmd_stats,
-    }
-    cmd_map[args.command](args)
+        cwd = os.getcwd()
+    except OSError:
+        cwd = None
+    request = {"argv": argv, "db": DB_PATH, "cwd": cwd,
+               "env": {k: v for k, v in os.environ.items() if k.startswith("MEMSTACK_")}}
+    # Connected: from here a failure is reported, never retried in-process,
+    # because the daemon may already have applied a write.
+    with sock:
+        sock.settimeout(None)
+        sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        with sock.makefile("rb") as reader:
+            line = reader.readline()
+    if not line:
+        return 1, json.dumps({"ok": False, "error": "memstack daemon closed the connection"}) + "\n"
+    reply = json.loads(line)
+    if "decline" in reply:
+        return None  # the daemon cannot run it as this process would: nothing ran there
+    return reply["exit"], reply["output"]
 
 
 if __name__ == "__main__":
+    forwarded = forward(sys.argv[1:])
+    if forwarded is not None:
+        sys.stdout.write(forwarded[1])
+        sys.exit(forwarded[0])
+    sys.path.insert(0, HERE)
+    from memstack_db import main
     main()
@@ -0,0 +1,3765 @@
+#!/usr/bin/env python
+"""
+MemStack SQLite Memory Backend — repository module and CLI
+Repository pattern: skills call this script instead of raw file I/O, and
+in-process callers import MemStackDB from it (see "in-process API").
+
+Usage:
+    python db/memstack-db.py <command> [args...]
+
+Commands:
+    init                          Create the database / apply pending migrations
+    add-session   <json>          Add a session diary entry
+    add-insight   <json>          Add an insight/decision (near-duplicates merge)
+    search        <query> [opts]  Ranked full-text search (FTS5) across all tables
+    get-sessions  <project> [opts] Get recent sessions for a project (--raw: with markdown)
+    get-insights  <project> [opts] Get insights for a project (--tag T: only tagged)
+    tags          [--project P]   List insight tags by frequency
+    get-context   <project>       Get project context
+    set-context   <json>          Upsert project context
+    add-plan-task <json>          Add a task to a project plan
+    get-plan      <project>       Get all plan tasks for a project
+    update-task   <json>          Update a plan task status
+    export-md     <project> [--raw] Export project memory as markdown
+    stats         [--recount]     Show database statistics (--recount repairs drift)
+    ingest        <kind> [opts]   Bulk-load NDJSON sessions | insights | plan-tasks
+    bridge-drain  [--limit N]     Mirror queued insights into the skill loader
+    dedupe        [--dry-run]     Merge stored near-duplicate insights
+    archive       --older-than AGE Move old sessions/insights to memstack-archive.db
+    backup        [--vacuum]      Online snapshot to db/backups/ (checksummed, rotated)
+    serve         [--socket PATH] Run a warm daemon on a Unix socket
+    watch         [--no-vectors]  Sync memory/sessions and memory/plans as they change
+
+search, get-sessions and get-insights accept --limit, --after <next_cursor>
+(keyset paging), --fields a,b,c (column projection) and --ndjson (stream one
+row per line).
+
+search and get-insights take --tag (repeatable) to keep insights carrying
+that tag; tags are matched in normalized form (trimmed, lower-case, no '#').
+
+add-insight folds a near-duplicate (MinHash similarity at or above
+db.dedupe_threshold, same project and type) into the stored insight, bumping
+its seen_count; --on-duplicate reject refuses it, keep stores it anyway.
+
+search --mode hybrid|semantic also queries the echo skill's vector index and
+fuses it with the FTS ranking (reciprocal-rank fusion); lexical is the default.
+
+search and export-md also read memstack-archive.db when one exists (see
+archive); pass --hot-only to query the hot database alone.
+
+watch imports new and edited diaries (and re-embeds sessions and plans for
+the echo skill) a --debounce after they are saved, using inotify on Linux
+and stat polling elsewhere; only the changed files are read.
+
+While a daemon is serving (db/memstack.sock, or $MEMSTACK_SOCKET), every other
+command is forwarded to it instead of opening the database in this process.
+Set MEMSTACK_NO_DAEMON=1 to force in-process execution.
+
+Procedural insights (lesson, gotcha, pattern) are mirrored into the skill
+loader through an outbox: add-insight and ingest queue the mirror in the same
+transaction and return; the daemon's drain thread or a detached bridge-drain
+applies it. MEMSTACK_BRIDGE_DRAIN=inline|off changes the default (background).
+
+Writers wait busy_timeout for the lock (profile, db.pragmas in config.json, or
+MEMSTACK_BUSY_TIMEOUT_MS), then retry up to db.write_retries times with
+jittered backoff before reporting the lock as an error.
+
+MEMSTACK_SQLITE_PATH points every command at a database other than
+db/memstack.db (benchmarks, scratch copies). It is unrelated to
+MEMSTACK_DB_PATH, which redirects the skill-loader's store.
+"""
+
+import argparse
+import base64
+import contextlib
+import datetime
+import functools
+import io
+import json
+import os
+import random
+import re
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import zlib
+from pathlib import Path, PureWindowsPath
+
+DB_DIR = Path(__file__).parent
+DB_PATH = Path(os.environ.get("MEMSTACK_SQLITE_PATH") or DB_DIR / "memstack.db")
+SCHEMA_PATH = DB_DIR / "schema.sql"
+SOCKET_PATH = Path(os.environ.get("MEMSTACK_SOCKET") or DB_DIR / "memstack.sock")
+CONFIG_PATH = DB_DIR.parent / "config.json"
+
+
+def parse_json_arg(raw: str) -> dict:
+    """Parse JSON input with a clean error on failure."""
+    if isinstance(raw, dict):  # daemon requests carry the payload already decoded
+        return raw
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError as e:
+        print(json.dumps({"ok": False, "error": f"Invalid JSON input: {e}"}))
+        sys.exit(1)
+
+
+def missing_field(data: dict, *fields: str):
+    """Return the first required field absent (or null) in data, else None."""
+    for f in fields:
+        if f not in data or data[f] is None:
+            return f
+    return None
+
+
+def require_fields(data: dict, *fields: str) -> None:
+    """Validate required fields exist in data dict."""
+    f = missing_field(data, *fields)
+    if f is not None:
+        print(json.dumps({"ok": False, "error": f"Missing required field: {f}"}))
+        sys.exit(1)
+
+
+CANONICAL_TYPES = frozenset(
+    {"gotcha", "lesson", "pattern", "warning", "failed_approach", "decision", "architecture"}
+)
+
+# Variant spellings seen in real data, mapped to a canonical type. Canonicals map to
+# themselves; anything not listed passes through unchanged.
+TYPE_ALIASES = {t: t for t in CANONICAL_TYPES}
+TYPE_ALIASES.update(
+    {
+        "bug": "gotcha",
+        "bugfix": "gotcha",
+        "bug-fix": "gotcha",
+        "distribution-bug": "gotcha",
+        "debugging": "gotcha",
+        "prevention": "warning",
+        "correction": "gotcha",
+    }
+)
+
+
+def normalize_type(value: str) -> str:
+    """Map a type variant to its canonical form; unknown types pass through unchanged."""
+    if value is None:
+        return "decision"
+    stripped = str(value).strip()
+    if not stripped:
+        return "decision"
+    return TYPE_ALIASES.get(stripped.lower(), stripped)
+
+
+# Procedural insight types that mirror into the skill-loader's searchable memory.
+# architecture and decision are record, not procedure: bridging 1,000+ decisions
+# would drown FTS retrieval, so they are deliberately excluded.
+BRIDGED_TYPES = frozenset({"gotcha", "lesson", "pattern", "warning", "failed_approach"})
+
+
+def _known_project_dirs(memory_db, project) -> list:
+    """Directories the loader's store already associates with ``project``.
+
+    Prefers find_project_dirs_by_name, which distinguishes "never seen" (0) from
+    "collides with another project" (2+). Older loaders only have
+    resolve_project_dir_by_name, which collapses both to None — there we fall
+    back and simply cannot report ambiguity, which is no worse than before.
+    """
+    finder = getattr(memory_db, "find_project_dirs_by_name", None)
+    if finder is not None:
+        return list(finder(project))
+    single = memory_db.resolve_project_dir_by_name(project)
+    return [single] if single else []
+
+
+def resolve_project_dir(memory_db, project, cwd=None) -> dict:
+    """Decide which project_dir an insight belongs to, or why it cannot bridge.
+
+    Returns {"project_dir": path} on success (plus "autoregistered": path when
+    the project is entering the store for the first time), or {"reason": str}
+    describing exactly which of the three failure modes applied.
+
+    Auto-registration is deliberately gated on the CURRENT WORKING DIRECTORY
+    agreeing with the supplied name. The diary invokes this script from the
+    project root, so cwd is the project — but a name that does NOT match cwd is
+    almost always an ad-hoc label ("general", "test", "SnowTrack+LawnTrack")
+    rather than a real repo, and registering those would pollute cross-project
+    recall permanently. Requiring corroboration from the filesystem the process
+    is actually running in means a project cannot be typo'd into existence.
+
+    ``cwd`` overrides os.getcwd() for deferred bridging: the outbox records the
+    directory the diary ran in, and the drain must judge against that, not
+    against wherever the drain itself happens to run.
+    """
+    known = _known_project_dirs(memory_db, project)
+    if len(known) == 1:
+        return {"project_dir": known[0]}
+    if len(known) > 1:
+        return {
+            "reason": "ambiguous project {!r}: {} known paths ({}) — refusing "
+                      "to guess".format(project, len(known), ", ".join(known))
+        }
+
+    name = (project or "").strip()
+    if not name:
+        return {"reason": "unknown project: no project name supplied"}
+
+    if cwd is None:
+        try:
+            cwd = os.getcwd()
+        except OSError as exc:
+            return {"reason": f"unknown project {name!r}: cwd unavailable ({exc})"}
+
+    canonical = getattr(memory_db, "canonical_project_dir", None)
+    cwd = canonical(cwd) if canonical else cwd
+    cwd_name = PureWindowsPath(cwd).name
+
+    if cwd_name.lower() != name.lower():
+        return {
+            "reason": "unrecognized project {!r}: not in the memory store, and "
+                      "cwd basename is {!r} — not auto-registering".format(name, cwd_name)
+        }
+    return {"project_dir": cwd, "autoregistered": cwd}
+
+
+def _lesson_title(content) -> str:
+    """Derive a title (procedural_memory.title is NOT NULL; insights has none)."""
+    text = content or ""
+    idx = text.find(". ")
+    if idx != -1 and idx < 120:
+        title = text[:idx]
+    else:
+        title = text[:90]
+    title = title.strip()
+    if title.endswith("."):
+        title = title[:-1]
+    title = " ".join(title.split())
+    if len(title) > 90:
+        cut = title[:90]
+        if " " in cut:
+            cut = cut[:cut.rfind(" ")]
+        title = cut.rstrip() + "..."
+    if not title:
+        title = text[:60]
+    return title
+
+
+def _lesson_body(content, context) -> str:
+    """Content plus operative context (procedural_memory has no context col)."""
+    body = content or ""
+    if context and context.strip():
+        body = body + "\n\nContext: " + context.strip()
+    return body
+
+
+_TAG_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_tags(tags) -> list:
+    """'API, #deploy,, api ' -> ['api', 'deploy']: ordered, unique, lower-case.
+
+    The one tag form: insight_tags rows, --tag filters and the loader bridge
+    all go through here. A list of tags is accepted as well as a string.
+    """
+    parts = tags if isinstance(tags, (list, tuple)) else str(tags or "").split(",")
+    tag_list = []
+    for tag in parts:
+        tag = _TAG_SPACE_RE.sub(" ", str(tag)).strip().lstrip("#").strip().lower()
+        if tag and tag not in tag_list:
+            tag_list.append(tag)
+    return tag_list
+
+
+def _lesson_tags(tags):
+    """Comma-separated string -> normalized list; empty -> None."""
+    return normalize_tags(tags) or None
+
+
+def _import_loader():
+    """The loader's memory_db module, or (None, skip_reason) when bridging is off."""
+    # A redirected loader DB would auto-create and silently diverge. Skip.
+    if os.environ.get("MEMSTACK_DB_PATH"):
+        return None, "MEMSTACK_DB_PATH is set"
+    # Guarded import: a machine without the loader is a no-op, not an error.
+    try:
+        from memstack_skill_loader import memory_db
+    except Exception:
+        return None, None
+    return memory_db, None
+
+
+def _insert_lesson(memory_db, *args, idempotency_key=None, **kwargs):
+    """insert_lesson, passing idempotency_key only to loaders that accept it."""
+    if idempotency_key is not None:
+        try:
+            import inspect
+
+            params = inspect.signature(memory_db.insert_lesson).parameters
+        except (TypeError, ValueError):
+            params = {}
+        if "idempotency_key" in params or any(
+            p.kind is inspect.Parameter.VAR_KEYWORD for p in params.values()
+        ):
+            kwargs["idempotency_key"] = idempotency_key
+    return memory_db.insert_lesson(*args, **kwargs)
+
+
+def bridge_to_loader(project, type_value, content, context, tags, created_at,
+                     cwd=None, idempotency_key=None, resolutions=None) -> dict:
+    """Mirror a procedural insight into the skill-loader's memory.db; never raises.
+
+    ``resolutions`` is an optional {(project, cwd): resolution} cache shared
+    across calls, so a drain resolves each project once per batch.
+    """
+    try:
+        # 1. Procedural filter: only the five procedure types bridge.
+        if type_value not in BRIDGED_TYPES:
+            return {}
+        # 2-3. Redirected loader DB is skipped; a missing loader is a no-op.
+        memory_db, skip_reason = _import_loader()
+        if memory_db is None:
+            return {"bridge_skipped": skip_reason} if skip_reason else {}
+        # 4. Resolve the name against paths the store already knows.
+        #
+        # A name can fail for three different reasons, and they are NOT
+        # interchangeable — reporting all of them as "unknown project" sent a
+        # real investigation looking for a missing registration when the actual
+        # fault was a duplicate. Report each honestly, and auto-register only
+        # the one case where the filesystem corroborates the name.
+        key = (project, cwd)
+        if resolutions is not None and key in resolutions:
+            resolution = resolutions[key]
+        else:
+            resolution = resolve_project_dir(memory_db, project, cwd=cwd)
+            if resolutions is not None:
+                # Only the first row of a batch registers the project.
+                resolutions[key] = {k: v for k, v in resolution.items() if k != "autoregistered"}
+        project_dir = resolution.get("project_dir")
+        if project_dir is None:
+            return {"bridge_skipped": resolution["reason"]}
+        autoregistered = resolution.get("autoregistered")
+
+        # 5-7. Title, body (content + context) and tag list.
+        # 8-9. created_at passed through verbatim (keyword-only). None -> failure.
+        lesson_id = _insert_lesson(
+            memory_db,
+            _lesson_title(content),
+            _lesson_body(content, context),
+            type_value,
+            project_dir=project_dir,
+            stack_tags=_lesson_tags(tags),
+            created_at=created_at,
+            idempotency_key=idempotency_key,
+        )
+        if lesson_id is None:
+            return {"bridge_failed": True}
+        result = {"bridged": {"project_dir": project_dir, "lesson_id": lesson_id}}
+        if autoregistered:
+            # Surface it: the project just entered cross-project memory for the
+            # first time, and a wrong path here is worth noticing immediately.
+            result["project_autoregistered"] = autoregistered
+        return result
+    except Exception as exc:  # 10. Never raise into the diary save.
+        return {"bridge_error": str(exc)}
+
+
+# ── bridge outbox ─────────────────────────────────────────────────────────────
+#
+# add-insight no longer writes the loader's database before returning. A
+# procedural insight gets a bridge_outbox row in the SAME transaction as the
+# insight, and bridge-drain (or the daemon's drain thread) mirrors queued rows
+# later: one loader import and one project resolution per batch, with retry
+# and backoff when the loader store is down or locked. A row is claimed by
+# pushing next_attempt_at forward (a lease), so concurrent drains never pick up
+# the same row and a crashed drain's rows come back once the lease expires.
+
+OUTBOX_LEASE_SECONDS = 300
+OUTBOX_MAX_ATTEMPTS = 8
+
+
+def bridge_disabled_reason():
+    """None when bridging can run; otherwise (reason or "") why it cannot."""
+    # A redirected loader DB would auto-create and silently diverge.
+    if os.environ.get("MEMSTACK_DB_PATH"):
+        return "MEMSTACK_DB_PATH is set"
+    # No loader installed: a no-op, not an error (and nothing worth queuing).
+    import importlib.util
+
+    if importlib.util.find_spec("memstack_skill_loader") is None:
+        return ""
+    return None
+
+
+def outbox_key(insight_id, created_at) -> str:
+    """Idempotency key for one insight's mirror, stable across retries."""
+    return f"memstack-insight:{insight_id}:{created_at}"
+
+
+def enqueue_bridge(conn, insight_id, type_value, created_at):
+    """Queue one insight for mirroring inside the caller's transaction."""
+    if type_value not in BRIDGED_TYPES:
+        return None
+    cur = conn.execute(
+        "INSERT OR IGNORE INTO bridge_outbox (insight_id, idempotency_key, cwd) VALUES (?, ?, ?)",
+        (insight_id, outbox_key(insight_id, created_at), _safe_cwd()),
+    )
+    return cur.lastrowid if cur.rowcount else None
+
+
+def _safe_cwd():
+    if _client_cwd is not None:
+        return _client_cwd
+    try:
+        return os.getcwd()
+    except OSError:
+        return None
+
+
+def _retry_delay(attempts) -> float:
+    """Exponential backoff with jitter: ~30 s, 60 s, 2 min ... capped at 1 h."""
+    return min(3600.0, 30.0 * 2 ** max(0, attempts - 1)) * random.uniform(0.8, 1.2)
+
+
+def drain_outbox(conn, limit=200, max_attempts=OUTBOX_MAX_ATTEMPTS) -> dict:
+    """Mirror up to ``limit`` due outbox rows into the loader; never raises per row."""
+    summary = {"claimed": 0, "bridged": 0, "skipped": 0, "retrying": 0, "failed": 0}
+    reason = bridge_disabled_reason()
+    if reason is not None:
+        summary["bridge_disabled"] = reason or "memstack_skill_loader is not installed"
+        return summary
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute(
+            """SELECT o.id, o.insight_id, o.idempotency_key, o.cwd, o.attempts,
+                      i.project, i.type, i.content, i.context, i.tags, i.created_at
+               FROM bridge_outbox o LEFT JOIN insights i ON i.id = o.insight_id
+               WHERE o.status = 'pending' AND o.next_attempt_at <= datetime('now')
+               ORDER BY o.id LIMIT ?""",
+            (limit,),
+        ).fetchall()
+        conn.executemany(
+            """UPDATE bridge_outbox SET attempts = attempts + 1,
+               next_attempt_at = datetime('now', ?) WHERE id = ?""",
+            [(f"+{OUTBOX_LEASE_SECONDS} seconds", r["id"]) for r in rows],
+        )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    summary["claimed"] = len(rows)
+
+    resolutions = {}
+    for row in rows:
+        if row["content"] is None:
+            result = {"bridge_skipped": "insight no longer exists"}
+        else:
+            result = bridge_to_loader(
+                row["project"], row["type"], row["content"], row["context"], row["tags"],
+                row["created_at"], cwd=row["cwd"], idempotency_key=row["idempotency_key"],
+                resolutions=resolutions,
+            )
+        attempts = row["attempts"] + 1
+        if "bridged" in result:
+            status, summary["bridged"] = "done", summary["bridged"] + 1
+        elif "bridge_skipped" in result or not result:
+            status, summary["skipped"] = "skipped", summary["skipped"] + 1
+        elif attempts >= max_attempts:
+            status, summary["failed"] = "failed", summary["failed"] + 1
+        else:
+            status, summary["retrying"] = "pending", summary["retrying"] + 1
+        error = None if status in ("done", "skipped") else json.dumps(result)
+        # One commit per row: a mirror that landed is never retried because a
+        # later row in the batch failed.
+        conn.execute(
+            """UPDATE bridge_outbox SET status = ?, result = ?, last_error = ?,
+               next_attempt_at = datetime('now', ?), updated_at = datetime('now')
+               WHERE id = ?""",
+            (status, json.dumps(result) if status != "pending" else None, error,
+             f"+{_retry_delay(attempts):.0f} seconds", row["id"]),
+        )
+        conn.commit()
+    summary["pending"] = conn.execute(
+        "SELECT COUNT(*) FROM bridge_outbox WHERE status = 'pending'"
+    ).fetchone()[0]
+    return summary
+
+
+def _spawn_background_drain(path=None):
+    """Start a detached `bridge-drain` so the diary save does not wait on it."""
+    import subprocess
+
+    kwargs = {"stdin": subprocess.DEVNULL, "stdout": subprocess.DEVNULL,
+              "stderr": subprocess.DEVNULL, "close_fds": True}
+    if path is not None:
+        kwargs["env"] = dict(os.environ, MEMSTACK_SQLITE_PATH=str(path))
+    if os.name == "nt":
+        kwargs["creationflags"] = (subprocess.DETACHED_PROCESS
+                                   | subprocess.CREATE_NEW_PROCESS_GROUP)
+    else:
+        kwargs["start_new_session"] = True
+    try:
+        subprocess.Popen([sys.executable, str(Path(__file__).resolve()), "bridge-drain"], **kwargs)
+        return True
+    except OSError:
+        return False
+
+
+def kick_drain(path=None) -> dict:
+    """After queuing: wake the daemon's drainer, or honour MEMSTACK_BRIDGE_DRAIN.
+
+    background (default) spawns a detached drain; inline drains before
+    returning (the old synchronous cost, for scripts that need the mirror
+    immediately); off leaves the queue to a timer or the daemon.
+    """
+    if _drain_wakeup is not None:
+        _drain_wakeup.set()
+        return {}
+    mode = os.environ.get("MEMSTACK_BRIDGE_DRAIN", "background").strip().lower()
+    if mode == "inline":
+        conn = get_db(path=path)
+        try:
+            return {"bridge_drain": drain_outbox(conn)}
+        except sqlite3.OperationalError as exc:
+            # The insight is committed; the queued row waits for the next drain.
+            return {"bridge_drain": f"deferred: {exc}"}
+        finally:
+            conn.close()
+    if mode == "background" and not _spawn_background_drain(path):
+        return {"bridge_drain": "could not start background drain; run bridge-drain"}
+    return {}
+
+
+# ── schema migrations ─────────────────────────────────────────────────────────
+#
+# Numbered steps, each applied exactly once inside its own BEGIN IMMEDIATE
+# transaction together with its schema_version row, so a crash mid-step leaves
+# nothing half-applied and two processes racing to migrate cannot both run a
+# step. Version 1 is schema.sql itself. PRAGMA user_version mirrors the latest
+# applied step so the common "already current" case costs one header read.
+#
+# Steps are append-only: never edit one that has shipped, add a new number.
+
+MIGRATION_2_FTS = """
+CREATE VIRTUAL TABLE IF NOT EXISTS sessions_fts USING fts5(
+    accomplished, decisions, commits, next_steps, problems,
+    content='sessions', content_rowid='id', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS sessions_fts_ai AFTER INSERT ON sessions BEGIN
+    INSERT INTO sessions_fts (rowid, accomplished, decisions, commits, next_steps, problems)
+    VALUES (new.id, new.accomplished, new.decisions, new.commits, new.next_steps, new.problems);
+END;
+CREATE TRIGGER IF NOT EXISTS sessions_fts_ad AFTER DELETE ON sessions BEGIN
+    INSERT INTO sessions_fts (sessions_fts, rowid, accomplished, decisions, commits, next_steps, problems)
+    VALUES ('delete', old.id, old.accomplished, old.decisions, old.commits, old.next_steps, old.problems);
+END;
+CREATE TRIGGER IF NOT EXISTS sessions_fts_au
+AFTER UPDATE OF accomplished, decisions, commits, next_steps, problems ON sessions BEGIN
+    INSERT INTO sessions_fts (sessions_fts, rowid, accomplished, decisions, commits, next_steps, problems)
+    VALUES ('delete', old.id, old.accomplished, old.decisions, old.commits, old.next_steps, old.problems);
+    INSERT INTO sessions_fts (rowid, accomplished, decisions, commits, next_steps, problems)
+    VALUES (new.id, new.accomplished, new.decisions, new.commits, new.next_steps, new.problems);
+END;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS insights_fts USING fts5(
+    content, context, tags,
+    content='insights', content_rowid='id', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS insights_fts_ai AFTER INSERT ON insights BEGIN
+    INSERT INTO insights_fts (rowid, content, context, tags)
+    VALUES (new.id, new.content, new.context, new.tags);
+END;
+CREATE TRIGGER IF NOT EXISTS insights_fts_ad AFTER DELETE ON insights BEGIN
+    INSERT INTO insights_fts (insights_fts, rowid, content, context, tags)
+    VALUES ('delete', old.id, old.content, old.context, old.tags);
+END;
+CREATE TRIGGER IF NOT EXISTS insights_fts_au
+AFTER UPDATE OF content, context, tags ON insights BEGIN
+    INSERT INTO insights_fts (insights_fts, rowid, content, context, tags)
+    VALUES ('delete', old.id, old.content, old.context, old.tags);
+    INSERT INTO insights_fts (rowid, content, context, tags)
+    VALUES (new.id, new.content, new.context, new.tags);
+END;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS project_context_fts USING fts5(
+    architecture_decisions, known_issues, backlog,
+    content='project_context', content_rowid='id', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS project_context_fts_ai AFTER INSERT ON project_context BEGIN
+    INSERT INTO project_context_fts (rowid, architecture_decisions, known_issues, backlog)
+    VALUES (new.id, new.architecture_decisions, new.known_issues, new.backlog);
+END;
+CREATE TRIGGER IF NOT EXISTS project_context_fts_ad AFTER DELETE ON project_context BEGIN
+    INSERT INTO project_context_fts (project_context_fts, rowid, architecture_decisions, known_issues, backlog)
+    VALUES ('delete', old.id, old.architecture_decisions, old.known_issues, old.backlog);
+END;
+CREATE TRIGGER IF NOT EXISTS project_context_fts_au
+AFTER UPDATE OF architecture_decisions, known_issues, backlog ON project_context BEGIN
+    INSERT INTO project_context_fts (project_context_fts, rowid, architecture_decisions, known_issues, backlog)
+    VALUES ('delete', old.id, old.architecture_decisions, old.known_issues, old.backlog);
+    INSERT INTO project_context_fts (rowid, architecture_decisions, known_issues, backlog)
+    VALUES (new.id, new.architecture_decisions, new.known_issues, new.backlog);
+END;
+
+-- 'rebuild' re-reads the content tables, so pre-existing rows become searchable.
+INSERT INTO sessions_fts (sessions_fts) VALUES ('rebuild');
+INSERT INTO insights_fts (insights_fts) VALUES ('rebuild');
+INSERT INTO project_context_fts (project_context_fts) VALUES ('rebuild');
+"""
+
+# Hot queries filter on project and order by date / created_at. Composite
+# indexes serve both, and scanned backwards they also yield id DESC on ties,
+# so the ORDER BY ... DESC, id DESC queries never sort in a temp B-tree. They
+# cover the per-project GROUP BY in stats and make the single-column project
+# indexes redundant.
+MIGRATION_3_COMPOSITE_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_sessions_project_date ON sessions(project, date);
+CREATE INDEX IF NOT EXISTS idx_insights_project_created ON insights(project, created_at);
+DROP INDEX IF EXISTS idx_sessions_project;
+DROP INDEX IF EXISTS idx_insights_project;
+"""
+
+
+def _split_sql(script):
+    """Yield the complete statements of a script, trigger bodies included."""
+    buf = ""
+    for line in script.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            yield buf.strip()
+            buf = ""
+
+
+def _migration_1_baseline(conn):
+    """schema.sql, minus its connection PRAGMAs (get_db owns those)."""
+    for statement in _split_sql(SCHEMA_PATH.read_text()):
+        if not statement.upper().lstrip().startswith("PRAGMA"):
+            conn.execute(statement)
+
+
+MIGRATION_4_BRIDGE_OUTBOX = """
+CREATE TABLE IF NOT EXISTS bridge_outbox (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    insight_id      INTEGER NOT NULL UNIQUE,
+    idempotency_key TEXT    NOT NULL UNIQUE,
+    cwd             TEXT,                            -- where the diary ran: auto-registration evidence
+    status          TEXT    NOT NULL DEFAULT 'pending', -- pending, done, skipped, failed
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TEXT    NOT NULL DEFAULT (datetime('now')),
+    last_error      TEXT,
+    result          TEXT,                            -- JSON bridge outcome once settled
+    created_at      TEXT    DEFAULT (datetime('now')),
+    updated_at      TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_bridge_outbox_due ON bridge_outbox(status, next_attempt_at);
+"""
+
+# stats_counters: one row per project ('' holds global, NULL-project insights),
+# kept current by triggers so `stats` reads O(projects) rows instead of
+# scanning every table. Deletes cannot un-max a timestamp; `stats --recount`
+# rebuilds from STATS_RECOUNT_SELECT and reports any drift.
+STATS_RECOUNT_SELECT = """
+WITH s AS (SELECT project, COUNT(*) AS n, MAX(date) AS d, MAX(created_at) AS a
+           FROM sessions GROUP BY project),
+     i AS (SELECT COALESCE(project, '') AS project, COUNT(*) AS n, MAX(created_at) AS a
+           FROM insights GROUP BY 1),
+     p AS (SELECT project, COUNT(*) AS n, SUM(status IS NOT 'completed') AS o,
+                  MAX(updated_at) AS a
+           FROM plans GROUP BY project),
+     k AS (SELECT project FROM s UNION SELECT project FROM i UNION SELECT project FROM p)
+SELECT k.project, COALESCE(s.n, 0), COALESCE(i.n, 0), COALESCE(p.n, 0), COALESCE(p.o, 0),
+       s.d, NULLIF(MAX(COALESCE(s.a, ''), COALESCE(i.a, ''), COALESCE(p.a, '')), '')
+FROM k LEFT JOIN s USING (project) LEFT JOIN i USING (project) LEFT JOIN p USING (project)
+"""
+
+STATS_COUNTER_COLUMNS = ("project", "sessions", "insights", "plan_tasks", "open_tasks",
+                         "last_session_date", "last_activity")
+
+
+def _stats_bump(project, column, delta, date="NULL", activity="NULL", open_delta="0"):
+    """One trigger statement: add ``delta`` to ``column`` for ``project``."""
+    return f"""
+    INSERT INTO stats_counters (project, {column}, open_tasks, last_session_date, last_activity)
+    VALUES ({project}, {delta}, {open_delta}, {date}, {activity})
+    ON CONFLICT (project) DO UPDATE SET
+        {column} = {column} + excluded.{column},
+        open_tasks = open_tasks + excluded.open_tasks,
+        last_session_date = COALESCE(MAX(last_session_date, excluded.last_session_date),
+                                     last_session_date, excluded.last_session_date),
+        last_activity = COALESCE(MAX(last_activity, excluded.last_activity),
+                                 last_activity, excluded.last_activity);"""
+
+
+_OPEN = "({}.status IS NOT 'completed')"
+
+MIGRATION_5_STATS_COUNTERS = f"""
+CREATE TABLE IF NOT EXISTS stats_counters (
+    project           TEXT    PRIMARY KEY,
+    sessions          INTEGER NOT NULL DEFAULT 0,
+    insights          INTEGER NOT NULL DEFAULT 0,
+    plan_tasks        INTEGER NOT NULL DEFAULT 0,
+    open_tasks        INTEGER NOT NULL DEFAULT 0,
+    last_session_date TEXT,
+    last_activity     TEXT
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS stats_sessions_ai AFTER INSERT ON sessions BEGIN
+    {_stats_bump("NEW.project", "sessions", 1, "NEW.date", "NEW.created_at")}
+END;
+CREATE TRIGGER IF NOT EXISTS stats_sessions_ad AFTER DELETE ON sessions BEGIN
+    {_stats_bump("OLD.project", "sessions", -1)}
+END;
+CREATE TRIGGER IF NOT EXISTS stats_sessions_au AFTER UPDATE OF project, date ON sessions BEGIN
+    {_stats_bump("OLD.project", "sessions", -1)}
+    {_stats_bump("NEW.project", "sessions", 1, "NEW.date")}
+END;
+
+CREATE TRIGGER IF NOT EXISTS stats_insights_ai AFTER INSERT ON insights BEGIN
+    {_stats_bump("COALESCE(NEW.project, '')", "insights", 1, activity="NEW.created_at")}
+END;
+CREATE TRIGGER IF NOT EXISTS stats_insights_ad AFTER DELETE ON insights BEGIN
+    {_stats_bump("COALESCE(OLD.project, '')", "insights", -1)}
+END;
+CREATE TRIGGER IF NOT EXISTS stats_insights_au AFTER UPDATE OF project ON insights BEGIN
+    {_stats_bump("COALESCE(OLD.project, '')", "insights", -1)}
+    {_stats_bump("COALESCE(NEW.project, '')", "insights", 1)}
+END;
+
+CREATE TRIGGER IF NOT EXISTS stats_plans_ai AFTER INSERT ON plans BEGIN
+    {_stats_bump("NEW.project", "plan_tasks", 1, activity="NEW.updated_at",
+                 open_delta=_OPEN.format("NEW"))}
+END;
+CREATE TRIGGER IF NOT EXISTS stats_plans_ad AFTER DELETE ON plans BEGIN
+    {_stats_bump("OLD.project", "plan_tasks", -1, open_delta="-" + _OPEN.format("OLD"))}
+END;
+CREATE TRIGGER IF NOT EXISTS stats_plans_au AFTER UPDATE ON plans BEGIN
+    {_stats_bump("OLD.project", "plan_tasks", -1, open_delta="-" + _OPEN.format("OLD"))}
+    {_stats_bump("NEW.project", "plan_tasks", 1, activity="NEW.updated_at",
+                 open_delta=_OPEN.format("NEW"))}
+END;
+
+INSERT OR REPLACE INTO stats_counters ({", ".join(STATS_COUNTER_COLUMNS)})
+{STATS_RECOUNT_SELECT};
+"""
+
+# raw_markdown lives in raw_blobs, zlib-compressed and keyed by the SHA-256 of
+# the text; sessions keep only raw_hash. Re-imported or repeated diaries share
+# one blob, and queries that never read the original text no longer drag it
+# through the page cache. The blob goes when its last session does.
+MIGRATION_6_RAW_BLOBS = """
+CREATE TABLE IF NOT EXISTS raw_blobs (
+    hash        TEXT    PRIMARY KEY,             -- sha256 hex of the uncompressed text
+    codec       TEXT    NOT NULL,                -- zlib, or none when compression did not pay
+    size        INTEGER NOT NULL,                -- uncompressed bytes
+    data        BLOB    NOT NULL
+);
+ALTER TABLE sessions ADD COLUMN raw_hash TEXT;
+CREATE INDEX IF NOT EXISTS idx_sessions_raw_hash ON sessions(raw_hash) WHERE raw_hash IS NOT NULL;
+
+CREATE TRIGGER IF NOT EXISTS raw_blobs_gc_ad AFTER DELETE ON sessions
+WHEN OLD.raw_hash IS NOT NULL BEGIN
+    DELETE FROM raw_blobs WHERE hash = OLD.raw_hash
+        AND NOT EXISTS (SELECT 1 FROM sessions WHERE raw_hash = OLD.raw_hash);
+END;
+CREATE TRIGGER IF NOT EXISTS raw_blobs_gc_au AFTER UPDATE OF raw_hash ON sessions
+WHEN OLD.raw_hash IS NOT NULL AND OLD.raw_hash IS NOT NEW.raw_hash BEGIN
+    DELETE FROM raw_blobs WHERE hash = OLD.raw_hash
+        AND NOT EXISTS (SELECT 1 FROM sessions WHERE raw_hash = OLD.raw_hash);
+END;
+"""
+
+
+def _migration_6_raw_blobs(conn):
+    """Create raw_blobs, then move every inline raw_markdown into it in batches."""
+    for statement in _split_sql(MIGRATION_6_RAW_BLOBS):
+        conn.execute(statement)
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, raw_markdown FROM sessions WHERE id > ? AND raw_markdown IS NOT NULL "
+            "ORDER BY id LIMIT 500",
+            (last_id,),
+        ).fetchall()
+        if not rows:
+            break
+        packed = [(row[0], pack_raw(row[1])) for row in rows]
+        conn.executemany(RAW_BLOB_INSERT_SQL, [blob for _, blob in packed if blob["raw_hash"]])
+        conn.executemany(
+            "UPDATE sessions SET raw_hash = ?, raw_markdown = NULL WHERE id = ?",
+            [(blob["raw_hash"], row_id) for row_id, blob in packed],
+        )
+        last_id = rows[-1][0]
+
+
+# One counter bumped by every write to the tables behind the cached commands
+# (get-context, get-plan, get-insights). PRAGMA data_version only reports
+# changes made by *other* connections to the one asking, and the header change
+# counter is not maintained per transaction in WAL mode, so neither can
+# validate an entry persisted across processes; a trigger-maintained
+# generation can. Session writes do not touch it.
+CACHED_TABLES = ("insights", "plans", "project_context")
+
+MIGRATION_7_CACHE_GENERATION = """
+CREATE TABLE IF NOT EXISTS cache_generation (
+    id          INTEGER PRIMARY KEY CHECK (id = 1),
+    value       INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_generation (id, value) VALUES (1, 0);
+""" + "".join(
+    f"""
+CREATE TRIGGER IF NOT EXISTS cache_gen_{table}_{suffix} AFTER {event} ON {table} BEGIN
+    UPDATE cache_generation SET value = value + 1 WHERE id = 1;
+END;"""
+    for table in CACHED_TABLES
+    for suffix, event in (("ai", "INSERT"), ("ad", "DELETE"), ("au", "UPDATE"))
+)
+
+# insights.tags stays the comma-separated string the caller wrote; insight_tags
+# holds one normalize_tags() row per (tag, insight) so a tag filter is an index
+# probe instead of LIKE '%api%' (which also matches "rapid"). Rows are written
+# by index_insight_tags() next to the insight, and leave with it by trigger.
+MIGRATION_8_INSIGHT_TAGS = """
+CREATE TABLE IF NOT EXISTS insight_tags (
+    tag         TEXT    NOT NULL,
+    insight_id  INTEGER NOT NULL,
+    PRIMARY KEY (tag, insight_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_insight_tags_insight ON insight_tags(insight_id);
+
+CREATE TRIGGER IF NOT EXISTS insight_tags_ad AFTER DELETE ON insights BEGIN
+    DELETE FROM insight_tags WHERE insight_id = OLD.id;
+END;
+"""
+
+
+def index_insight_tags(conn, rows) -> int:
+    """Write insight_tags for (insight id, tags string) pairs; returns rows added."""
+    pairs = [(tag, insight_id) for insight_id, tags in rows for tag in normalize_tags(tags)]
+    if not pairs:
+        return 0
+    return conn.executemany(
+        "INSERT OR IGNORE INTO insight_tags (tag, insight_id) VALUES (?, ?)", pairs
+    ).rowcount
+
+
+def _migration_8_insight_tags(conn):
+    """Create insight_tags, then backfill it from every insight's tags string."""
+    for statement in _split_sql(MIGRATION_8_INSIGHT_TAGS):
+        conn.execute(statement)
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, tags FROM insights WHERE id > ? ORDER BY id LIMIT 500", (last_id,)
+        ).fetchall()
+        if not rows:
+            break
+        index_insight_tags(conn, [tuple(row) for row in rows])
+        last_id = rows[-1][0]
+
+
+# Near-duplicate detection (see "near-duplicate insights"): how often an insight
+# was recorded, its MinHash signature, and the banded LSH index over it.
+MIGRATION_9_INSIGHT_MINHASH = """
+ALTER TABLE insights ADD COLUMN seen_count INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE insights ADD COLUMN last_seen TEXT;
+
+CREATE TABLE IF NOT EXISTS insight_minhash (
+    insight_id  INTEGER PRIMARY KEY,
+    signature   BLOB    NOT NULL              -- MINHASH_SIZE little-endian uint32 minima
+);
+CREATE TABLE IF NOT EXISTS insight_lsh (
+    band        INTEGER NOT NULL,
+    bucket      INTEGER NOT NULL,             -- 64-bit hash of the band's minima
+    insight_id  INTEGER NOT NULL,
+    PRIMARY KEY (band, bucket, insight_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_insight_lsh_insight ON insight_lsh(insight_id);
+
+CREATE TRIGGER IF NOT EXISTS insight_minhash_ad AFTER DELETE ON insights BEGIN
+    DELETE FROM insight_minhash WHERE insight_id = OLD.id;
+    DELETE FROM insight_lsh WHERE insight_id = OLD.id;
+END;
+"""
+
+
+def _migration_9_insight_minhash(conn):
+    """Add the dedupe columns and index, then sign every existing insight."""
+    for statement in _split_sql(MIGRATION_9_INSIGHT_MINHASH):
+        conn.execute(statement)
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, content FROM insights WHERE id > ? ORDER BY id LIMIT 500", (last_id,)
+        ).fetchall()
+        if not rows:
+            break
+        index_insight_signatures(conn, [tuple(row) for row in rows])
+        last_id = rows[-1][0]
+
+
+# Sessions imported from the markdown diaries (db/migrate.py) record their file,
+# relative to memory/, in source. One diary is one session, so imported rows
+# are unique per (project, date) and a re-import is INSERT OR IGNORE against
+# this key. Sessions written by add-session have no source and may share a day.
+MIGRATION_10_SESSION_SOURCE = """
+ALTER TABLE sessions ADD COLUMN source TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_sessions_source_key ON sessions(project, date)
+    WHERE source IS NOT NULL;
+"""
+
+# db/migrate.py's record of each diary file it has read (path relative to
+# memory/, as in sessions.source). A re-run stats every file and only opens
+# the ones whose size or mtime no longer match; hash tells a touched file
+# from an edited one.
+MIGRATION_11_IMPORT_MANIFEST = """
+CREATE TABLE IF NOT EXISTS import_manifest (
+    path        TEXT    PRIMARY KEY,
+    size        INTEGER NOT NULL,
+    mtime_ns    INTEGER NOT NULL,
+    hash        TEXT    NOT NULL,             -- sha256 hex of the file bytes
+    imported_at TEXT    NOT NULL DEFAULT (datetime('now'))
+);
+"""
+
+
+MIGRATIONS = [
+    (1, "baseline schema (schema.sql)", _migration_1_baseline),
+    (2, "FTS5 search indexes", MIGRATION_2_FTS),
+    (3, "composite (project, date/created_at) indexes", MIGRATION_3_COMPOSITE_INDEXES),
+    (4, "bridge outbox", MIGRATION_4_BRIDGE_OUTBOX),
+    (5, "trigger-maintained stats counters", MIGRATION_5_STATS_COUNTERS),
+    (6, "compressed, content-addressed raw_markdown", _migration_6_raw_blobs),
+    (7, "result-cache generation counter", MIGRATION_7_CACHE_GENERATION),
+    (8, "normalized insight tag index", _migration_8_insight_tags),
+    (9, "near-duplicate insight signatures", _migration_9_insight_minhash),
+    (10, "imported session source key", MIGRATION_10_SESSION_SOURCE),
+    (11, "markdown import manifest", MIGRATION_11_IMPORT_MANIFEST),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version_of(conn) -> int:
+    """Highest version recorded in schema_version; 0 for an empty file."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+    ).fetchone()
+    if not exists:
+        return 0
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate_schema(conn) -> list:
+    """Apply pending migrations in order; return the versions applied this call."""
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return []
+    applied = []
+    current = schema_version_of(conn)
+    for version, _description, step in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-check under the write lock: another process may have won the race.
+            if version <= schema_version_of(conn):
+                conn.rollback()
+                continue
+            if callable(step):
+                step(conn)
+            else:
+                for statement in _split_sql(step):
+                    conn.execute(statement)
+            conn.execute("INSERT OR IGNORE INTO schema_version (version) VALUES (?)", (version,))
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        applied.append(version)
+    if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return applied
+
+
+# Set by `serve`: the MemStackDB every request shares, so a request skips
+# connect, pragmas and the migration check, and sqlite3's per-connection
+# statement cache keeps the hot queries prepared.
+_shared_db = None
+# Also set by `serve`: add-insight sets it to wake the daemon's drain thread.
+_drain_wakeup = None
+# Set per daemon request: the client's working directory, which the bridge
+# outbox records in place of the daemon's own.
+_client_cwd = None
+
+
+# ── connection profiles ───────────────────────────────────────────────────────
+#
+# Per-connection PRAGMAs. journal_mode is not among them: WAL is persistent in
+# the file, so it is set once when the database is created, not on every open.
+# Pick a profile with MEMSTACK_DB_PROFILE or config.json {"db": {"profile": ...}};
+# config.json {"db": {"pragmas": {...}}} overrides individual values on top.
+
+CONNECTION_PROFILES = {
+    "safe": {
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+    },
+    "balanced": {
+        "synchronous": "NORMAL",      # WAL + NORMAL: durable across app crashes, cheap commits
+        "mmap_size": 64 * 1024 * 1024,
+        "cache_size": -16000,         # KiB when negative: ~16 MB page cache
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+    "fast": {
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64000,
+        "temp_store": "MEMORY",
+        "busy_timeout": 10000,
+    },
+}
+DEFAULT_PROFILE = "balanced"
+_PRAGMA_VALUE_RE = re.compile(r"^(-?\d+|[A-Za-z]+)$")
+_pragmas = None
+
+
+def _db_config() -> dict:
+    """The "db" section of config.json ({} when absent or unreadable)."""
+    try:
+        return json.loads(CONFIG_PATH.read_text(encoding="utf-8")).get("db") or {}
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+def connection_pragmas() -> dict:
+    """Resolve the active profile plus overrides, once per process."""
+    global _pragmas
+    if _pragmas is not None:
+        return _pragmas
+    db_config = _db_config()
+    name = os.environ.get("MEMSTACK_DB_PROFILE") or db_config.get("profile") or DEFAULT_PROFILE
+    if name not in CONNECTION_PROFILES:
+        raise ValueError(
+            f"Unknown connection profile {name!r}; choose one of {sorted(CONNECTION_PROFILES)}"
+        )
+    pragmas = dict(CONNECTION_PROFILES[name])
+    pragmas.update(db_config.get("pragmas") or {})
+    if os.environ.get("MEMSTACK_BUSY_TIMEOUT_MS"):
+        pragmas["busy_timeout"] = os.environ["MEMSTACK_BUSY_TIMEOUT_MS"].strip()
+    for key, value in pragmas.items():
+        # Values are interpolated into PRAGMA statements: accept only
+        # identifiers and integers.
+        if not key.isidentifier() or not _PRAGMA_VALUE_RE.match(str(value)):
+            raise ValueError(f"Invalid pragma override {key}={value!r}")
+    _pragmas = pragmas
+    return _pragmas
+
+
+def _apply_pragmas(conn, readonly=False):
+    for key, value in connection_pragmas().items():
+        if readonly and key == "synchronous":
+            continue  # meaningless without writes
+        conn.execute(f"PRAGMA {key} = {value}")
+
+
+def _open_readonly(path, **connect_kwargs):
+    """A mode=ro connection, or None when the file is missing or needs migrating."""
+    if not path.exists():
+        return None
+    conn = sqlite3.connect(path.resolve().as_uri() + "?mode=ro", uri=True, **connect_kwargs)
+    if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        conn.close()  # a read-write open will migrate it first
+        return None
+    conn.row_factory = sqlite3.Row
+    _apply_pragmas(conn, readonly=True)
+    return conn
+
+
+def get_db(readonly=False, migrate=True, path=None, **connect_kwargs):
+    """Get database connection, initializing schema if needed.
+
+    readonly=True opens the file with mode=ro, so pure reads never take a write
+    lock or contend with writers; it falls back to a read-write open when the
+    database does not exist yet or has migrations pending. path defaults to
+    DB_PATH.
+    """
+    path = Path(path) if path else DB_PATH
+    if readonly:
+        conn = _open_readonly(path, **connect_kwargs)
+        if conn is not None:
+            return conn
+    is_new = not path.exists()
+    conn = sqlite3.connect(str(path), **connect_kwargs)
+    conn.row_factory = sqlite3.Row
+    if is_new:
+        conn.execute("PRAGMA journal_mode = WAL")
+    _apply_pragmas(conn)
+    conn.execute("PRAGMA foreign_keys = ON")
+    if migrate:
+        migrate_schema(conn)
+    return conn
+
+
+# ── concurrent writers ────────────────────────────────────────────────────────
+#
+# Several sessions on one machine write the same file. busy_timeout (profile,
+# db.pragmas or MEMSTACK_BUSY_TIMEOUT_MS) makes a writer wait for the lock
+# inside SQLite; write commands take it up front with BEGIN IMMEDIATE, so a
+# transaction never fails half-way when a read upgrades to a write; and
+# if the wait still runs out, the whole command is retried a bounded number of
+# times with jittered exponential backoff (db.write_retries, db.retry_base_ms).
+# Commands print only after they commit, so a retry never repeats output.
+
+DEFAULT_WRITE_RETRIES = 5
+DEFAULT_RETRY_BASE_MS = 50
+lock_retries = 0  # retries taken by this process (read by the stress harness)
+
+
+def _retry_policy():
+    config = _db_config()
+    try:
+        retries = max(0, int(config.get("write_retries", DEFAULT_WRITE_RETRIES)))
+        base_ms = max(1, int(config.get("retry_base_ms", DEFAULT_RETRY_BASE_MS)))
+    except (TypeError, ValueError):
+        retries, base_ms = DEFAULT_WRITE_RETRIES, DEFAULT_RETRY_BASE_MS
+    return retries, base_ms / 1000.0
+
+
+def is_lock_error(exc) -> bool:
+    message = str(exc).lower()
+    return isinstance(exc, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+
+@contextlib.contextmanager
+def write_transaction(conn):
+    """BEGIN IMMEDIATE ... COMMIT, rolled back on any error."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def call_with_lock_retry(fn):
+    """Call fn(), re-running it while the database stays locked past busy_timeout.
+
+    The last lock error is re-raised with the retry count appended.
+    """
+    global lock_retries
+    retries, base = _retry_policy()
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except sqlite3.OperationalError as exc:
+            if not is_lock_error(exc):
+                raise
+            if attempt == retries:
+                raise sqlite3.OperationalError(
+                    f"{exc} (gave up after {retries} retries)") from exc
+            lock_retries += 1
+            time.sleep(min(2.0, base * 2 ** attempt) * random.uniform(0.5, 1.5))
+
+
+def retry_on_lock(handler):
+    """Re-run a write command when the database stays locked past busy_timeout."""
+    @functools.wraps(handler)
+    def wrapper(args):
+        try:
+            return call_with_lock_retry(lambda: handler(args))
+        except sqlite3.OperationalError as exc:
+            if not is_lock_error(exc):
+                raise
+            print(json.dumps({"ok": False, "error": str(exc)}))
+            sys.exit(1)
+    return wrapper
+
+
+def cmd_init(_args):
+    """Create the database or bring its schema up to date."""
+    conn = get_db(migrate=False)
+    conn.execute("PRAGMA journal_mode = WAL")
+    applied = migrate_schema(conn)
+    version = schema_version_of(conn)
+    conn.close()
+    print(json.dumps({"ok": True, "db": str(DB_PATH), "schema_version": version,
+                      "migrated": applied}))
+
+
+SESSION_INSERT_SQL = """INSERT INTO sessions (project, date, accomplished, files_changed, commits,
+    decisions, problems, next_steps, duration, raw_hash)
+    VALUES (:project, :date, :accomplished, :files_changed, :commits,
+    :decisions, :problems, :next_steps, :duration, :raw_hash)"""
+
+RAW_BLOB_INSERT_SQL = """INSERT OR IGNORE INTO raw_blobs (hash, codec, size, data)
+    SELECT :raw_hash, :raw_codec, :raw_size, :raw_data WHERE :raw_hash IS NOT NULL"""
+
+# A session write is both statements, blob first, run with the same params.
+SESSION_WRITE_SQL = (RAW_BLOB_INSERT_SQL, SESSION_INSERT_SQL)
+
+INSIGHT_INSERT_SQL = """INSERT INTO insights (project, type, content, context, tags)
+    VALUES (:project, :type, :content, :context, :tags)"""
+
+PLAN_TASK_UPSERT_SQL = """INSERT INTO plans (project, task_number, description, status, blocked_reason)
+    VALUES (:project, :task_number, :description, :status, :blocked_reason)
+    ON CONFLICT(project, task_number) DO UPDATE SET
+    description = :description, status = :status,
+    blocked_reason = :blocked_reason, updated_at = datetime('now')"""
+
+
+def session_params(data: dict) -> dict:
+    return {
+        "project": data["project"],
+        "date": data.get("date", ""),
+        "accomplished": data.get("accomplished", ""),
+        "files_changed": data.get("files_changed", ""),
+        "commits": data.get("commits", ""),
+        "decisions": data.get("decisions", ""),
+        "problems": data.get("problems", ""),
+        "next_steps": data.get("next_steps", ""),
+        "duration": data.get("duration", ""),
+        **pack_raw(data.get("raw_markdown")),
+    }
+
+
+def pack_raw(text) -> dict:
+    """raw_blobs params for one raw_markdown; all None when there is no text."""
+    import hashlib
+
+    if not text:
+        return {"raw_hash": None, "raw_codec": None, "raw_size": None, "raw_data": None}
+    encoded = text.encode("utf-8")
+    data, codec = zlib.compress(encoded, 6), "zlib"
+    if len(data) >= len(encoded):
+        data, codec = encoded, "none"
+    return {"raw_hash": hashlib.sha256(encoded).hexdigest(), "raw_codec": codec,
+            "raw_size": len(encoded), "raw_data": data}
+
+
+def unpack_raw(codec, data):
+    """The original raw_markdown from a raw_blobs row (None when absent)."""
+    if data is None:
+        return None
+    if codec == "zlib":
+        data = zlib.decompress(data)
+    return bytes(data).decode("utf-8")
+
+
+RAW_JOIN = "LEFT JOIN {db}raw_blobs b ON b.hash = s.raw_hash"
+
+
+def _raw_field(row) -> dict:
+    return {"raw_markdown": unpack_raw(row["codec"], row["data"])}
+
+
+def insight_params(data: dict) -> dict:
+    return {
+        "project": data.get("project"),
+        "type": normalize_type(data.get("type")),
+        "content": data["content"],
+        "context": data.get("context", ""),
+        "tags": data.get("tags", ""),
+    }
+
+
+def plan_task_params(data: dict) -> dict:
+    return {
+        "project": data["project"],
+        "task_number": data["task_number"],
+        "description": data["description"],
+        "status": data.get("status", "pending"),
+        "blocked_reason": data.get("blocked_reason"),
+    }
+
+
+@retry_on_lock
+def cmd_add_session(args):
+    """Add a session diary entry."""
+    data = parse_json_arg(args.json)
+    require_fields(data, "project")
+    with _database() as db:
+        row_id = db.add_session(data)
+    print(json.dumps({"ok": True, "id": row_id}))
+
+
+@retry_on_lock
+def cmd_add_insight(args):
+    """Add an insight or decision."""
+    data = parse_json_arg(args.json)
+    require_fields(data, "content")
+    with _database() as db:
+        result = db.add_insight(data, on_duplicate=getattr(args, "on_duplicate", "merge"))
+    if result.get("rejected"):
+        print(json.dumps({"ok": False, "error": "Near-duplicate of insight "
+                                                f"{result['duplicate_of']}", **result}))
+        sys.exit(1)
+    print(json.dumps({"ok": True, **result}))
+
+
+_FTS_TOKEN_RE = re.compile(r'"([^"]*)"(\*?)|(\S+)')
+
+
+def fts_query(text: str) -> str:
+    """Translate user search text into a safe FTS5 MATCH expression.
+
+    Supports "quoted phrases" and trailing-* prefixes (auth*, "error hand"*).
+    Every term is quoted, so punctuation in ordinary input (C++, foo-bar,
+    file.py) is tokenized like the indexed text instead of being parsed as FTS5
+    operators. Terms are implicitly ANDed. Returns "" when nothing searchable
+    remains.
+    """
+    parts = []
+    for m in _FTS_TOKEN_RE.finditer(text or ""):
+        if m.group(3) is not None:
+            term, star = m.group(3), ""
+            if term.endswith("*"):
+                term, star = term.rstrip("*"), "*"
+        else:
+            term, star = m.group(1), m.group(2)
+        if not re.search(r"\w", term):
+            continue
+        parts.append('"{}"{}'.format(term.replace('"', '""'), star))
+    return " ".join(parts)
+
+
+# One SELECT per FTS table; the branches are UNION ALLed and ranked together.
+# bm25() is negative with better matches lower, so ORDER BY rank ascending.
+# {db} is "" for the hot database or "archive." for the ATTACHed archive, which
+# holds sessions and insights only. Archived rows keep their ids, and
+# AUTOINCREMENT never reuses one, so (kind, id) stays unique across both.
+_SEARCH_BRANCHES = {
+    "session": (
+        "SELECT 'session' AS kind, f.rowid AS id, bm25(sessions_fts) AS rank, "
+        "snippet(sessions_fts, -1, '**', '**', '…', 16) AS snippet, {archived} AS archived "
+        "FROM {db}sessions_fts f JOIN {db}sessions t ON t.id = f.rowid "
+        "WHERE sessions_fts MATCH :q"
+    ),
+    "insight": (
+        "SELECT 'insight' AS kind, f.rowid AS id, bm25(insights_fts) AS rank, "
+        "snippet(insights_fts, -1, '**', '**', '…', 16) AS snippet, {archived} AS archived "
+        "FROM {db}insights_fts f JOIN {db}insights t ON t.id = f.rowid "
+        "WHERE insights_fts MATCH :q"
+    ),
+    "context": (
+        "SELECT 'context' AS kind, f.rowid AS id, bm25(project_context_fts) AS rank, "
+        "snippet(project_context_fts, -1, '**', '**', '…', 16) AS snippet, {archived} AS archived "
+        "FROM {db}project_context_fts f JOIN {db}project_context t ON t.id = f.rowid "
+        "WHERE project_context_fts MATCH :q"
+    ),
+}
+ARCHIVED_KINDS = ("session", "insight")
+
+_SEARCH_DETAILS = {
+    "session": "SELECT id, project, date, accomplished, decisions FROM {db}sessions WHERE id IN ({ids})",
+    "insight": "SELECT id, project, type, content, tags FROM {db}insights WHERE id IN ({ids})",
+    "context": "SELECT id, project, status FROM {db}project_context WHERE id IN ({ids})",
+}
+
+
+def _search_result(kind, row, hit) -> dict:
+    """Shape one ranked hit like the pre-FTS search output, plus snippet/score."""
+    if kind == "session":
+        result = {
+            "type": "session",
+            "id": row["id"],
+            "project": row["project"],
+            "date": row["date"],
+            "accomplished": (row["accomplished"] or "")[:200],
+            "decisions": (row["decisions"] or "")[:200],
+        }
+    elif kind == "insight":
+        result = {
+            "type": "insight",
+            "id": row["id"],
+            "project": row["project"],
+            "insight_type": row["type"],
+            "content": row["content"][:200],
+            "tags": row["tags"],
+        }
+    else:
+        result = {
+            "type": "context",
+            "id": row["id"],
+            "project": row["project"],
+            "status": row["status"],
+        }
+    if hit["archived"]:
+        result["archived"] = True
+    result["snippet"] = hit["snippet"]
+    # Flip bm25's sign so a higher score reads as a better match.
+    result["score"] = round(-hit["rank"], 4)
+    return result
+
+
+# ── near-duplicate insights ───────────────────────────────────────────────────
+#
+# The same lesson gets recorded again in slightly different words. Each insight
+# carries a MinHash signature over its word bigrams (MINHASH_SIZE 32-bit minima
+# cut from one shake_128 digest per bigram), split into LSH_BANDS bands whose
+# hashes go into insight_lsh. A new insight is only compared with insights that
+# share a bucket in some band: LSH_BANDS index probes however many insights
+# exist. A candidate in the same project and type whose estimated Jaccard
+# similarity (the share of equal minima) reaches db.dedupe_threshold is a
+# near-duplicate. add-insight folds it into the stored row (seen_count,
+# last_seen, tags) or, with --on-duplicate reject, refuses it; `dedupe`
+# collapses the ones already stored into their oldest copy.
+
+MINHASH_SIZE = 64
+LSH_BANDS = 16
+LSH_ROWS = MINHASH_SIZE // LSH_BANDS  # 16 x 4: P(candidate) ~0.89 at similarity 0.6
+DEFAULT_DEDUPE_THRESHOLD = 0.6
+DUPLICATE_ACTIONS = ("merge", "reject", "keep")
+_WORD_RE = re.compile(r"\w+")
+_MINHASH_FORMAT = f"<{MINHASH_SIZE}I"
+
+
+def dedupe_threshold() -> float:
+    try:
+        return float(_db_config().get("dedupe_threshold", DEFAULT_DEDUPE_THRESHOLD))
+    except (TypeError, ValueError):
+        return DEFAULT_DEDUPE_THRESHOLD
+
+
+def minhash_signature(text) -> bytes:
+    """MINHASH_SIZE packed 32-bit minima over the word bigrams of text."""
+    import hashlib
+
+    words = _WORD_RE.findall(str(text).lower())
+    if len(words) > 1:
+        shingles = {words[i] + " " + words[i + 1] for i in range(len(words) - 1)}
+    else:
+        shingles = {words[0] if words else str(text).strip().lower()}
+    signature = None
+    for shingle in shingles:
+        digest = hashlib.shake_128(shingle.encode("utf-8")).digest(4 * MINHASH_SIZE)
+        values = struct.unpack(_MINHASH_FORMAT, digest)
+        signature = values if signature is None else tuple(map(min, signature, values))
+    return struct.pack(_MINHASH_FORMAT, *signature)
+
+
+def lsh_buckets(signature: bytes) -> list:
+    """One signed 64-bit bucket per band of the signature."""
+    import hashlib
+
+    width = 4 * LSH_ROWS
+    return [
+        int.from_bytes(hashlib.blake2b(signature[start:start + width], digest_size=8).digest(),
+                       "little", signed=True)
+        for start in range(0, len(signature), width)
+    ]
+
+
+def signature_similarity(a: bytes, b: bytes) -> float:
+    """Estimated Jaccard similarity of the two texts behind two signatures."""
+    equal = sum(x == y for x, y in zip(struct.unpack(_MINHASH_FORMAT, a),
+                                       struct.unpack(_MINHASH_FORMAT, b)))
+    return equal / MINHASH_SIZE
+
+
+def index_insight_signatures(conn, rows) -> None:
+    """Store signature and LSH buckets for (insight id, content) pairs."""
+    signatures = [(insight_id, minhash_signature(content)) for insight_id, content in rows]
+    if not signatures:
+        return
+    conn.executemany("DELETE FROM insight_lsh WHERE insight_id = ?",
+                     [(insight_id,) for insight_id, _ in signatures])
+    conn.executemany(
+        "INSERT OR REPLACE INTO insight_minhash (insight_id, signature) VALUES (?, ?)", signatures
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO insight_lsh (band, bucket, insight_id) VALUES (?, ?, ?)",
+        [(band, bucket, insight_id) for insight_id, signature in signatures
+         for band, bucket in enumerate(lsh_buckets(signature))],
+    )
+
+
+def index_new_insights(conn, after_id) -> int:
+    """Tag and sign every insight with id > after_id (rows a bulk write just added)."""
+    added = conn.execute(
+        "SELECT id, tags, content FROM insights WHERE id > ?", (after_id,)
+    ).fetchall()
+    index_insight_tags(conn, [(row[0], row[1]) for row in added])
+    index_insight_signatures(conn, [(row[0], row[2]) for row in added])
+    return len(added)
+
+
+_LSH_PROBE = " OR ".join(["(band = ? AND bucket = ?)"] * LSH_BANDS)
+
+
+def find_near_duplicate(conn, signature, project, type_value, threshold, before_id=None):
+    """(id, similarity) of the closest stored insight at or above threshold, or None.
+
+    before_id limits the search to older insights (dedupe folds into the oldest).
+    """
+    params = [v for band, bucket in enumerate(lsh_buckets(signature)) for v in (band, bucket)]
+    sql = (f"SELECT m.insight_id, m.signature FROM insight_minhash m "
+           f"JOIN insights i ON i.id = m.insight_id "
+           f"WHERE m.insight_id IN (SELECT insight_id FROM insight_lsh WHERE {_LSH_PROBE}) "
+           f"AND i.project IS ? AND i.type = ?")
+    params += [project, type_value]
+    if before_id is not None:
+        sql += " AND m.insight_id < ?"
+        params.append(before_id)
+    best = None
+    for row in conn.execute(sql, params):
+        similarity = signature_similarity(signature, row[1])
+        if similarity >= threshold and (best is None or (similarity, -row[0]) > (best[1], -best[0])):
+            best = (row[0], similarity)
+    return best
+
+
+def merge_insight(conn, target_id, tags, seen_count=1, last_seen=None):
+    """Fold a duplicate into target_id: add its sightings, latest last_seen, union tags."""
+    stored = conn.execute("SELECT tags FROM insights WHERE id = ?", (target_id,)).fetchone()[0]
+    known = normalize_tags(stored)
+    added = [tag for tag in normalize_tags(tags) if tag not in known]
+    assignments = ["seen_count = seen_count + :seen",
+                   "last_seen = MAX(COALESCE(last_seen, created_at), "
+                   "COALESCE(:last_seen, datetime('now')))"]
+    params = {"id": target_id, "seen": seen_count, "last_seen": last_seen}
+    if added:
+        # Only touch tags when they change: an UPDATE OF tags re-indexes FTS.
+        assignments.append("tags = :tags")
+        params["tags"] = ",".join(filter(None, [(stored or "").strip()] + added))
+        index_insight_tags(conn, [(target_id, params["tags"])])
+    conn.execute(f"UPDATE insights SET {', '.join(assignments)} WHERE id = :id", params)
+    return conn.execute("SELECT seen_count FROM insights WHERE id = ?", (target_id,)).fetchone()[0]
+
+
+# ── archive ───────────────────────────────────────────────────────────────────
+#
+# `archive --older-than` moves old sessions (and their raw blobs) and insights
+# into memstack-archive.db, which carries the same numbered schema, FTS indexes
+# included. search and export-md ATTACH it and UNION both; --hot-only skips
+# it. Rows keep their ids. The copy is INSERT OR IGNORE and runs before the
+# delete, so an interrupted run leaves duplicates (never losses) and rerunning
+# finishes it: a WAL-mode commit is atomic per file, not across attached files.
+
+ARCHIVE_SESSION_COLUMNS = ("id", "project", "date", "accomplished", "files_changed", "commits",
+                           "decisions", "problems", "next_steps", "duration", "raw_markdown",
+                           "created_at", "raw_hash", "source")
+ARCHIVE_INSIGHT_COLUMNS = ("id", "project", "type", "content", "context", "tags", "created_at",
+                           "seen_count", "last_seen")
+
+_AGE_RE = re.compile(r"^(\d+)\s*([dwmy])$")
+_AGE_DAYS = {"d": 1, "w": 7, "m": 30, "y": 365}
+
+
+def archive_path(db_path=None) -> Path:
+    db_path = Path(db_path) if db_path else DB_PATH
+    return db_path.with_name(db_path.stem + "-archive.db")
+
+
+def parse_cutoff(text, today=None) -> str:
+    """'90d', '26w', '6m', '2y' or a YYYY-MM-DD date -> the cutoff date string."""
+    text = str(text).strip().lower()
+    match = _AGE_RE.match(text)
+    if match:
+        today = today or datetime.date.today()
+        days = int(match.group(1)) * _AGE_DAYS[match.group(2)]
+        return (today - datetime.timedelta(days=days)).isoformat()
+    try:
+        return datetime.date.fromisoformat(text).isoformat()
+    except ValueError:
+        raise ValueError(f"--older-than expects e.g. 90d, 26w, 6m, 2y or YYYY-MM-DD, not {text!r}")
+
+
+def open_archive(create=False, db_path=None):
+    """A migrated read-write connection to the archive, or None if there is none."""
+    path = archive_path(db_path)
+    is_new = not path.exists()
+    if is_new and not create:
+        return None
+    conn = sqlite3.connect(str(path))
+    conn.row_factory = sqlite3.Row
+    if is_new:
+        conn.execute("PRAGMA journal_mode = WAL")
+    _apply_pragmas(conn)
+    migrate_schema(conn)
+    return conn
+
+
+@contextlib.contextmanager
+def attached_archive(conn, enabled=True, db_path=None):
+    """ATTACH the archive as ``archive`` for the block; yields whether it is there."""
+    path = archive_path(db_path)
+    if not enabled or not path.exists():
+        yield False
+        return
+    conn.execute("ATTACH DATABASE ? AS archive", (str(path),))
+    try:
+        if conn.execute("PRAGMA archive.user_version").fetchone()[0] < SCHEMA_VERSION:
+            # Written by an older release: bring it up to this schema first.
+            conn.execute("DETACH DATABASE archive")
+            open_archive(db_path=db_path).close()
+            conn.execute("ATTACH DATABASE ? AS archive", (str(path),))
+        yield True
+    finally:
+        conn.execute("DETACH DATABASE archive")
+
+
+@retry_on_lock
+def cmd_archive(args):
+    """Move sessions and insights older than a cutoff into the archive database."""
+    try:
+        cutoff = parse_cutoff(args.older_than)
+    except ValueError as exc:
+        print(json.dumps({"ok": False, "error": str(exc)}))
+        sys.exit(1)
+    with contextlib.closing(get_db()) as conn:
+        if not args.dry_run:
+            open_archive(create=True).close()
+        params = {"cutoff": cutoff}
+        # Blank dates never sort as old; insights still queued for the bridge stay.
+        session_where = "date < :cutoff AND date <> ''"
+        insight_where = ("created_at < :cutoff AND id NOT IN "
+                         "(SELECT insight_id FROM main.bridge_outbox WHERE status = 'pending')")
+        with attached_archive(conn, enabled=not args.dry_run):
+            # A preview only reads: a deferred transaction never takes the
+            # write lock, so it neither waits for writers nor blocks them.
+            conn.execute("BEGIN" if args.dry_run else "BEGIN IMMEDIATE")
+            try:
+                sessions = conn.execute(
+                    f"SELECT COUNT(*) FROM main.sessions WHERE {session_where}", params
+                ).fetchone()[0]
+                insights = conn.execute(
+                    f"SELECT COUNT(*) FROM main.insights WHERE {insight_where}", params
+                ).fetchone()[0]
+                if args.dry_run:
+                    conn.rollback()
+                else:
+                    columns = ", ".join(ARCHIVE_SESSION_COLUMNS)
+                    conn.execute(
+                        "INSERT OR IGNORE INTO archive.raw_blobs (hash, codec, size, data) "
+                        "SELECT hash, codec, size, data FROM main.raw_blobs WHERE hash IN ("
+                        f"SELECT raw_hash FROM main.sessions WHERE {session_where})",
+                        params,
+                    )
+                    conn.execute(
+                        f"INSERT OR IGNORE INTO archive.sessions ({columns}) "
+                        f"SELECT {columns} FROM main.sessions WHERE {session_where}",
+                        params,
+                    )
+                    conn.execute(f"DELETE FROM main.sessions WHERE {session_where}", params)
+                    columns = ", ".join(ARCHIVE_INSIGHT_COLUMNS)
+                    conn.execute(
+                        f"INSERT OR IGNORE INTO archive.insights ({columns}) "
+                        f"SELECT {columns} FROM main.insights WHERE {insight_where}",
+                        params,
+                    )
+                    conn.execute(
+                        "INSERT OR IGNORE INTO archive.insight_tags (tag, insight_id) "
+                        "SELECT tag, insight_id FROM main.insight_tags WHERE insight_id IN ("
+                        f"SELECT id FROM main.insights WHERE {insight_where})",
+                        params,
+                    )
+                    conn.execute(f"DELETE FROM main.insights WHERE {insight_where}", params)
+                    conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        if args.vacuum and not args.dry_run:
+            conn.execute("VACUUM")  # hand the freed pages back so the hot file shrinks
+    print(json.dumps({
+        "ok": True, "cutoff": cutoff, "dry_run": args.dry_run,
+        "sessions": sessions, "insights": insights, "archive": str(archive_path()),
+        "db_size_kb": round(DB_PATH.stat().st_size / 1024, 1),
+    }))
+
+
+# ── backups ───────────────────────────────────────────────────────────────────
+#
+# `backup` snapshots the database while sessions keep writing. The default
+# copies it with the online backup API, BACKUP_PAGES pages per step and a
+# short sleep after each, from a mode=ro connection holding one read
+# transaction throughout: a WAL reader never takes the write lock, so the diary
+# keeps committing (checkpoints just wait for the copy to finish). --vacuum writes a compacted
+# copy with VACUUM INTO instead (one read transaction, no free pages). Either
+# way the copy is written to <name>.partial, switched to rollback-journal mode
+# so it is one self-contained file, integrity-checked, hashed into a
+# sha256sum-format sidecar, and only then renamed into place. The newest
+# db.backup_keep snapshots are kept; --verify re-checks every one on disk.
+
+BACKUP_PAGES = 1024
+BACKUP_SLEEP_MS = 5
+DEFAULT_BACKUP_KEEP = 7
+
+
+def backup_dir(db_path=None) -> Path:
+    db_path = Path(db_path) if db_path else DB_PATH
+    return db_path.parent / "backups"
+
+
+def backup_keep() -> int:
+    try:
+        return max(1, int(_db_config().get("backup_keep", DEFAULT_BACKUP_KEEP)))
+    except (TypeError, ValueError):
+        return DEFAULT_BACKUP_KEEP
+
+
+def file_sha256(path) -> str:
+    import hashlib
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _snapshot_check(path) -> str:
+    conn = sqlite3.connect(Path(path).resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        return conn.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def list_snapshots(dest, stem) -> list:
+    """Snapshots of the database named stem in dest, oldest first."""
+    return sorted(Path(dest).glob(f"{stem}-*Z.db"))
+
+
+def verify_snapshot(path) -> dict:
+    """Re-hash a snapshot against its .sha256 sidecar and integrity-check it."""
+    sidecar = Path(str(path) + ".sha256")
+    result = {"snapshot": str(path)}
+    try:
+        expected = sidecar.read_text(encoding="utf-8").split()[0]
+    except (OSError, IndexError):
+        expected = None
+    result["sha256_ok"] = expected is not None and file_sha256(path) == expected
+    try:
+        result["integrity"] = _snapshot_check(path)
+    except sqlite3.Error as exc:
+        result["integrity"] = str(exc)
+    result["ok"] = result["sha256_ok"] and result["integrity"] == "ok"
+    return result
+
+
+@retry_on_lock
+def cmd_backup(args):
+    """Snapshot the database online, verify it, and rotate old snapshots."""
+    with _database() as db:
+        if args.verify:
+            results = [verify_snapshot(p) for p in
+                       list_snapshots(args.dest or backup_dir(db.path), db.path.stem)]
+            ok = all(r["ok"] for r in results)
+            print(json.dumps({"ok": ok, "verified": len(results), "snapshots": results}))
+            if not ok:
+                sys.exit(1)
+            return
+        result = db.backup(args.dest, vacuum=args.vacuum, pages=args.pages,
+                           sleep_ms=args.sleep_ms, keep=args.keep)
+    print(json.dumps({"ok": True, **result}))
+
+
+# ── watch ─────────────────────────────────────────────────────────────────────
+#
+# `watch` keeps SQLite and the echo skill's vector index in step with
+# memory/sessions (and its archive) and memory/plans, so a diary saved as
+# markdown is searchable seconds later without rerunning db/migrate.py and
+# skills/echo/index-sessions.py over everything. On Linux it listens with
+# inotify (through libc, no extra package); elsewhere, or with --backend poll,
+# it diffs a stat() snapshot of the directories every --interval seconds.
+# Events are collected until --debounce seconds pass without another (or
+# WATCH_MAX_DELAY_FACTOR debounces after the first), then only the files in
+# that batch go through migrate.sync_sessions() and run_index(files=...).
+# Removed files are reported but keep their rows: the database is the diary's
+# primary store. Both steps start with one full pass to catch up.
+
+MEMORY_DIR = DB_DIR.parent / "memory"
+MIGRATE_PATH = DB_DIR / "migrate.py"
+ECHO_INDEX_PATH = DB_DIR.parent / "skills" / "echo" / "index-sessions.py"
+WATCH_BACKENDS = ("auto", "inotify", "poll")
+DEFAULT_WATCH_DEBOUNCE = 1.0
+DEFAULT_WATCH_INTERVAL = 1.0
+WATCH_MAX_DELAY_FACTOR = 10
+
+# <sys/inotify.h>
+IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO, IN_DELETE = 0x8, 0x40, 0x80, 0x200
+IN_Q_OVERFLOW = 0x4000
+_INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len; then len bytes of name
+
+_migrate = None
+_echo_indexer = None
+
+
+def _load_migrate():
+    global _migrate
+    if _migrate is None:
+        import importlib.util
+
+        spec = importlib.util.spec_from_file_location("memstack_migrate", MIGRATE_PATH)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _migrate = module
+    return _migrate
+
+
+def _load_echo_indexer():
+    global _echo_indexer
+    if _echo_indexer is None:
+        import importlib.util
+
+        spec = importlib.util.spec_from_file_location("memstack_echo_index", ECHO_INDEX_PATH)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _echo_indexer = module
+    return _echo_indexer
+
+
+def watch_dirs(memory_dir=None) -> list:
+    memory_dir = Path(memory_dir) if memory_dir else MEMORY_DIR
+    return [memory_dir / "sessions", memory_dir / "sessions" / "archive", memory_dir / "plans"]
+
+
+def _markdown_in(dirs) -> dict:
+    """{path: (size, mtime_ns)} for the *.md files directly inside dirs."""
+    found = {}
+    for directory in dirs:
+        try:
+            entries = os.scandir(directory)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        with entries:
+            for entry in entries:
+                if entry.name.endswith(".md") and entry.is_file():
+                    st = entry.stat()
+                    found[entry.path] = (st.st_size, st.st_mtime_ns)
+    return found
+
+
+class PollWatcher:
+    """Changed markdown found by diffing a stat() snapshot of the directories."""
+
+    backend = "poll"
+
+    def __init__(self, dirs):
+        self.dirs = [Path(d) for d in dirs]
+        self._seen = _markdown_in(self.dirs)
+
+    def wait(self, timeout) -> set:
+        """Sleep timeout seconds; return the paths created, modified or removed."""
+        time.sleep(timeout)
+        now = _markdown_in(self.dirs)
+        changed = {path for path, stamp in now.items() if self._seen.get(path) != stamp}
+        changed |= self._seen.keys() - now.keys()
+        self._seen = now
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Changed markdown reported by Linux inotify, read through libc with ctypes."""
+
+    backend = "inotify"
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+
+    def __init__(self, dirs):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)  # raises AttributeError off Linux
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = [Path(d) for d in dirs if Path(d).is_dir()]
+        self._watches = {}
+        for directory in self.dirs:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+            self._watches[wd] = directory
+
+    def wait(self, timeout) -> set:
+        """Block up to timeout seconds for events; return the markdown paths they name."""
+        import select
+
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = _INOTIFY_EVENT.unpack_from(data, offset)
+                name = data[offset + _INOTIFY_EVENT.size:offset + _INOTIFY_EVENT.size + length]
+                offset += _INOTIFY_EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    changed |= _markdown_in(self.dirs).keys()  # events were dropped: rescan
+                    continue
+                name = os.fsdecode(name.rstrip(b"\0"))
+                if name.endswith(".md") and wd in self._watches:
+                    changed.add(str(self._watches[wd] / name))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def open_watcher(dirs, backend="auto"):
+    """An InotifyWatcher where inotify works (or is asked for), else a PollWatcher."""
+    if backend == "poll":
+        return PollWatcher(dirs)
+    try:
+        return InotifyWatcher(dirs)
+    except (OSError, AttributeError):
+        if backend == "inotify":
+            raise
+        return PollWatcher(dirs)
+
+
+def watch_batches(watcher, debounce=DEFAULT_WATCH_DEBOUNCE, interval=DEFAULT_WATCH_INTERVAL,
+                  stop=None):
+    """Yield sorted lists of changed paths, each once its burst has gone quiet."""
+    pending, first = set(), None
+    while stop is None or not stop.is_set():
+        changed = watcher.wait(debounce if pending else interval)
+        now = time.monotonic()
+        if changed:
+            pending |= changed
+            first = first or now
+            if now - first < debounce * WATCH_MAX_DELAY_FACTOR:
+                continue
+        if pending:
+            yield sorted(pending)
+            pending, first = set(), None
+
+
+def sync_memory_files(paths=None, memory_dir=None, vectors=True, embedder=None,
+                      provider=None) -> dict:
+    """Push changed markdown into SQLite and the vector index; None means all of it."""
+    memory_dir = Path(memory_dir) if memory_dir else MEMORY_DIR
+    sessions_dir = memory_dir / "sessions"
+    result = {"ok": True}
+    migrate = _load_migrate()
+    if paths is None:
+        diaries = None
+    else:
+        paths = [Path(p) for p in paths]
+        result["files"] = [str(p) for p in paths]
+        result["removed"] = [str(p) for p in paths if not p.exists()]
+        diaries = [p for p in paths if p.exists() and p.name not in migrate.FORMAT_FILES
+                   and p.parent in (sessions_dir, sessions_dir / "archive")]
+    if diaries is None or diaries:
+        synced = migrate.sync_sessions(memory_dir, DB_PATH, config_path=None, workers=1,
+                                       files=diaries)
+        result["sessions"] = {"added": len(synced["added"]), "updated": len(synced["updated"]),
+                              "insights": synced["insights"]}
+    if vectors:
+        # Echo indexes sessions and plans, not the archive.
+        echo_dirs = (sessions_dir, memory_dir / "plans")
+        if paths is None:
+            indexed = [Path(p) for p in sorted(_markdown_in(echo_dirs))]
+        else:
+            # Deleted files go too: the indexer drops their rows
+            indexed = [p for p in paths if p.parent in echo_dirs]
+        if indexed:
+            try:
+                outcome = _load_echo_indexer().run_index(provider_override=provider,
+                                                         files=indexed, embedder=embedder)
+            except Exception as exc:  # a LanceDB failure: report it, keep watching
+                outcome = {"ok": False, "error": f"{type(exc).__name__}: {exc}"}
+            result["vectors"] = outcome
+            result["ok"] = bool(outcome.get("ok"))
+    return result
+
+
+def cmd_watch(args):
+    """Sync new and edited memory markdown into SQLite and the vector index until stopped."""
+    memory_dir = Path(args.memory_dir).resolve() if args.memory_dir else MEMORY_DIR
+    try:
+        watcher = open_watcher(watch_dirs(memory_dir), args.backend)
+    except (OSError, AttributeError) as exc:
+        print(json.dumps({"ok": False, "error": f"inotify unavailable: {exc}"}))
+        sys.exit(1)
+    embedder = None
+    if not args.no_vectors:
+        # Load the model once, not per batch.
+        embedder = _load_echo_indexer().get_embedder(provider_override=args.provider)
+
+    def sync(paths):
+        try:
+            return sync_memory_files(paths, memory_dir, not args.no_vectors, embedder,
+                                     args.provider)
+        except (sqlite3.Error, OSError, ValueError) as exc:
+            return {"ok": False, "files": [str(p) for p in paths or []], "error": str(exc)}
+
+    print(json.dumps({"ok": True, "watching": [str(d) for d in watcher.dirs],
+                      "backend": watcher.backend, "db": str(DB_PATH)}), flush=True)
+    import signal
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        print(json.dumps({"catch_up": True, **sync(None)}), flush=True)
+        for batch in watch_batches(watcher, args.debounce, args.interval):
+            print(json.dumps(sync(batch)), flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+# ── result cache ──────────────────────────────────────────────────────────────
+#
+# Hooks re-read the same context, plan and insights many times per session.
+# The printed output of those commands is kept in memstack-cache.db next to
+# the database, keyed by command and arguments and tagged with the
+# cache_generation value read BEFORE the query ran: a write that lands while
+# the query runs bumps the generation, so an entry is never newer than its tag.
+# Size is bounded by db.cache_kb in config.json (0 disables), least recently
+# used first. The cache is disposable: any error in it just runs the command.
+
+DEFAULT_CACHE_KB = 4096
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key         TEXT    PRIMARY KEY,
+    generation  INTEGER NOT NULL,
+    output      TEXT    NOT NULL,
+    size        INTEGER NOT NULL,
+    last_used   REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_lru ON entries(last_used);
+CREATE TABLE IF NOT EXISTS counters (
+    name        TEXT    PRIMARY KEY,
+    value       INTEGER NOT NULL
+);
+"""
+
+
+def cache_path() -> Path:
+    return DB_PATH.with_name(DB_PATH.stem + "-cache.db")
+
+
+def cache_limit_bytes() -> int:
+    try:
+        return max(0, int(_db_config().get("cache_kb", DEFAULT_CACHE_KB))) * 1024
+    except (TypeError, ValueError):
+        return DEFAULT_CACHE_KB * 1024
+
+
+def _open_cache():
+    conn = sqlite3.connect(str(cache_path()), timeout=1.0, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")  # losing the cache costs one query
+    for statement in _split_sql(CACHE_SCHEMA):
+        conn.execute(statement)
+    return conn
+
+
+def _bump(cache, name, by=1):
+    cache.execute(
+        "INSERT INTO counters (name, value) VALUES (?, ?) "
+        "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+        (name, by),
+    )
+
+
+def cache_stats() -> dict:
+    """Counters and size for `stats`; does not create the cache file."""
+    stats = {"hits": 0, "misses": 0, "evictions": 0, "entries": 0, "size_kb": 0.0,
+             "limit_kb": cache_limit_bytes() // 1024}
+    if not cache_path().exists():
+        return stats
+    try:
+        cache = _open_cache()
+        try:
+            stats.update(cache.execute("SELECT name, value FROM counters").fetchall())
+            entries, size = cache.execute("SELECT COUNT(*), SUM(size) FROM entries").fetchone()
+        finally:
+            cache.close()
+    except sqlite3.Error as exc:
+        stats["error"] = str(exc)
+        return stats
+    stats["entries"], stats["size_kb"] = entries, round((size or 0) / 1024, 1)
+    return stats
+
+
+def _cache_generation() -> int:
+    with _database() as db, db.reading() as conn:
+        return conn.execute("SELECT value FROM cache_generation WHERE id = 1").fetchone()[0]
+
+
+class _CappedTee(io.TextIOBase):
+    """Writes through to ``out``, keeping a copy only while it fits in ``limit``.
+
+    Output too large to cache streams as it is produced and is never held whole.
+    """
+
+    def __init__(self, out, limit):
+        self.out, self.limit = out, limit
+        self.parts, self.size = [], 0
+
+    def write(self, text):
+        self.out.write(text)
+        if self.parts is not None:
+            self.size += len(text)
+            if self.size > self.limit:
+                self.parts = None
+            else:
+                self.parts.append(text)
+        return len(text)
+
+    def flush(self):
+        self.out.flush()
+
+    def getvalue(self):
+        """The full output, or None once it outgrew the limit."""
+        return None if self.parts is None else "".join(self.parts)
+
+
+def cached_result(handler):
+    """Serve a read command's output from the result cache when still valid."""
+    @functools.wraps(handler)
+    def wrapper(args):
+        limit = cache_limit_bytes()
+        if not limit:
+            return handler(args)
+        fields = {k: v for k, v in sorted(vars(args).items()) if k != "command"}
+        key = handler.__name__ + ":" + json.dumps(fields, sort_keys=True, default=str)
+        try:
+            generation = _cache_generation()
+            cache = _open_cache()
+        except sqlite3.Error:
+            return handler(args)
+        try:
+            try:
+                row = cache.execute(
+                    "SELECT output FROM entries WHERE key = ? AND generation = ?",
+                    (key, generation),
+                ).fetchone()
+                if row is not None:
+                    cache.execute("UPDATE entries SET last_used = ? WHERE key = ?",
+                                  (time.time(), key))
+                    _bump(cache, "hits")
+                    sys.stdout.write(row[0])
+                    return None
+            except sqlite3.Error:
+                pass
+            tee = _CappedTee(sys.stdout, limit)
+            with contextlib.redirect_stdout(tee):
+                result = handler(args)
+            output = tee.getvalue()
+            try:
+                _bump(cache, "misses")
+                if output is not None:
+                    cache.execute(
+                        "INSERT OR REPLACE INTO entries (key, generation, output, size, last_used) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (key, generation, output, len(output), time.time()),
+                    )
+                    # Keep the most recently used entries that fit in the limit.
+                    evicted = cache.execute(
+                        """DELETE FROM entries WHERE key IN (
+                               SELECT key FROM (
+                                   SELECT key, SUM(size) OVER (
+                                       ORDER BY last_used DESC, key) AS running
+                                   FROM entries)
+                               WHERE running > ?)""",
+                        (limit,),
+                    ).rowcount
+                    if evicted:
+                        _bump(cache, "evictions", evicted)
+            except sqlite3.Error:
+                pass
+            return result
+        finally:
+            cache.close()
+    return wrapper
+
+
+# ── paging and projection ─────────────────────────────────────────────────────
+#
+# get-sessions, get-insights and search page by keyset, not OFFSET: the cursor
+# is the sort key of the last row returned, so page N costs the same as page 1.
+# Rows are written as they are read, so memory stays flat however many match.
+
+SESSION_FIELDS = ("id", "project", "date", "accomplished", "files_changed", "commits",
+                  "decisions", "problems", "next_steps", "duration", "created_at")
+INSIGHT_FIELDS = ("id", "project", "type", "content", "context", "tags", "created_at",
+                  "seen_count", "last_seen")
+SEARCH_FIELDS = ("type", "id", "project", "date", "accomplished", "decisions", "insight_type",
+                 "content", "tags", "status", "archived", "source", "section_title", "snippet",
+                 "score", "matched_by")
+
+
+def encode_cursor(command, key) -> str:
+    """Opaque --after token for the sort key of the last row on a page."""
+    raw = json.dumps([command, *key], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(command, token) -> list:
+    """Sort key from an --after token; exits cleanly on a foreign or corrupt one."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        decoded = json.loads(raw)
+        if not isinstance(decoded, list) or decoded[0] != command:
+            raise ValueError
+        return decoded[1:]
+    except (ValueError, TypeError, IndexError):
+        print(json.dumps({"ok": False, "error": f"Invalid --after cursor for {command}"}))
+        sys.exit(1)
+
+
+def parse_fields(raw, allowed) -> list:
+    """--fields a,b,c -> column list (all allowed columns when omitted)."""
+    if not raw:
+        return list(allowed)
+    fields = [f.strip() for f in raw.split(",") if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown or not fields:
+        print(json.dumps({"ok": False, "error": "Unknown --fields {}; choose from {}".format(
+            ", ".join(unknown) or "(none)", ", ".join(allowed))}))
+        sys.exit(1)
+    return fields
+
+
+def emit_rows(name, items, args, command, extra=None) -> None:
+    """Stream (sort_key, row) pairs as JSON or NDJSON, with a next-page cursor.
+
+    JSON keeps the {name: [...], "count": n} envelope. NDJSON writes one row per
+    line and ends with a {"count", "next_cursor"} summary line, so a caller can
+    stop reading as soon as it has enough.
+    """
+    out = sys.stdout
+    ndjson = getattr(args, "ndjson", False)
+    if not ndjson:
+        out.write("{" + json.dumps(name) + ": [")
+    count, last_key = 0, None
+    for key, row in items:
+        if ndjson:
+            out.write(json.dumps(row) + "\n")
+        else:
+            out.write((", " if count else "") + json.dumps(row))
+        count += 1
+        last_key = key
+    limit = getattr(args, "limit", None)
+    next_cursor = encode_cursor(command, last_key) if limit and count == limit else None
+    summary = {"count": count, "next_cursor": next_cursor}
+    summary.update(extra or {})
+    if ndjson:
+        out.write(json.dumps(summary) + "\n")
+    else:
+        out.write("]" + ", " + json.dumps(summary)[1:] + "\n")
+
+
+def _lexical_hits(conn, match, limit, project=None, after=None, with_archive=False,
+                  tags=()) -> list:
+    """Ranked FTS hits as (hit, detail row) pairs, hydrated from the right tier.
+
+    tags (normalized) keeps only insights carrying every one of them.
+    """
+    params = {"q": match, "limit": limit}
+    tiers = [(kind, "", 0) for kind in _SEARCH_BRANCHES]
+    if with_archive:
+        tiers += [(kind, "archive.", 1) for kind in ARCHIVED_KINDS]
+    if tags:
+        tiers = [tier for tier in tiers if tier[0] == "insight"]
+    if project:
+        params["project"] = project
+    params.update((f"tag{i}", tag) for i, tag in enumerate(tags))
+    branches = []
+    for kind, db, archived in tiers:
+        branch = _SEARCH_BRANCHES[kind].format(db=db, archived=archived)
+        if project:
+            branch += " AND t.project = :project"
+        branch += "".join(
+            f" AND t.id IN (SELECT insight_id FROM {db}insight_tags WHERE tag = :tag{i})"
+            for i in range(len(tags)))
+        branches.append(branch)
+    sql = "SELECT * FROM (" + " UNION ALL ".join(branches) + ")"
+    if after:
+        params["after_rank"], params["after_kind"], params["after_id"] = after
+        sql += " WHERE (rank, kind, id) > (:after_rank, :after_kind, :after_id)"
+    sql += " ORDER BY rank, kind, id LIMIT :limit"
+    hits = conn.execute(sql, params).fetchall()
+
+    # Hydrate display columns with one keyed lookup per table that produced hits.
+    rows = {}
+    for kind, detail_sql in _SEARCH_DETAILS.items():
+        for archived, db in ((0, ""), (1, "archive.")):
+            ids = [h["id"] for h in hits if h["kind"] == kind and h["archived"] == archived]
+            if ids:
+                sql = detail_sql.format(db=db, ids=",".join("?" * len(ids)))
+                for row in conn.execute(sql, ids):
+                    rows[(kind, row["id"])] = row
+    return [(h, rows[(h["kind"], h["id"])]) for h in hits]
+
+
+def cmd_search(args):
+    """Full-text search across sessions, insights, and project_context."""
+    fields = parse_fields(args.fields, SEARCH_FIELDS)
+    mode = getattr(args, "mode", "lexical")
+    command = "search" if mode == "lexical" else "search-" + mode
+    after = decode_cursor(command, args.after) if args.after else None
+    with _database() as db:
+        items, extra = db.search_page(args.query, args.limit or 10, args.project, after,
+                                      mode, args.hot_only, getattr(args, "tag", None))
+    rows = ((key, {k: result[k] for k in fields if k in result}) for key, result in items)
+    emit_rows("results", rows, args, command, extra)
+
+
+# ── hybrid / semantic search ──────────────────────────────────────────────────
+#
+# --mode semantic asks the echo skill's LanceDB index; --mode hybrid runs that
+# on a worker thread while the FTS query runs here, then fuses the two ranked
+# lists with reciprocal-rank fusion (score = sum of 1 / (RRF_K + rank)). An
+# echo chunk that belongs to a session row fuses with that row's lexical hit;
+# other chunks (plans, files not yet imported) come back as their own results.
+# A fused ranking has no stable sort key, so --after pages by position.
+
+ECHO_SEARCH_PATH = DB_DIR.parent / "skills" / "echo" / "search.py"
+RRF_K = 60
+_echo_search = None
+
+
+def _load_echo_search():
+    global _echo_search
+    if _echo_search is None:
+        import importlib.util
+
+        spec = importlib.util.spec_from_file_location("memstack_echo_search", ECHO_SEARCH_PATH)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _echo_search = module
+    return _echo_search
+
+
+def _semantic_hits(query, top_k):
+    """(echo results, error or None); run_search reports problems on stderr."""
+    errors = io.StringIO()
+    try:
+        with contextlib.redirect_stderr(errors):
+            results = _load_echo_search().run_search(query, top_k=top_k)
+    except Exception as exc:  # a broken echo install must not break lexical search
+        return [], f"semantic search unavailable: {exc}"
+    if results:
+        return results, None
+    for line in reversed(errors.getvalue().splitlines()):
+        try:
+            return [], json.loads(line)["error"]
+        except (ValueError, KeyError, TypeError):
+            continue
+    return [], None
+
+
+def _session_for_chunk(conn, chunk, with_archive):
+    """The session row an echo chunk was cut from, or None unless exactly one fits.
+
+    A diary imported by db/migrate.py is known by its file: sessions.source is
+    the path under memory/ and the chunk's source ends with it. Otherwise the
+    chunk's project and date have to name a single session written directly;
+    several on one day leave nothing to tell them apart.
+    """
+    if chunk.get("type", "session") != "session" or not chunk.get("project"):
+        return None
+    path = PureWindowsPath(chunk.get("source") or "")  # either separator, as the indexer wrote it
+    source_key = f"{path.parent.name}/{path.name}" if path.name else None
+    for archived, db in ((0, ""), (1, "archive.")):
+        if archived and not with_archive:
+            break
+        rows = conn.execute(
+            f"SELECT id, project, date, accomplished, decisions, source FROM {db}sessions "
+            "WHERE project = ? AND date = ? ORDER BY id",
+            (chunk["project"], chunk.get("date", "")),
+        ).fetchall()
+        if not rows:
+            continue
+        matches = [row for row in rows if source_key and row["source"] == source_key]
+        if not matches and len(rows) == 1 and rows[0]["source"] is None:
+            matches = rows
+        return (matches[0], archived) if len(matches) == 1 else None
+    return None
+
+
+def _chunk_result(chunk) -> dict:
+    content = chunk.get("content", "")
+    return {
+        "type": chunk.get("type") or "session",
+        "id": None,
+        "project": chunk.get("project", ""),
+        "date": chunk.get("date", ""),
+        "content": content[:200],
+        "source": chunk.get("source", ""),
+        "section_title": chunk.get("section_title", ""),
+        "snippet": content[:200],
+    }
+
+
+def _keyset_rows(conn, sql, params, fields, sort_key, extra=None):
+    """Yield (sort_key, projected row) straight off the cursor.
+
+    ``extra(row)`` returns additional output fields computed from the raw row.
+    """
+    for row in conn.execute(sql, params):
+        item = {f: row[f] for f in fields}
+        if extra is not None:
+            item.update(extra(row))
+        yield tuple(row[k] for k in sort_key), item
+
+
+# ── in-process API ────────────────────────────────────────────────────────────
+#
+# MemStackDB is what every command runs on, and what in-process callers (the
+# skill loader, an MCP server, tests) import instead of spawning this script:
+#
+#     sys.path.insert(0, "<memstack>/db")
+#     from memstack_db import MemStackDB
+#     with MemStackDB() as db:
+#         db.add_session({"project": "p", "accomplished": "- shipped it"})
+#         hits = db.search("shipped", project="p")
+#
+# Methods take and return plain dicts and lists, no JSON in between. Writes
+# share one long-lived read-write connection, serialized by a lock; reads
+# borrow a mode=ro connection from a small pool, so each thread reads on its
+# own connection without waiting for a writer. Pooled connections keep
+# sqlite3's statement cache warm across calls. Bad input raises ValueError,
+# the database raises sqlite3.Error; the cmd_* wrappers below turn both into
+# the CLI's JSON.
+
+def _require(data: dict, *fields: str) -> None:
+    field = missing_field(data, *fields)
+    if field is not None:
+        raise ValueError(f"Missing required field: {field}")
+
+
+SEARCH_MODES = ("lexical", "hybrid", "semantic")
+
+
+class MemStackDB:
+    """Repository operations on one memory database (DB_PATH by default)."""
+
+    def __init__(self, path=None, max_idle_readers=4, cached_statements=256):
+        self.path = Path(path) if path else DB_PATH
+        self.max_idle_readers = max_idle_readers
+        self.cached_statements = cached_statements
+        self._lock = threading.RLock()
+        self._conn = None
+        self._idle = []
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # connections
+
+    def connection(self):
+        """The long-lived read-write connection, opened and migrated on first use."""
+        with self._lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("MemStackDB is closed")
+            if self._conn is None:
+                self._conn = get_db(path=self.path, check_same_thread=False,
+                                    cached_statements=self.cached_statements)
+            return self._conn
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """BEGIN IMMEDIATE on the shared connection; other writers here wait their turn."""
+        with self._lock:
+            with write_transaction(self.connection()) as conn:
+                yield conn
+
+    @contextlib.contextmanager
+    def reading(self):
+        """A pooled read connection, the calling thread's alone for the block."""
+        with self._lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("MemStackDB is closed")
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = get_db(readonly=True, path=self.path, check_same_thread=False,
+                          cached_statements=self.cached_statements)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                keep = not self._closed and len(self._idle) < self.max_idle_readers
+                if keep:
+                    self._idle.append(conn)
+            if not keep:
+                conn.close()
+
+    def close(self):
+        """Close every connection; readers still borrowed close when returned."""
+        with self._lock:
+            self._closed = True
+            conns, self._idle = self._idle, []
+            if self._conn is not None:
+                conns.append(self._conn)
+                self._conn = None
+        for conn in conns:
+            conn.close()
+
+    # writes
+
+    def add_session(self, data: dict) -> int:
+        """Insert a session diary entry; returns its id."""
+        _require(data, "project")
+        params = session_params(data)
+        with self.transaction() as conn:
+            conn.execute(RAW_BLOB_INSERT_SQL, params)
+            return conn.execute(SESSION_INSERT_SQL, params).lastrowid
+
+    def add_insight(self, data: dict, on_duplicate="merge", threshold=None) -> dict:
+        """Insert an insight and queue its loader mirror.
+
+        Returns {"id"} plus what happened on the way: type_normalized or
+        type_unknown, and bridge_skipped or bridge_queued. A near-duplicate of
+        a stored insight (same project and type) is merged into it instead
+        ({"merged": True, "duplicate_of", "similarity", "seen_count"}), or with
+        on_duplicate="reject" not written ({"rejected": True, ...}, no "id");
+        "keep" stores it regardless.
+        """
+        _require(data, "content")
+        if on_duplicate not in DUPLICATE_ACTIONS:
+            raise ValueError(f"on_duplicate must be one of {DUPLICATE_ACTIONS}")
+        threshold = dedupe_threshold() if threshold is None else threshold
+        raw_type = data.get("type")
+        params = insight_params(data)
+        type_value = params["type"]
+        signature = minhash_signature(params["content"])
+        disabled = bridge_disabled_reason() if type_value in BRIDGED_TYPES else ""
+        queued = duplicate = None
+        with self.transaction() as conn:
+            if on_duplicate != "keep":
+                duplicate = find_near_duplicate(conn, signature, params["project"], type_value,
+                                                threshold)
+            if duplicate is not None:
+                row_id, similarity = duplicate
+                if on_duplicate == "reject":
+                    return {"rejected": True, "duplicate_of": row_id,
+                            "similarity": round(similarity, 3)}
+                seen_count = merge_insight(conn, row_id, params["tags"])
+            else:
+                row_id = conn.execute(INSIGHT_INSERT_SQL, params).lastrowid
+                index_insight_tags(conn, [(row_id, params["tags"])])
+                index_insight_signatures(conn, [(row_id, params["content"])])
+            if disabled is None and duplicate is None:
+                # Queue the mirror in the insight's own transaction: both land or neither.
+                created_at = conn.execute(
+                    "SELECT created_at FROM insights WHERE id = ?", (row_id,)
+                ).fetchone()[0]
+                queued = enqueue_bridge(conn, row_id, type_value, created_at)
+        result = {"id": row_id}
+        if duplicate is not None:
+            result.update(merged=True, duplicate_of=row_id, similarity=round(similarity, 3),
+                          seen_count=seen_count)
+        if raw_type is not None and str(raw_type).strip():
+            if type_value in CANONICAL_TYPES:
+                if type_value != str(raw_type).strip().lower():
+                    result["type_normalized"] = f"{raw_type} -> {type_value}"
+            else:
+                result["type_unknown"] = type_value
+        if disabled and duplicate is None:
+            result["bridge_skipped"] = disabled
+        if queued:
+            result["bridge_queued"] = queued
+            result.update(kick_drain(self.path))
+        return result
+
+    def set_context(self, data: dict) -> None:
+        """Upsert project context; fields left out (or null) keep their value."""
+        _require(data, "project")
+        with self.transaction() as conn:
+            conn.execute(
+                """INSERT INTO project_context (project, status, current_branch, last_session_date,
+                   architecture_decisions, known_issues, backlog, updated_at)
+                   VALUES (:project, :status, :current_branch, :last_session_date,
+                   :architecture_decisions, :known_issues, :backlog, datetime('now'))
+                   ON CONFLICT(project) DO UPDATE SET
+                   status = COALESCE(:status, status),
+                   current_branch = COALESCE(:current_branch, current_branch),
+                   last_session_date = COALESCE(:last_session_date, last_session_date),
+                   architecture_decisions = COALESCE(:architecture_decisions, architecture_decisions),
+                   known_issues = COALESCE(:known_issues, known_issues),
+                   backlog = COALESCE(:backlog, backlog),
+                   updated_at = datetime('now')""",
+                {
+                    "project": data["project"],
+                    "status": data.get("status"),
+                    "current_branch": data.get("current_branch"),
+                    "last_session_date": data.get("last_session_date"),
+                    "architecture_decisions": data.get("architecture_decisions"),
+                    "known_issues": data.get("known_issues"),
+                    "backlog": data.get("backlog"),
+                },
+            )
+
+    def add_plan_task(self, data: dict) -> None:
+        """Add a plan task, or replace the one with the same task_number."""
+        _require(data, "project", "task_number", "description")
+        with self.transaction() as conn:
+            conn.execute(PLAN_TASK_UPSERT_SQL, plan_task_params(data))
+
+    def update_task(self, data: dict) -> bool:
+        """Set a plan task's status; False when there is no such task."""
+        _require(data, "project", "task_number", "status")
+        with self.transaction() as conn:
+            cur = conn.execute(
+                """UPDATE plans SET status = :status, blocked_reason = :blocked_reason,
+                   updated_at = datetime('now')
+                   WHERE project = :project AND task_number = :task_number""",
+                {
+                    "project": data["project"],
+                    "task_number": data["task_number"],
+                    "status": data["status"],
+                    "blocked_reason": data.get("blocked_reason"),
+                },
+            )
+        return cur.rowcount > 0
+
+    def drain_bridge(self, limit=200, max_attempts=OUTBOX_MAX_ATTEMPTS) -> dict:
+        """Mirror queued procedural insights into the skill loader (see drain_outbox)."""
+        with self._lock:
+            return drain_outbox(self.connection(), limit=limit, max_attempts=max_attempts)
+
+    def dedupe(self, project=None, threshold=None, dry_run=False) -> dict:
+        """Fold stored near-duplicate insights into their oldest copy.
+
+        Returns {"scanned", "merged", "pairs": [{"id", "duplicate_of",
+        "similarity"}]}; dry_run reports the pairs without changing anything.
+        """
+        threshold = dedupe_threshold() if threshold is None else threshold
+        scanned, pairs, last_id = 0, [], 0
+        sql = ("SELECT i.id, i.project, i.type, i.tags, i.seen_count, "
+               "COALESCE(i.last_seen, i.created_at) AS last_seen, m.signature "
+               "FROM insights i JOIN insight_minhash m ON m.insight_id = i.id WHERE i.id > ?")
+        if project:
+            sql += " AND i.project = ?"
+        sql += " ORDER BY i.id LIMIT 500"
+        while True:
+            # One write transaction per batch keeps other writers moving.
+            with (self.reading() if dry_run else self.transaction()) as conn:
+                rows = conn.execute(sql, (last_id, project) if project else (last_id,)).fetchall()
+                for row in rows:
+                    found = find_near_duplicate(conn, row["signature"], row["project"],
+                                                row["type"], threshold, before_id=row["id"])
+                    if found is None:
+                        continue
+                    pairs.append({"id": row["id"], "duplicate_of": found[0],
+                                  "similarity": round(found[1], 3)})
+                    if not dry_run:
+                        merge_insight(conn, found[0], row["tags"], row["seen_count"],
+                                      row["last_seen"])
+                        conn.execute("DELETE FROM bridge_outbox WHERE insight_id = ? "
+                                     "AND status = 'pending'", (row["id"],))
+                        conn.execute("DELETE FROM insights WHERE id = ?", (row["id"],))
+            if not rows:
+                break
+            scanned += len(rows)
+            last_id = rows[-1]["id"]
+        return {"scanned": scanned, "merged": 0 if dry_run else len(pairs), "pairs": pairs}
+
+    def backup(self, dest=None, vacuum=False, pages=BACKUP_PAGES, sleep_ms=BACKUP_SLEEP_MS,
+               keep=None) -> dict:
+        """Write a verified snapshot into dest (db/backups/) and rotate old ones.
+
+        Returns the snapshot path, method, size, sha256, integrity result,
+        timing and the snapshots removed by rotation (keep newest ``keep``).
+        """
+        if keep is None:
+            keep = backup_keep()
+        elif keep < 1:
+            raise ValueError(f"keep must be at least 1, not {keep}")
+        dest = Path(dest) if dest else backup_dir(self.path)
+        dest.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+        final = dest / f"{self.path.stem}-{stamp}.db"
+        partial = Path(str(final) + ".partial")
+        partial.unlink(missing_ok=True)
+        started = time.perf_counter()
+        steps = 0
+
+        def throttle(_status, _remaining, _total):
+            nonlocal steps
+            steps += 1
+            if sleep_ms:
+                time.sleep(sleep_ms / 1000.0)  # let writers in between steps
+
+        try:
+            with self.reading() as conn:
+                if vacuum:
+                    conn.execute("VACUUM INTO ?", (str(partial),))
+                else:
+                    # Pin one read snapshot for every step: without it each
+                    # commit by another connection restarts the copy, and a
+                    # busy diary could keep it from ever finishing.
+                    conn.execute("BEGIN")
+                    conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+                    target = sqlite3.connect(str(partial))
+                    try:
+                        conn.backup(target, pages=max(1, pages), progress=throttle)
+                    finally:
+                        target.close()
+                        conn.rollback()
+            target = sqlite3.connect(str(partial))
+            try:
+                target.execute("PRAGMA journal_mode = DELETE")
+            finally:
+                target.close()
+            integrity = _snapshot_check(partial)
+            if integrity != "ok":
+                raise sqlite3.DatabaseError(f"snapshot failed integrity_check: {integrity}")
+            checksum = file_sha256(partial)
+            os.replace(partial, final)
+        finally:
+            partial.unlink(missing_ok=True)
+        Path(str(final) + ".sha256").write_text(f"{checksum}  {final.name}\n", encoding="utf-8")
+
+        removed = []
+        for old in list_snapshots(dest, self.path.stem)[:-keep]:
+            old.unlink(missing_ok=True)
+            Path(str(old) + ".sha256").unlink(missing_ok=True)
+            removed.append(str(old))
+        return {
+            "snapshot": str(final),
+            "method": "vacuum" if vacuum else "backup",
+            "steps": steps if not vacuum else 1,
+            "size_kb": round(final.stat().st_size / 1024, 1),
+            "sha256": checksum,
+            "integrity": integrity,
+            "seconds": round(time.perf_counter() - started, 3),
+            "removed": removed,
+        }
+
+    # reads
+
+    def get_context(self, project):
+        """The project's context row, or None."""
+        with self.reading() as conn:
+            row = conn.execute(
+                "SELECT * FROM project_context WHERE project = ?", (project,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def get_plan(self, project) -> list:
+        """The project's plan tasks in task_number order."""
+        with self.reading() as conn:
+            return [dict(r) for r in conn.execute(
+                "SELECT * FROM plans WHERE project = ? ORDER BY task_number", (project,)
+            )]
+
+    def get_sessions(self, project, limit=5, after=None, fields=None, raw=False) -> list:
+        """Newest sessions first; after=(date, id) of the last row continues the list."""
+        return [row for _, row in self.iter_sessions(project, limit, after, fields, raw)]
+
+    def iter_sessions(self, project, limit=5, after=None, fields=None, raw=False):
+        """get_sessions as (sort key, row) pairs, streamed off the cursor."""
+        fields = list(fields or SESSION_FIELDS)
+        columns = ", ".join("s." + c for c in dict.fromkeys(fields + ["date", "id"]))
+        params = {"project": project, "limit": limit}
+        where = "s.project = :project"
+        if after:
+            params["after_date"], params["after_id"] = after
+            where += " AND (s.date, s.id) < (:after_date, :after_id)"
+        join, extra = "", None
+        if raw:
+            # Only raw=True pays for reading and inflating the original markdown.
+            columns += ", b.codec, b.data"
+            join = RAW_JOIN.format(db="")
+            extra = _raw_field
+        with self.reading() as conn:
+            yield from _keyset_rows(
+                conn,
+                f"SELECT {columns} FROM sessions s {join} WHERE {where} "
+                "ORDER BY s.date DESC, s.id DESC LIMIT :limit",
+                params, fields, ("date", "id"), extra,
+            )
+
+    def get_insights(self, project, limit=None, after=None, fields=None, tags=None) -> list:
+        """The project's insights plus global ones, newest first.
+
+        tags (a list or comma-separated string) keeps insights carrying all of them.
+        """
+        return [row for _, row in self.iter_insights(project, limit, after, fields, tags)]
+
+    def iter_insights(self, project, limit=None, after=None, fields=None, tags=None):
+        """get_insights as (sort key, row) pairs, streamed off the cursor."""
+        fields = list(fields or INSIGHT_FIELDS)
+        columns = ", ".join(dict.fromkeys(fields + ["created_at", "id"]))
+        params = {"project": project}
+        page = ""
+        if after:
+            params["after_created"], params["after_id"] = after
+            page = " AND (created_at, id) < (:after_created, :after_id)"
+        for i, tag in enumerate(normalize_tags(tags)):
+            params[f"tag{i}"] = tag
+            page += f" AND id IN (SELECT insight_id FROM insight_tags WHERE tag = :tag{i})"
+        # UNION ALL rather than "project = ? OR project IS NULL": each branch walks
+        # idx_insights_project_created in order and SQLite merges them, where the
+        # OR form sorts the combined result in a temp B-tree.
+        sql = (f"SELECT {columns} FROM insights WHERE project = :project{page} "
+               f"UNION ALL "
+               f"SELECT {columns} FROM insights WHERE project IS NULL{page} "
+               f"ORDER BY created_at DESC, id DESC")
+        if limit:
+            sql += " LIMIT :limit"
+            params["limit"] = limit
+        with self.reading() as conn:
+            yield from _keyset_rows(conn, sql, params, fields, ("created_at", "id"))
+
+    def search(self, query, limit=10, project=None, after=None, mode="lexical",
+               hot_only=False, tags=None) -> list:
+        """Ranked results across sessions, insights and context (archive included).
+
+        tags restricts the results to insights carrying all of them.
+        """
+        return [row for _, row in self.search_page(query, limit, project, after, mode,
+                                                   hot_only, tags)[0]]
+
+    def search_page(self, query, limit=10, project=None, after=None, mode="lexical",
+                    hot_only=False, tags=None):
+        """One page of search as ([(sort key, result)], extra summary fields).
+
+        after is the sort key of the previous page's last result.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode {mode!r}; choose one of {SEARCH_MODES}")
+        tags = normalize_tags(tags)
+        if mode != "lexical":
+            return self._fused_page(query, limit, project, after, mode, hot_only, tags)
+        match = fts_query(query)
+        if not match:
+            return [], {}
+        with self.reading() as conn:
+            with attached_archive(conn, not hot_only, self.path) as with_archive:
+                hits = _lexical_hits(conn, match, limit, project, after, with_archive, tags)
+        return [((h["rank"], h["kind"], h["id"]), _search_result(h["kind"], row, h))
+                for h, row in hits], {}
+
+    def _fused_page(self, query, limit, project, after, mode, hot_only, tags):
+        import concurrent.futures
+
+        offset = after[0] if after else 0
+        # Both lists run deeper than the page so fused positions stay put.
+        depth = 2 * (offset + limit)
+        match = fts_query(query) if mode == "hybrid" else None
+
+        with self.reading() as conn:
+            with attached_archive(conn, not hot_only, self.path) as with_archive:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+                    # Echo chunks carry no tags, so a tag filter leaves only lexical hits.
+                    semantic = None if tags else pool.submit(_semantic_hits, query, depth)
+                    lexical = (_lexical_hits(conn, match, depth, project, None, with_archive,
+                                             tags) if match else [])
+                    chunks, semantic_error = semantic.result() if semantic else ([], None)
+
+                fused = {}  # key -> [rrf score, result, matched_by]
+                for rank, (hit, row) in enumerate(lexical, 1):
+                    key = (hit["kind"], hit["id"])
+                    result = _search_result(hit["kind"], row, hit)
+                    fused[key] = [1.0 / (RRF_K + rank), result, ["lexical"]]
+                rank = 0
+                for chunk in chunks:
+                    if project and chunk.get("project") != project:
+                        continue
+                    rank += 1
+                    found = _session_for_chunk(conn, chunk, with_archive)
+                    if found is not None:
+                        row, archived = found
+                        key = ("session", row["id"])
+                        if key not in fused:
+                            result = _search_result("session", row, {
+                                "archived": archived, "rank": 0.0,
+                                "snippet": chunk.get("content", "")[:200]})
+                            fused[key] = [0.0, result, []]
+                    else:
+                        key = ("chunk", chunk.get("source", ""), chunk.get("section_title", ""),
+                               rank)
+                        fused[key] = [0.0, _chunk_result(chunk), []]
+                    fused[key][0] += 1.0 / (RRF_K + rank)
+                    if "semantic" not in fused[key][2]:
+                        fused[key][2].append("semantic")
+
+        ranked = sorted(fused.values(), key=lambda entry: -entry[0])[offset:offset + limit]
+        items = [((position,), dict(result, score=round(score, 6), matched_by=matched_by))
+                 for position, (score, result, matched_by) in enumerate(ranked, offset + 1)]
+        extra = {"mode": mode}
+        if semantic_error:
+            extra["semantic_error"] = semantic_error
+        return items, extra
+
+    def tags(self, project=None, limit=None) -> list:
+        """Tag frequencies as [{"tag", "count"}], most used first."""
+
+        if project:
+            sql = ("SELECT t.tag, COUNT(*) AS count FROM insight_tags t "
+                   "JOIN insights i ON i.id = t.insight_id WHERE i.project = :project "
+                   "GROUP BY t.tag")
+        else:
+            sql = "SELECT tag, COUNT(*) AS count FROM insight_tags GROUP BY tag"
+        sql += " ORDER BY count DESC, tag"
+        if limit:
+            sql += " LIMIT :limit"
+        with self.reading() as conn:
+            return [dict(r) for r in conn.execute(sql, {"project": project, "limit": limit})]
+
+    def export_md(self, project, raw=False, hot_only=False) -> str:
+        """All memory for a project as markdown (raw=True: original session text)."""
+        lines = [f"# Memory Export — {project}\n"]
+        with self.reading() as conn:
+            with attached_archive(conn, not hot_only, self.path) as with_archive:
+                dbs = ["", "archive."] if with_archive else [""]
+
+                # Sessions. The original markdown is only read and inflated for raw.
+                sessions = conn.execute(" UNION ALL ".join(
+                    "SELECT s.id, s.date, s.accomplished, s.commits, s.decisions, s.next_steps"
+                    + (f", b.codec, b.data FROM {db}sessions s {RAW_JOIN.format(db=db)}" if raw
+                       else f" FROM {db}sessions s")
+                    + " WHERE s.project = :project" for db in dbs
+                ) + " ORDER BY date DESC, id DESC", {"project": project}).fetchall()
+                insights = conn.execute(" UNION ALL ".join(
+                    f"SELECT id, type, content, created_at FROM {db}insights "
+                    "WHERE project = :project" for db in dbs
+                ) + " ORDER BY created_at DESC, id DESC", {"project": project}).fetchall()
+            ctx = conn.execute(
+                "SELECT * FROM project_context WHERE project = ?", (project,)
+            ).fetchone()
+
+        if sessions:
+            lines.append("## Sessions\n")
+            for s in sessions:
+                lines.append(f"### {s['date']}")
+                original = unpack_raw(s["codec"], s["data"]) if raw else None
+                if original:
+                    lines.append(original.strip())
+                    lines.append("")
+                    continue
+                if s["accomplished"]:
+                    lines.append(f"**Accomplished:**\n{s['accomplished']}")
+                if s["commits"]:
+                    lines.append(f"**Commits:**\n{s['commits']}")
+                if s["decisions"]:
+                    lines.append(f"**Decisions:**\n{s['decisions']}")
+                if s["next_steps"]:
+                    lines.append(f"**Next Steps:**\n{s['next_steps']}")
+                lines.append("")
+
+        # Insights
+        if insights:
+            lines.append("## Insights\n")
+            for i in insights:
+                lines.append(f"- **[{i['type']}]** {i['content']}")
+            lines.append("")
+
+        # Context
+        if ctx:
+            lines.append("## Project Context\n")
+            lines.append(f"- **Status:** {ctx['status']}")
+            if ctx["current_branch"]:
+                lines.append(f"- **Current Branch:** {ctx['current_branch']}")
+            if ctx["architecture_decisions"]:
+                lines.append(f"- **Architecture Decisions:**\n{ctx['architecture_decisions']}")
+            if ctx["known_issues"]:
+                lines.append(f"- **Known Issues:**\n{ctx['known_issues']}")
+            if ctx["backlog"]:
+                lines.append(f"- **Backlog:**\n{ctx['backlog']}")
+        return "\n".join(lines)
+
+    def stats(self, recount=False) -> dict:
+        """Counts per project from stats_counters; recount=True repairs drift first."""
+        drift = None
+        if recount:
+            with self._lock:
+                drift = recount_stats(self.connection())
+        with self.reading() as conn:
+            rows = conn.execute(
+                "SELECT * FROM stats_counters ORDER BY sessions DESC, project"
+            ).fetchall()
+            projects = conn.execute("SELECT COUNT(*) FROM project_context").fetchone()[0]
+            outbox = conn.execute(
+                "SELECT status, COUNT(*) as cnt FROM bridge_outbox "
+                "WHERE status IN ('pending', 'failed') GROUP BY status"
+            ).fetchall()
+        response = {
+            "sessions": sum(r["sessions"] for r in rows),
+            "insights": sum(r["insights"] for r in rows),
+            "projects": projects,
+            "plan_tasks": sum(r["plan_tasks"] for r in rows),
+            "open_tasks": sum(r["open_tasks"] for r in rows),
+            "sessions_by_project": {r["project"]: r["sessions"] for r in rows if r["sessions"]},
+            "activity_by_project": {
+                r["project"]: {"last_session_date": r["last_session_date"],
+                               "last_activity": r["last_activity"],
+                               "open_tasks": r["open_tasks"]}
+                for r in rows if r["project"]
+            },
+            "bridge_outbox": {r["status"]: r["cnt"] for r in outbox},
+            "db_path": str(self.path),
+            "db_size_kb": round(self.path.stat().st_size / 1024, 1) if self.path.exists() else 0,
+        }
+        if drift is not None:
+            response["recount"] = {"drift": drift, "repaired": len(drift)}
+        return response
+
+
+@contextlib.contextmanager
+def _database():
+    """The daemon's shared MemStackDB, or a fresh one closed after the command."""
+    if _shared_db is not None:
+        yield _shared_db
+        return
+    db = MemStackDB()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def cmd_get_sessions(args):
+    """Get recent sessions for a project."""
+    fields = parse_fields(args.fields, SESSION_FIELDS)
+    after = decode_cursor("get-sessions", args.after) if args.after else None
+    with _database() as db:
+        rows = db.iter_sessions(args.project, args.limit or 5, after, fields, args.raw)
+        emit_rows("sessions", rows, args, "get-sessions")
+
+
+@cached_result
+def cmd_get_insights(args):
+    """Get insights for a project (plus global ones)."""
+    fields = parse_fields(args.fields, INSIGHT_FIELDS)
+    after = decode_cursor("get-insights", args.after) if args.after else None
+    with _database() as db:
+        rows = db.iter_insights(args.project, args.limit, after, fields,
+                                getattr(args, "tag", None))
+        emit_rows("insights", rows, args, "get-insights")
+
+
+@cached_result
+def cmd_get_context(args):
+    """Get project context."""
+    with _database() as db:
+        context = db.get_context(args.project)
+    print(json.dumps(context or {"project": args.project, "status": "no context saved"}))
+
+
+@cached_result
+def cmd_tags(args):
+    """List insight tags by how many insights carry them."""
+    with _database() as db:
+        tags = db.tags(args.project, args.limit)
+    print(json.dumps({"tags": tags, "count": len(tags)}))
+
+
+@retry_on_lock
+def cmd_set_context(args):
+    """Upsert project context."""
+    data = parse_json_arg(args.json)
+    require_fields(data, "project")
+    with _database() as db:
+        db.set_context(data)
+    print(json.dumps({"ok": True, "project": data["project"]}))
+
+
+@retry_on_lock
+def cmd_add_plan_task(args):
+    """Add a task to a project plan."""
+    data = parse_json_arg(args.json)
+    require_fields(data, "project", "task_number", "description")
+    with _database() as db:
+        db.add_plan_task(data)
+    print(json.dumps({"ok": True}))
+
+
+@cached_result
+def cmd_get_plan(args):
+    """Get all plan tasks for a project."""
+    with _database() as db:
+        tasks = db.get_plan(args.project)
+    done = sum(1 for t in tasks if t["status"] == "completed")
+    print(json.dumps({"project": args.project, "tasks": tasks, "done": done, "total": len(tasks)}))
+
+
+@retry_on_lock
+def cmd_update_task(args):
+    """Update a plan task's status."""
+    data = parse_json_arg(args.json)
+    require_fields(data, "project", "task_number", "status")
+    with _database() as db:
+        found = db.update_task(data)
+    if not found:
+        print(json.dumps({"ok": False, "error": f"Task not found: {data['project']} #{data['task_number']}"}))
+    else:
+        print(json.dumps({"ok": True}))
+
+
+# kind -> (table, required fields, row builder, statement)
+INGEST_KINDS = {
+    "sessions": ("sessions", ("project",), session_params, SESSION_WRITE_SQL),
+    "insights": ("insights", ("content",), insight_params, INSIGHT_INSERT_SQL),
+    "plan-tasks": (
+        "plans", ("project", "task_number", "description"), plan_task_params, PLAN_TASK_UPSERT_SQL
+    ),
+}
+
+
+def _insert_chunk(conn, sql, chunk) -> list:
+    """executemany one chunk in the open transaction; on failure, isolate bad lines.
+
+    ``sql`` is one statement or a tuple run in order with the same params.
+    """
+    statements = (sql,) if isinstance(sql, str) else sql
+    conn.execute("SAVEPOINT ingest_chunk")
+    try:
+        for statement in statements:
+            conn.executemany(statement, [params for _, params in chunk])
+        conn.execute("RELEASE ingest_chunk")
+        return []
+    except sqlite3.Error:
+        conn.execute("ROLLBACK TO ingest_chunk")
+        conn.execute("RELEASE ingest_chunk")
+    errors = []
+    for line_no, params in chunk:
+        conn.execute("SAVEPOINT ingest_row")
+        try:
+            for statement in statements:
+                conn.execute(statement, params)
+        except sqlite3.Error as exc:
+            conn.execute("ROLLBACK TO ingest_row")
+            errors.append({"line": line_no, "error": str(exc)})
+        conn.execute("RELEASE ingest_row")
+    return errors
+
+
+def cmd_ingest(args):
+    """Bulk-load NDJSON records, one transaction per chunk.
+
+    A chunk that meets a lock is retried on its own, like any write command;
+    the input cannot be re-read, so the command as a whole never is.
+    """
+    table, required, build, sql = INGEST_KINDS[args.kind]
+    chunk_size = max(1, args.chunk_size)
+    try:
+        source = sys.stdin if args.file in (None, "-") else open(args.file, encoding="utf-8")
+    except OSError as exc:
+        print(json.dumps({"ok": False, "error": f"Cannot read {args.file}: {exc.strerror}"}))
+        sys.exit(1)
+
+    bridge = table == "insights" and bridge_disabled_reason() is None
+    cwd = _safe_cwd()
+    conn = get_db()
+    written, chunks, errors, queued = 0, 0, [], 0
+
+    def write(chunk):
+        with write_transaction(conn):
+            before = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+            failed = _insert_chunk(conn, sql, chunk)
+            if table == "insights":
+                index_new_insights(conn, before)
+            mirrored = 0
+            if bridge:
+                # Rows this chunk added are exactly id > before: the write lock is
+                # held. Queue their mirrors in the same transaction.
+                mirrored = conn.execute(
+                    """INSERT OR IGNORE INTO bridge_outbox (insight_id, idempotency_key, cwd)
+                       SELECT id, 'memstack-insight:' || id || ':' || created_at, ?
+                       FROM insights WHERE id > ? AND type IN ({})""".format(
+                        ",".join("?" * len(BRIDGED_TYPES))),
+                    (cwd, before, *sorted(BRIDGED_TYPES)),
+                ).rowcount
+        return failed, mirrored
+
+    def flush(chunk):
+        nonlocal written, chunks, queued
+        try:
+            failed, mirrored = call_with_lock_retry(lambda: write(chunk))
+        except sqlite3.OperationalError as exc:
+            if not is_lock_error(exc):
+                raise
+            # Earlier chunks are committed; say how far the load got.
+            print(json.dumps({"ok": False, "kind": args.kind, "written": written,
+                              "chunks": chunks, "error": str(exc)}))
+            sys.exit(1)
+        errors.extend(failed)
+        written += len(chunk) - len(failed)
+        chunks += 1
+        queued += mirrored
+
+    chunk = []
+    with source:
+        for line_no, line in enumerate(source, 1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError as exc:
+                errors.append({"line": line_no, "error": f"Invalid JSON: {exc}"})
+                continue
+            if not isinstance(data, dict):
+                errors.append({"line": line_no, "error": "Expected a JSON object"})
+                continue
+            missing = missing_field(data, *required)
+            if missing is not None:
+                errors.append({"line": line_no, "error": f"Missing required field: {missing}"})
+                continue
+            chunk.append((line_no, build(data)))
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
+    conn.close()
+
+    errors.sort(key=lambda e: e["line"])
+    response = {
+        "ok": not errors,
+        "kind": args.kind,
+        "written": written,
+        "chunks": chunks,
+        "error_count": len(errors),
+        "errors": errors,
+    }
+    if queued:
+        response["bridge_queued"] = queued
+        response.update(kick_drain())
+    print(json.dumps(response))
+    if errors:
+        sys.exit(1)
+
+
+@retry_on_lock
+def cmd_dedupe(args):
+    """Collapse stored near-duplicate insights into their oldest copy."""
+    with _database() as db:
+        result = db.dedupe(args.project, args.threshold, args.dry_run)
+    print(json.dumps({"ok": True, "dry_run": args.dry_run, **result}))
+
+
+@retry_on_lock
+def cmd_bridge_drain(args):
+    """Mirror queued procedural insights into the skill-loader's memory."""
+    with _database() as db:
+        summary = db.drain_bridge(limit=args.limit, max_attempts=args.max_attempts)
+    print(json.dumps(dict(summary, ok=True)))
+
+
+def cmd_export_md(args):
+    """Export all memory for a project as markdown."""
+    with _database() as db:
+        text = db.export_md(args.project, raw=getattr(args, "raw", False),
+                            hot_only=getattr(args, "hot_only", False))
+    print(text)
+
+
+def recount_stats(conn) -> list:
+    """Rebuild stats_counters from the base tables; return the rows that drifted."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        stored = {r[0]: tuple(r) for r in conn.execute(
+            f"SELECT {', '.join(STATS_COUNTER_COLUMNS)} FROM stats_counters")}
+        actual = {r[0]: tuple(r) for r in conn.execute(STATS_RECOUNT_SELECT)}
+        drift = []
+        for project in sorted(stored.keys() | actual.keys()):
+            was, now = stored.get(project), actual.get(project)
+            if was != now:
+                drift.append({
+                    "project": project,
+                    "stored": dict(zip(STATS_COUNTER_COLUMNS[1:], was[1:])) if was else None,
+                    "actual": dict(zip(STATS_COUNTER_COLUMNS[1:], now[1:])) if now else None,
+                })
+        if drift:
+            conn.execute("DELETE FROM stats_counters")
+            conn.executemany(
+                f"INSERT INTO stats_counters ({', '.join(STATS_COUNTER_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(STATS_COUNTER_COLUMNS))})",
+                actual.values(),
+            )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return drift
+
+
+def cmd_stats(args):
+    """Show database statistics."""
+    with _database() as db:
+        response = db.stats(recount=getattr(args, "recount", False))
+    response["result_cache"] = cache_stats()
+    print(json.dumps(response))
+
+
+def _add_paging_args(p, fields):
+    p.add_argument("--after", default=None, help="next_cursor from the previous page")
+    p.add_argument("--fields", default=None, help="comma-separated subset of: " + ",".join(fields))
+    p.add_argument("--ndjson", action="store_true", help="one row per line, then a summary line")
+
+
+def positive_int(text) -> int:
+    """argparse type for counts that must be at least 1."""
+    try:
+        value = int(text)
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"expected a whole number of at least 1, not {text!r}")
+    return value
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="MemStack SQLite Memory Backend")
+    sub = parser.add_subparsers(dest="command")
+
+    sub.add_parser("init")
+
+    p = sub.add_parser("add-session")
+    p.add_argument("json")
+
+    p = sub.add_parser("add-insight")
+    p.add_argument("json")
+    p.add_argument("--on-duplicate", choices=DUPLICATE_ACTIONS, default="merge",
+                   help="near-duplicate of a stored insight: merge into it (default), "
+                        "reject it, or keep both")
+
+    p = sub.add_parser("search")
+    p.add_argument("query", help='terms are ANDed; "exact phrase" and prefix* are supported')
+    p.add_argument("--project", default=None)
+    p.add_argument("--limit", type=int, default=10)
+    p.add_argument("--hot-only", action="store_true", help="skip the archive database")
+    p.add_argument("--mode", choices=SEARCH_MODES, default="lexical",
+                   help="hybrid fuses FTS with the echo vector index (reciprocal-rank fusion)")
+    p.add_argument("--tag", action="append", default=None,
+                   help="only insights with this tag (repeatable: all must match)")
+    _add_paging_args(p, SEARCH_FIELDS)
+
+    p = sub.add_parser("get-sessions")
+    p.add_argument("project")
+    p.add_argument("--limit", type=int, default=5)
+    _add_paging_args(p, SESSION_FIELDS)
+    p.add_argument("--raw", action="store_true", help="include each session's raw_markdown")
+
+    p = sub.add_parser("get-insights")
+    p.add_argument("project")
+    p.add_argument("--limit", type=int, default=None, help="page size (default: all)")
+    p.add_argument("--tag", action="append", default=None,
+                   help="only insights with this tag (repeatable: all must match)")
+    _add_paging_args(p, INSIGHT_FIELDS)
+
+    p = sub.add_parser("tags", help="Insight tags by frequency")
+    p.add_argument("--project", default=None, help="count one project's insights only")
+    p.add_argument("--limit", type=int, default=None)
+
+    p = sub.add_parser("get-context")
+    p.add_argument("project")
+
+    p = sub.add_parser("set-context")
+    p.add_argument("json")
+
+    p = sub.add_parser("add-plan-task")
+    p.add_argument("json")
+
+    p = sub.add_parser("get-plan")
+    p.add_argument("project")
+
+    p = sub.add_parser("update-task")
+    p.add_argument("json")
+
+    p = sub.add_parser("export-md")
+    p.add_argument("project")
+    p.add_argument("--raw", action="store_true",
+                   help="export each session's original markdown where it was saved")
+    p.add_argument("--hot-only", action="store_true", help="skip the archive database")
+
+    p = sub.add_parser("archive", help="Move old sessions and insights to memstack-archive.db")
+    p.add_argument("--older-than", required=True, help="90d, 26w, 6m, 2y or YYYY-MM-DD")
+    p.add_argument("--dry-run", action="store_true", help="count what would move")
+    p.add_argument("--vacuum", action="store_true", help="VACUUM the hot database afterwards")
+
+    p = sub.add_parser("backup", help="Online snapshot into db/backups/, verified and rotated")
+    p.add_argument("--dest", default=None, help="snapshot directory (default: db/backups)")
+    p.add_argument("--vacuum", action="store_true", help="compacted copy via VACUUM INTO")
+    p.add_argument("--pages", type=int, default=BACKUP_PAGES, help="pages per backup step")
+    p.add_argument("--sleep-ms", type=int, default=BACKUP_SLEEP_MS,
+                   help="pause between steps so writers get the file")
+    p.add_argument("--keep", type=positive_int, default=None,
+                   help=f"snapshots to keep (default: db.backup_keep, {DEFAULT_BACKUP_KEEP})")
+    p.add_argument("--verify", action="store_true",
+                   help="re-check every snapshot's checksum and integrity instead")
+
+    p = sub.add_parser("stats")
+    p.add_argument("--recount", action="store_true",
+                   help="rebuild the counters from the tables and report drift")
+
+    p = sub.add_parser("ingest", help="Bulk-load NDJSON (one JSON object per line)")
+    p.add_argument("kind", choices=sorted(INGEST_KINDS))
+    p.add_argument("--file", default="-", help="NDJSON file (default: stdin)")
+    p.add_argument("--chunk-size", type=int, default=500, help="rows per transaction")
+
+    p = sub.add_parser("dedupe", help="Merge stored near-duplicate insights")
+    p.add_argument("--project", default=None)
+    p.add_argument("--threshold", type=float, default=None,
+                   help=f"estimated similarity to merge at (default: db.dedupe_threshold, "
+                        f"{DEFAULT_DEDUPE_THRESHOLD})")
+    p.add_argument("--dry-run", action="store_true", help="list the pairs, change nothing")
+
+    p = sub.add_parser("bridge-drain")
+    p.add_argument("--limit", type=int, default=200, help="max outbox rows this run")
+    p.add_argument("--max-attempts", type=int, default=OUTBOX_MAX_ATTEMPTS)
+
+    p = sub.add_parser("watch", help="Sync memory/sessions and memory/plans as they change")
+    p.add_argument("--memory-dir", default=None, help="memory directory (default: memory/ beside db/)")
+    p.add_argument("--backend", choices=WATCH_BACKENDS, default="auto",
+                   help="inotify (Linux) or stat polling; auto prefers inotify")
+    p.add_argument("--debounce", type=float, default=DEFAULT_WATCH_DEBOUNCE,
+                   help="seconds of quiet before a burst of changes is synced")
+    p.add_argument("--interval", type=float, default=DEFAULT_WATCH_INTERVAL,
+                   help="seconds between polls while idle")
+    p.add_argument("--no-vectors", action="store_true", help="update SQLite only")
+    p.add_argument("--provider", choices=("local", "openai"), default=None,
+                   help="embedding provider for the vector index")
+
+    p = sub.add_parser("serve")
+    p.add_argument("--socket", default=None, help="Unix socket path (default: db/memstack.sock)")
+    p.add_argument("--drain-interval", type=float, default=30.0,
+                   help="seconds between bridge-outbox drains (0 disables)")
+
+    return parser
+
+
+# ── daemon ────────────────────────────────────────────────────────────────────
+#
+# `serve` keeps one process and one shared MemStackDB alive behind a Unix socket.
+# The wire format is JSON lines: a request is {"command": <name>, ...} with the
+# same argument names the CLI uses (JSON-argument commands take "json" as an
+# object or a string); the reply is {"exit": <code>, "output": <stdout text>},
+# i.e. exactly what the in-process command would have printed.
+#
+# db/memstack-db.py, the thin client, sends the command line itself instead:
+# {"argv": [...]} is parsed with the CLI's own parser. Requests it cannot
+# parse (usage errors, --help), LOCAL_COMMANDS and --ndjson are declined.
+#
+# A request may carry the client's working directory ("cwd"), which bridge
+# rows record for project resolution, the database its client would open
+# ("db") and its MEMSTACK_* environment ("env"). A daemon serving a different
+# file, or running with different REQUEST_ENV settings, answers
+# {"decline": <reason>} and runs nothing, and the client falls back to
+# running the command itself.
+
+# Environment a command reads while it runs: the bridge guard and drain mode,
+# the connection profile and the busy timeout. A forwarded command would see
+# the daemon's values, so a client whose values differ is declined.
+REQUEST_ENV = ("MEMSTACK_DB_PATH", "MEMSTACK_BRIDGE_DRAIN", "MEMSTACK_DB_PROFILE",
+               "MEMSTACK_BUSY_TIMEOUT_MS")
+
+
+def _decline_reason(client_db, client_env):
+    """Why this daemon must not run a client's request, or None."""
+    if client_db and Path(client_db).resolve() != Path(DB_PATH).resolve():
+        return f"This daemon serves {DB_PATH}, not {client_db}"
+    if isinstance(client_env, dict):
+        differ = [name for name in REQUEST_ENV if client_env.get(name) != os.environ.get(name)]
+        if differ:
+            return "This daemon runs with different " + ", ".join(differ)
+    return None
+
+
+def _error_reply(message) -> dict:
+    return {"exit": 1, "output": json.dumps({"ok": False, "error": message}) + "\n"}
+
+
+def _decline(reason) -> dict:
+    return {**_error_reply(reason), "decline": reason}
+
+
+def _command_defaults(parser) -> dict:
+    """Per-command argument defaults, so a request may omit optional fields."""
+    defaults = {}
+    for action in parser._actions:
+        if isinstance(action, argparse._SubParsersAction):
+            for name, sub in action.choices.items():
+                defaults[name] = {
+                    a.dest: a.default for a in sub._actions if a.dest != "help"
+                }
+    return defaults
+
+
+def run_command(args, cwd=None) -> tuple:
+    """Run one command in-process, returning (exit_code, captured_stdout).
+
+    ``cwd`` is the client's working directory, recorded on queued bridge rows.
+    """
+    global _client_cwd
+    buf = io.StringIO()
+    code = 0
+    _client_cwd = cwd
+    with contextlib.redirect_stdout(buf):
+        try:
+            COMMANDS[args.command](args)
+        except SystemExit as exc:
+            code = exc.code if isinstance(exc.code, int) else 1
+        except Exception as exc:
+            print(json.dumps({"ok": False, "error": f"{type(exc).__name__}: {exc}"}))
+            code = 1
+        finally:
+            _client_cwd = None
+    return code, buf.getvalue()
+
+
+class CommandDispatcher:
+    """Turns request lines into replies. Requests are serialized on one shared MemStackDB."""
+
+    def __init__(self):
+        self.parser = build_parser()
+        self.defaults = _command_defaults(self.parser)
+        self.lock = threading.Lock()
+
+    def dispatch(self, line: bytes) -> dict:
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict) or not ("command" in request or "argv" in request):
+                raise ValueError
+        except ValueError:
+            return _error_reply('Request must be a JSON object with a "command" or an "argv"')
+        cwd = request.pop("cwd", None)
+        reason = _decline_reason(request.pop("db", None), request.pop("env", None))
+        if reason:
+            return _decline(reason)
+        with self.lock:
+            if "argv" in request:
+                args = self._parse(request["argv"])
+                if args is None:  # usage errors and --help print from the client
+                    return _decline("argv is not a runnable command")
+            else:
+                command = request.pop("command")
+                if command not in self.defaults:
+                    return _error_reply(f"Unknown command: {command}")
+                fields = dict(self.defaults[command])
+                fields.update(request)
+                args = argparse.Namespace(command=command, **fields)
+            # The reply carries a command's whole output, so --ndjson (which
+            # streams) runs in the client, as do LOCAL_COMMANDS.
+            if args.command in LOCAL_COMMANDS or getattr(args, "ndjson", False):
+                return _decline(f"{args.command} runs in the calling process")
+            code, output = run_command(args, cwd)
+        return {"exit": code, "output": output}
+
+    def _parse(self, argv):
+        """argv -> Namespace with the CLI's own parser; None when it would exit."""
+        if not isinstance(argv, list) or not all(isinstance(a, str) for a in argv):
+            return None
+        sink = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(sink), contextlib.redirect_stderr(sink):
+                args = self.parser.parse_args(argv)
+        except SystemExit:
+            return None
+        return args if args.command else None
+
+
+def make_server(socket_path):
+    """A threaded JSON-lines server on socket_path, dispatching with CommandDispatcher.
+
+    socketserver is imported here, not at module level: only `serve` needs it.
+    """
+    import socketserver
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                reply = self.server.dispatch(line)
+                self.wfile.write((json.dumps(reply) + "\n").encode("utf-8"))
+                self.wfile.flush()
+
+    class MemStackServer(CommandDispatcher, socketserver.ThreadingMixIn,
+                         socketserver.UnixStreamServer):
+        daemon_threads = True
+
+        def __init__(self, path):
+            CommandDispatcher.__init__(self)
+            socketserver.UnixStreamServer.__init__(self, str(path), RequestHandler)
+
+    return MemStackServer(socket_path)
+
+
+def _socket_is_live(path) -> bool:
+    import socket
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(str(path))
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+
+class _DrainThread(threading.Thread):
+    """Drains the bridge outbox every ``interval`` seconds or when woken."""
+
+    def __init__(self, conn, interval):
+        super().__init__(name="memstack-bridge-drain", daemon=True)
+        self.conn = conn
+        self.interval = interval
+        self.wakeup = threading.Event()
+        self._stopping = False
+
+    def run(self):
+        while not self._stopping:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            if self._stopping:
+                break
+            try:
+                drain_outbox(self.conn)
+            except Exception as exc:  # keep serving; the rows stay queued
+                print(json.dumps({"ok": False, "bridge_drain_error": str(exc)}),
+                      file=sys.stderr, flush=True)
+
+    def stop(self):
+        self._stopping = True
+        self.wakeup.set()
+        self.join(timeout=5)
+        self.conn.close()
+
+
+def _start_drain_thread(conn, interval):
+    thread = _DrainThread(conn, interval)
+    thread.start()
+    return thread
+
+
+def cmd_serve(args):
+    """Run the JSON-lines daemon until interrupted."""
+    global _shared_db, _drain_wakeup
+    import signal
+    import socket
+
+    if not hasattr(socket, "AF_UNIX"):
+        print(json.dumps({"ok": False, "error": "serve needs Unix domain sockets"}))
+        sys.exit(1)
+    path = Path(args.socket) if args.socket else SOCKET_PATH
+    if path.exists():
+        if _socket_is_live(path):
+            print(json.dumps({"ok": False, "error": f"A daemon is already serving {path}"}))
+            sys.exit(1)
+        path.unlink()  # stale socket left by a daemon that did not exit cleanly
+
+    drainer = None
+    if args.drain_interval > 0:
+        # The drain gets its own connection: a slow loader must not hold the
+        # request lock, and WAL lets it write alongside the shared one.
+        drainer = _start_drain_thread(get_db(check_same_thread=False), args.drain_interval)
+        _drain_wakeup = drainer.wakeup
+    _shared_db = MemStackDB()
+    _shared_db.connection()  # create or migrate before the first request
+    old_umask = os.umask(0o077)  # the socket grants write access to the DB: owner only
+    try:
+        server = make_server(path)
+    finally:
+        os.umask(old_umask)
+    print(json.dumps({"ok": True, "socket": str(path), "db": str(DB_PATH)}), flush=True)
+    # SIGTERM unwinds like Ctrl-C so the socket file is removed on the way out.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        path.unlink(missing_ok=True)
+        _shared_db.close()
+        _shared_db = None
+        if drainer is not None:
+            drainer.stop()
+            _drain_wakeup = None
+
+
+def daemon_request(request: dict, socket_path=None):
+    """Send one request to a running daemon; None when no daemon is reachable."""
+    import socket
+
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    path = Path(socket_path) if socket_path else SOCKET_PATH
+    if not path.exists():
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(0.5)
+        sock.connect(str(path))
+    except OSError:
+        sock.close()
+        return None
+    # Connected: from here a failure is reported, never retried in-process,
+    # because the daemon may already have applied a write.
+    with sock:
+        sock.settimeout(None)
+        sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        with sock.makefile("rb") as reader:
+            line = reader.readline()
+    if not line:
+        return {"exit": 1, "output": json.dumps(
+            {"ok": False, "error": "memstack daemon closed the connection"}) + "\n"}
+    reply = json.loads(line)
+    if "decline" in reply:
+        return None  # the daemon cannot run it as this client would: nothing ran there
+    return reply
+
+
+COMMANDS = {
+    "init": cmd_init,
+    "add-session": cmd_add_session,
+    "add-insight": cmd_add_insight,
+    "search": cmd_search,
+    "get-sessions": cmd_get_sessions,
+    "get-insights": cmd_get_insights,
+    "tags": cmd_tags,
+    "get-context": cmd_get_context,
+    "set-context": cmd_set_context,
+    "add-plan-task": cmd_add_plan_task,
+    "get-plan": cmd_get_plan,
+    "update-task": cmd_update_task,
+    "export-md": cmd_export_md,
+    "stats": cmd_stats,
+    "ingest": cmd_ingest,
+    "archive": cmd_archive,
+    "backup": cmd_backup,
+    "bridge-drain": cmd_bridge_drain,
+    "dedupe": cmd_dedupe,
+    "serve": cmd_serve,
+    "watch": cmd_watch,
+}
+
+# Commands that never go through the daemon: serve itself; ingest, whose
+# input is this process's stdin or a path relative to this process's cwd;
+# archive, backup and dedupe, which run long enough that they must not hold
+# the daemon's request lock (backup's --dest is relative to this cwd, too);
+# and watch, which never returns.
+LOCAL_COMMANDS = frozenset({"serve", "ingest", "archive", "backup", "dedupe", "watch"})
+
+
+def main(argv=None):
+    """Run one command in this process.
+
+    db/memstack-db.py has already offered it to a running daemon; see there.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.command:
+        parser.print_help()
+        sys.exit(1)
+    COMMANDS[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,114 +2,123 @@
 """
 MemStack Migration — Import existing markdown memory into SQLite.
 
-Reads memory/sessions/*.md and imports structured data into the database.
-Safe to run multiple times (uses INSERT OR IGNORE pattern via date+project uniqueness).
+Reads memory/sessions/*.md and memory/sessions/archive/*.md and imports
+structured data into the database. Files are parsed in a process pool and
+written in one transaction with executemany. Safe to run multiple times:
+imported sessions are unique per (project, date) (INSERT OR IGNORE), and a
+day the diary already wrote with add-session, or that was archived, is left alone.
+
+The import_manifest table records size, mtime and hash per file. A re-run
+skips files whose size and mtime match without opening them; an edited file
+updates the session it imported (and adds any new decisions) instead of
+being reported as existing forever.
+
+Usage:
+  python db/migrate.py                 # one worker per CPU
+  python db/migrate.py --workers 1     # parse in this process
 """
 
+import argparse
+import hashlib
 import json
+import os
 import re
-import sqlite3
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-ROOT = Path(__file__).parent.parent
-DB_PATH = ROOT / "db" / "memstack.db"
-SESSIONS_DIR = ROOT / "memory" / "sessions"
-ARCHIVE_DIR = SESSIONS_DIR / "archive"
-
-
-def get_db():
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode = WAL")
-    conn.execute("PRAGMA foreign_keys = ON")
-    return conn
-
-
-def parse_section(text, header):
-    """Extract content under a ## header until the next ## or end of text."""
-    pattern = rf"^##\s+{re.escape(header)}\s*\n(.*?)(?=^##\s|\Z)"
-    match = re.search(pattern, text, re.MULTILINE | re.DOTALL)
-    if match:
-        return match.group(1).strip()
-    return ""
+sys.path.insert(0, str(Path(__file__).resolve().parent))
 
+import memstack_db  # noqa: E402  (schema, migrations and row writers)
+from markdown_sections import iter_sections, section_bodies  # noqa: E402
 
-def parse_session_file(filepath):
+ROOT = Path(__file__).parent.parent
+DB_PATH = memstack_db.DB_PATH
+MEMORY_DIR = ROOT / "memory"
+CONFIG_PATH = ROOT / "config.json"
+FORMAT_FILES = ("session-format.md", "main-memory-format.md")
+# Below this many files, starting worker processes costs more than it saves.
+POOL_MIN_FILES = 32
+
+# The (project, date) key only covers imported rows, so the statement itself
+# also skips a day the diary wrote directly (source IS NULL) or archived.
+IMPORT_SESSION_SQL = """INSERT OR IGNORE INTO sessions (project, date, accomplished, files_changed,
+    commits, decisions, problems, next_steps, duration, raw_hash, source)
+    SELECT :project, :date, :accomplished, :files_changed, :commits,
+    :decisions, :problems, :next_steps, :duration, :raw_hash, :source
+    WHERE NOT EXISTS (SELECT 1 FROM main.sessions
+                      WHERE project = :project AND date = :date AND source IS NULL){archived}"""
+ARCHIVED_CLAUSE = """
+    AND NOT EXISTS (SELECT 1 FROM archive.sessions WHERE project = :project AND date = :date)"""
+
+# An edited diary rewrites the session it imported; raw_blobs_gc_au drops the old blob.
+UPDATE_SESSION_SQL = """UPDATE sessions SET accomplished = :accomplished,
+    files_changed = :files_changed, commits = :commits, decisions = :decisions,
+    problems = :problems, next_steps = :next_steps, duration = :duration, raw_hash = :raw_hash
+    WHERE project = :project AND date = :date AND source = :source"""
+
+IMPORT_INSIGHT_SQL = """INSERT INTO insights (project, type, content, context, tags)
+    VALUES (:project, :type, :content, :context, :tags)"""
+
+MANIFEST_UPSERT_SQL = """INSERT INTO import_manifest (path, size, mtime_ns, hash)
+    VALUES (:path, :size, :mtime_ns, :hash)
+    ON CONFLICT(path) DO UPDATE SET size = :size, mtime_ns = :mtime_ns, hash = :hash,
+    imported_at = datetime('now')"""
+
+
+# Session fields and the "## " heading each is read from.
+SECTION_FIELDS = {
+    "accomplished": "Accomplished",
+    "files_changed": "Files Changed",
+    "commits": "Commits",
+    "decisions": "Decisions",
+    "problems": "Problems and Solutions",
+    "next_steps": "Next Steps",
+}
+_SUB_SESSION_RE = re.compile(r"Session \d+:")
+
+
+def read_session_file(filepath):
+    """(sha256 of the file, parsed entries) for one session markdown file."""
+    data = Path(filepath).read_bytes()
+    return hashlib.sha256(data).hexdigest(), parse_session_file(filepath, data.decode("utf-8"))
+
+
+def parse_session_file(filepath, text=None):
     """Parse a session markdown file into structured entries."""
-    text = filepath.read_text(encoding="utf-8")
+    if text is None:
+        text = filepath.read_text(encoding="utf-8")
     filename = filepath.stem  # e.g., "2026-02-19-docstack"
 
     # Extract date and project from filename
     match = re.match(r"(\d{4}-\d{2}-\d{2})-(.+)", filename)
     if not match:
-        print(f"  SKIP: {filename} (doesn't match date-project pattern)")
-        return []
+        return []  # not a date-project diary
 
     date = match.group(1)
     project = match.group(2)
 
-    entries = []
-
-    # Check for multi-session format (Session 2:, Session 3:, etc.)
-    # Split on "## Session N:" headers
-    session_splits = re.split(r"^(## Session \d+:.*?)$", text, flags=re.MULTILINE)
-
-    if len(session_splits) > 1:
-        # Multi-session file: first part is Session 1 (no explicit header)
-        base_entry = {
-            "project": project,
-            "date": date,
-            "accomplished": parse_section(text, "Accomplished"),
-            "files_changed": parse_section(text, "Files Changed"),
-            "commits": parse_section(text, "Commits"),
-            "decisions": parse_section(text, "Decisions"),
-            "problems": parse_section(text, "Problems and Solutions"),
-            "next_steps": parse_section(text, "Next Steps"),
-            "duration": "",
-            "raw_markdown": text,
-        }
-        entries.append(base_entry)
-
-        # Parse sub-sessions
-        for i in range(1, len(session_splits), 2):
-            sub_header = session_splits[i]
-            sub_body = session_splits[i + 1] if i + 1 < len(session_splits) else ""
-            sub_text = sub_header + "\n" + sub_body
-
-            sub_entry = {
-                "project": project,
-                "date": date,
-                "accomplished": parse_section(sub_text, "Accomplished"),
-                "files_changed": parse_section(sub_text, "Files Changed"),
-                "commits": "",
-                "decisions": "",
-                "problems": "",
-                "next_steps": "",
-                "duration": "",
-                "raw_markdown": "",  # Only store full markdown on the first entry
-            }
-            # Merge sub-session accomplishments into the base entry
-            if sub_entry["accomplished"]:
-                base_entry["accomplished"] += "\n" + sub_entry["accomplished"]
-            if sub_entry["files_changed"]:
-                base_entry["files_changed"] += "\n" + sub_entry["files_changed"]
-    else:
-        # Single-session file
-        entries.append({
-            "project": project,
-            "date": date,
-            "accomplished": parse_section(text, "Accomplished"),
-            "files_changed": parse_section(text, "Files Changed"),
-            "commits": parse_section(text, "Commits"),
-            "decisions": parse_section(text, "Decisions"),
-            "problems": parse_section(text, "Problems and Solutions"),
-            "next_steps": parse_section(text, "Next Steps"),
-            "duration": "",
-            "raw_markdown": text,
-        })
-
-    return entries
+    sections = list(iter_sections(text))
+    bodies = section_bodies(sections)
+    entry = {
+        "project": project,
+        "date": date,
+        **{field: bodies.get(header, "") for field, header in SECTION_FIELDS.items()},
+        "duration": "",
+        "raw_markdown": text,
+    }
+
+    # Multi-session file: "## Session N:" headings open sessions 2, 3, ...,
+    # whose accomplishments and changed files are merged into the one entry.
+    starts = [i for i, section in enumerate(sections)
+              if section["level"] == 2 and _SUB_SESSION_RE.match(section["title"])]
+    for start, end in zip(starts, starts[1:] + [len(sections)]):
+        sub = section_bodies(sections[start:end])
+        for field in ("accomplished", "files_changed"):
+            if sub.get(SECTION_FIELDS[field]):
+                entry[field] += "\n" + sub[SECTION_FIELDS[field]]
+
+    return [entry]
 
 
 def extract_insights(entries):
@@ -132,143 +141,186 @@ def extract_insights(entries):
     return insights
 
 
-def migrate():
-    if not DB_PATH.exists():
+def session_files(memory_dir=MEMORY_DIR):
+    """Diary files to import: sessions first, then the archive, each sorted."""
+    sessions_dir = Path(memory_dir) / "sessions"
+    files = []
+    if sessions_dir.exists():
+        files += [p for p in sorted(sessions_dir.glob("*.md")) if p.name not in FORMAT_FILES]
+    if (sessions_dir / "archive").exists():
+        files += sorted((sessions_dir / "archive").glob("*.md"))
+    return files
+
+
+def changed_files(conn, files, memory_dir=MEMORY_DIR) -> tuple:
+    """Split files on the manifest: ([(path, manifest entry) to read], unchanged count).
+
+    Only stat() is called. known_hash is None for a file the manifest has not
+    seen; a file that vanished since it was listed is left out.
+    """
+    manifest = {row[0]: row[1:] for row in conn.execute(
+        "SELECT path, size, mtime_ns, hash FROM import_manifest")}
+    changed, unchanged = [], 0
+    for path in files:
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            continue
+        entry = {"path": path.relative_to(memory_dir).as_posix(),
+                 "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        known = manifest.get(entry["path"])
+        if known and known[:2] == (entry["size"], entry["mtime_ns"]):
+            unchanged += 1
+            continue
+        changed.append((path, {**entry, "known_hash": known[2] if known else None}))
+    return changed, unchanged
+
+
+def parse_files(files, workers=None):
+    """read_session_file() over files, in order, fanned out across processes."""
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(files) < POOL_MIN_FILES:
+        return [read_session_file(path) for path in files]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunksize = max(1, len(files) // (workers * 4))
+        return list(pool.map(read_session_file, files, chunksize=chunksize))
+
+
+def import_sessions(conn, rows, archived=False) -> dict:
+    """Write session rows in the open transaction; return what changed.
+
+    ``rows`` are session_params() dicts with a ``source``. A row whose source
+    already imported a session updates it; the rest are inserted unless their
+    day is taken. Insights come from the decisions of added rows, and from
+    the decision lines an edit added to an updated row.
+    """
+    sources = json.dumps([row["source"] for row in rows])
+    known = dict(conn.execute(
+        "SELECT source, decisions FROM main.sessions"
+        " WHERE source IN (SELECT value FROM json_each(?))", (sources,)))
+    updated = [row for row in rows if row["source"] in known]
+    # Diffed here rather than checked per insert: content has no index, so a
+    # NOT EXISTS per decision would scan the project's insights every time.
+    edited = []
+    for row in updated:
+        old = set((known[row["source"]] or "").split("\n"))
+        edited.append({**row, "decisions": "\n".join(
+            line for line in row["decisions"].split("\n") if line not in old)})
+    conn.executemany(UPDATE_SESSION_SQL, updated)
+
+    before = conn.execute("SELECT COALESCE(MAX(id), 0) FROM main.sessions").fetchone()[0]
+    conn.executemany(IMPORT_SESSION_SQL.format(archived=ARCHIVED_CLAUSE if archived else ""),
+                     [row for row in rows if row["source"] not in known])
+    new = {row[0] for row in conn.execute(
+        "SELECT source FROM main.sessions WHERE id > ?", (before,))}
+    added = [row for row in rows if row["source"] in new]
+    conn.executemany(memstack_db.RAW_BLOB_INSERT_SQL, added + updated)
+
+    before = conn.execute("SELECT COALESCE(MAX(id), 0) FROM main.insights").fetchone()[0]
+    conn.executemany(IMPORT_INSIGHT_SQL, [memstack_db.insight_params(insight)
+                                          for insight in extract_insights(added + edited)])
+    return {"added": added, "updated": updated,
+            "insights": memstack_db.index_new_insights(conn, before)}
+
+
+def seed_project_context(conn, config_path=CONFIG_PATH) -> list:
+    """project_context rows for config.json projects that have none; returns the names added."""
+    if not Path(config_path).exists():
+        return []
+    config = json.loads(Path(config_path).read_text())
+    existing = {row[0] for row in conn.execute("SELECT project FROM main.project_context")}
+    names = [name for name in config.get("projects", {}) if name not in existing]
+    conn.executemany(
+        """INSERT INTO project_context (project, status, updated_at)
+           VALUES (?, 'active', datetime('now'))""",
+        [(name,) for name in names],
+    )
+    return names
+
+
+def sync_sessions(memory_dir=MEMORY_DIR, db_path=None, config_path=CONFIG_PATH, workers=None,
+                  files=None) -> dict:
+    """Bring the database in line with the diaries; returns what happened.
+
+    ``files`` limits the pass to those diaries (the watcher's batches); by
+    default every diary is considered and manifest rows of vanished files go.
+    """
+    db_path = Path(db_path) if db_path else DB_PATH
+    memory_dir = Path(memory_dir)
+    listed = session_files(memory_dir) if files is None else [Path(f) for f in files]
+    conn = memstack_db.get_db(path=db_path)
+    try:
+        changed, unchanged = changed_files(conn, listed, memory_dir)
+        rows, manifest, processed, unparsed = [], [], [], []
+        paths = [path for path, _ in changed]
+        for (path, entry), (digest, entries) in zip(changed, parse_files(paths, workers)):
+            processed.append(path)
+            manifest.append({**entry, "hash": digest})
+            if digest == entry["known_hash"]:
+                continue  # touched, not edited: only the manifest moves
+            if not entries:
+                unparsed.append(path)
+            rows += [{**memstack_db.session_params(e), "source": entry["path"]} for e in entries]
+
+        with memstack_db.attached_archive(conn, db_path=db_path) as archived:
+            with memstack_db.write_transaction(conn):
+                result = import_sessions(conn, rows, archived)
+                conn.executemany(MANIFEST_UPSERT_SQL, manifest)
+                if files is None:
+                    # Forget vanished files, so one that comes back is read again.
+                    conn.execute(
+                        "DELETE FROM import_manifest "
+                        "WHERE path NOT IN (SELECT value FROM json_each(?))",
+                        (json.dumps([p.relative_to(memory_dir).as_posix() for p in listed]),),
+                    )
+                contexts = seed_project_context(conn, config_path) if config_path else []
+    finally:
+        conn.close()
+
+    written = {id(row) for row in result["added"] + result["updated"]}
+    return {
+        **result,
+        "processed": processed,
+        "unparsed": unparsed,
+        "existing": [row for row in rows if id(row) not in written],
+        "unchanged": unchanged,
+        "contexts": contexts,
+    }
+
+
+def migrate(memory_dir=MEMORY_DIR, db_path=None, config_path=CONFIG_PATH, workers=None):
+    db_path = Path(db_path) if db_path else DB_PATH
+    if not db_path.exists():
         print("ERROR: Database not found. Run 'python db/memstack-db.py init' first.")
         sys.exit(1)
 
-    conn = get_db()
-    imported_sessions = 0
-    imported_insights = 0
-    skipped = 0
-
-    # Process session files
-    if SESSIONS_DIR.exists():
-        for md_file in sorted(SESSIONS_DIR.glob("*.md")):
-            if md_file.name in ("session-format.md", "main-memory-format.md"):
-                continue
-
-            print(f"Processing: {md_file.name}")
-            entries = parse_session_file(md_file)
-
-            for entry in entries:
-                # Check for existing entry (same project + date)
-                existing = conn.execute(
-                    "SELECT id FROM sessions WHERE project = ? AND date = ?",
-                    (entry["project"], entry["date"]),
-                ).fetchone()
-
-                if existing:
-                    print(f"  EXISTS: {entry['project']} {entry['date']} (id={existing['id']})")
-                    skipped += 1
-                    continue
-
-                conn.execute(
-                    """INSERT INTO sessions (project, date, accomplished, files_changed,
-                       commits, decisions, problems, next_steps, duration, raw_markdown)
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (
-                        entry["project"],
-                        entry["date"],
-                        entry["accomplished"],
-                        entry["files_changed"],
-                        entry["commits"],
-                        entry["decisions"],
-                        entry["problems"],
-                        entry["next_steps"],
-                        entry["duration"],
-                        entry["raw_markdown"],
-                    ),
-                )
-                imported_sessions += 1
-
-                # Extract and import insights from decisions
-                for insight in extract_insights([entry]):
-                    conn.execute(
-                        """INSERT INTO insights (project, type, content, context, tags)
-                           VALUES (?, ?, ?, ?, ?)""",
-                        (
-                            insight["project"],
-                            insight["type"],
-                            insight["content"],
-                            insight["context"],
-                            insight["tags"],
-                        ),
-                    )
-                    imported_insights += 1
-
-    # Process archive too
-    if ARCHIVE_DIR.exists():
-        for md_file in sorted(ARCHIVE_DIR.glob("*.md")):
-            print(f"Processing archive: {md_file.name}")
-            entries = parse_session_file(md_file)
-            for entry in entries:
-                existing = conn.execute(
-                    "SELECT id FROM sessions WHERE project = ? AND date = ?",
-                    (entry["project"], entry["date"]),
-                ).fetchone()
-                if existing:
-                    skipped += 1
-                    continue
-                conn.execute(
-                    """INSERT INTO sessions (project, date, accomplished, files_changed,
-                       commits, decisions, problems, next_steps, duration, raw_markdown)
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (
-                        entry["project"],
-                        entry["date"],
-                        entry["accomplished"],
-                        entry["files_changed"],
-                        entry["commits"],
-                        entry["decisions"],
-                        entry["problems"],
-                        entry["next_steps"],
-                        entry["duration"],
-                        entry["raw_markdown"],
-                    ),
-                )
-                imported_sessions += 1
-
-                # Extract and import insights from archived sessions
-                for insight in extract_insights([entry]):
-                    conn.execute(
-                        """INSERT INTO insights (project, type, content, context, tags)
-                           VALUES (?, ?, ?, ?, ?)""",
-                        (
-                            insight["project"],
-                            insight["type"],
-                            insight["content"],
-                            insight["context"],
-                            insight["tags"],
-                        ),
-                    )
-                    imported_insights += 1
-
-    # Seed project context from config.json
-    config_path = ROOT / "config.json"
-    if config_path.exists():
-        config = json.loads(config_path.read_text())
-        for name, info in config.get("projects", {}).items():
-            existing = conn.execute(
-                "SELECT id FROM project_context WHERE project = ?", (name,)
-            ).fetchone()
-            if not existing:
-                conn.execute(
-                    """INSERT INTO project_context (project, status, updated_at)
-                       VALUES (?, 'active', datetime('now'))""",
-                    (name,),
-                )
-                print(f"  Added project context: {name}")
-
-    conn.commit()
-    conn.close()
+    result = sync_sessions(memory_dir, db_path, config_path, workers)
+    for path in result["processed"]:
+        label = "Processing archive" if path.parent.name == "archive" else "Processing"
+        print(f"{label}: {path.name}")
+        if path in result["unparsed"]:
+            print(f"  SKIP: {path.stem} (doesn't match date-project pattern)")
+    for row in result["existing"]:
+        print(f"  EXISTS: {row['project']} {row['date']} ({row['source']})")
+    for name in result["contexts"]:
+        print(f"  Added project context: {name}")
 
     print(f"\nMigration complete:")
-    print(f"  Sessions imported: {imported_sessions}")
-    print(f"  Insights extracted: {imported_insights}")
-    print(f"  Skipped (existing): {skipped}")
-    print(f"  Database: {DB_PATH}")
+    print(f"  Sessions imported: {len(result['added'])}")
+    print(f"  Sessions updated: {len(result['updated'])}")
+    print(f"  Insights extracted: {result['insights']}")
+    print(f"  Skipped (existing): {len(result['existing'])}")
+    print(f"  Unchanged (not read): {result['unchanged']}")
+    print(f"  Database: {db_path}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Import memory/sessions markdown into SQLite")
+    ap.add_argument("--workers", type=int, default=None,
+                    help="parser processes (default: one per CPU; 1 parses in-process)")
+    args = ap.parse_args()
+    migrate(workers=args.workers)
 
 
 if __name__ == "__main__":
-    migrate()
+    main()
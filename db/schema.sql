@@ -1,5 +1,8 @@
 -- MemStack v2.1 — SQLite Memory Backend
 -- Replaces flat markdown files with structured, queryable storage.
+--
+-- This file is schema version 1, the baseline. Do not edit it to change the
+-- schema: add a numbered step to MIGRATIONS in db/memstack_db.py instead.
 
 PRAGMA journal_mode = WAL;
 PRAGMA foreign_keys = ON;
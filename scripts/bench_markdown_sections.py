@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+bench_markdown_sections.py
+Micro-benchmark for the markdown section tokenizer (db/markdown_sections.py).
+
+Builds deterministic multi-session diaries (same seed -> same text; later
+sessions skip Commits or Problems and Solutions half the time) and times
+the two ways session markdown used to be cut up against the shared tokenizer:
+
+  import   db/migrate.py's parse of one diary: a DOTALL regex search per
+           header, plus re.split on "## Session N:" and two more searches per
+           sub-session, vs migrate.parse_session_file() on the tokenizer
+  chunk    skills/echo/index-sessions.py chunking: split lines and regex-match
+           every line, vs iter_sections()
+
+The legacy implementations are kept here, verbatim in behaviour, as the
+baseline. Results are JSON: best-of-N milliseconds per file size and the
+speedup of the tokenizer over each baseline.
+
+Usage:
+  python scripts/bench_markdown_sections.py                  # 10, 100, 1000 sessions
+  python scripts/bench_markdown_sections.py --sessions 5000 --repeat 3
+"""
+
+import argparse
+import json
+import platform
+import random
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT / "db"))
+
+import migrate  # noqa: E402
+from markdown_sections import iter_sections  # noqa: E402
+
+HEADERS = ("Accomplished", "Files Changed", "Commits", "Decisions", "Problems and Solutions",
+           "Next Steps")
+# Later sessions often leave these out, as real diaries do.
+OPTIONAL = ("Commits", "Problems and Solutions")
+DIARY_PATH = Path("2026-05-01-bench.md")
+WORDS = ("parser", "cursor", "index", "schema", "deploy", "widget", "ledger", "cache", "token",
+         "socket", "daemon", "bridge")
+
+
+def build_diary(sessions, seed=1) -> str:
+    """One diary file holding ``sessions`` sessions of 2-6 bullets per section."""
+    rng = random.Random(seed)
+    parts = ["# 2026-05-01 — bench\n\n"]
+    for n in range(1, sessions + 1):
+        if n > 1:
+            parts.append(f"## Session {n}: {rng.choice(WORDS)}\n\n")
+        for header in HEADERS:
+            if n > 1 and header in OPTIONAL and rng.random() < 0.5:
+                continue
+            parts.append(f"## {header}\n")
+            for _ in range(rng.randint(2, 6)):
+                parts.append("- " + " ".join(rng.choice(WORDS) for _ in range(10)) + "\n")
+            parts.append("\n")
+    return "".join(parts)
+
+
+# ── legacy baselines ──────────────────────────────────────────────────────────
+
+def legacy_parse_section(text, header):
+    pattern = rf"^##\s+{re.escape(header)}\s*\n(.*?)(?=^##\s|\Z)"
+    match = re.search(pattern, text, re.MULTILINE | re.DOTALL)
+    return match.group(1).strip() if match else ""
+
+
+def legacy_import(text):
+    fields = {header: legacy_parse_section(text, header) for header in HEADERS}
+    splits = re.split(r"^(## Session \d+:.*?)$", text, flags=re.MULTILINE)
+    for i in range(1, len(splits), 2):
+        sub_text = splits[i] + "\n" + (splits[i + 1] if i + 1 < len(splits) else "")
+        for header in ("Accomplished", "Files Changed"):
+            body = legacy_parse_section(sub_text, header)
+            if body:
+                fields[header] += "\n" + body
+    return fields
+
+
+_LEGACY_HEADING_RE = re.compile(r"^(#{1,6})\s+(.+)$", re.MULTILINE)
+
+
+def legacy_chunk(text):
+    lines = text.split("\n")
+    headings = []
+    for i, line in enumerate(lines):
+        m = _LEGACY_HEADING_RE.match(line)
+        if m:
+            headings.append((i, len(m.group(1)), m.group(2).strip()))
+    sections = []
+    for idx, (line_idx, _level, title) in enumerate(headings):
+        next_start = headings[idx + 1][0] if idx + 1 < len(headings) else len(lines)
+        sections.append((title, "\n".join(lines[line_idx:next_start]).strip()))
+    return sections
+
+
+# ── tokenizer ─────────────────────────────────────────────────────────────────
+
+def tokenizer_import(text):
+    [entry] = migrate.parse_session_file(DIARY_PATH, text)
+    return {header: entry[field] for field, header in migrate.SECTION_FIELDS.items()}
+
+
+def tokenizer_chunk(text):
+    return [(s["title"], s["text"].strip()) for s in iter_sections(text)]
+
+
+def best_ms(fn, text, repeat) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - started)
+    return round(best * 1000, 3)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the markdown section tokenizer")
+    ap.add_argument("--sessions", default="10,100,1000",
+                    help="comma-separated sessions per diary (default: 10,100,1000)")
+    ap.add_argument("--repeat", type=int, default=5, help="runs per measurement; best is kept")
+    ap.add_argument("--out", default=None, help="write results JSON here (default: stdout)")
+    args = ap.parse_args()
+
+    runs = []
+    for sessions in (int(n) for n in args.sessions.split(",")):
+        text = build_diary(sessions)
+        # The shared tokenizer must give the importer what the regexes gave it.
+        assert tokenizer_import(text) == legacy_import(text)
+        row = {"sessions": sessions, "bytes": len(text.encode("utf-8")),
+               "sections": sum(1 for _ in iter_sections(text))}
+        for task, legacy, shared in (("import", legacy_import, tokenizer_import),
+                                     ("chunk", legacy_chunk, tokenizer_chunk)):
+            before, after = best_ms(legacy, text, args.repeat), best_ms(shared, text, args.repeat)
+            row[task] = {"legacy_ms": before, "tokenizer_ms": after,
+                         "speedup": round(before / after, 2) if after else None}
+        runs.append(row)
+
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "runs": runs,
+    }
+    text = json.dumps(results, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+"""
+bench_memstack_db.py
+Benchmark harness for the SQLite memory backend (db/memstack-db.py).
+
+Builds deterministic synthetic corpora (same seed -> byte-identical data),
+times every command against them, and writes the results as JSON so runs can
+be compared across versions.
+
+Corpora:
+  Sizes are session counts; each corpus also holds the same number of
+  insights. Field sizes follow real diaries (multi-bullet markdown, 2-5 KB of
+  raw_markdown per session) and projects are Zipf-skewed, so one project owns
+  a large share of the rows the way a main repo does in practice. Corpora are
+  cached in --workdir and rebuilt only when missing.
+
+Modes:
+  inprocess   the command handler called directly (query + serialization cost)
+  subprocess  python db/memstack-db.py ... as a fresh process (what skills pay)
+  daemon      the same subprocess, forwarded to a warm `serve` daemon
+
+Regression gate:
+  --thresholds FILE holds absolute ceilings per corpus/command/mode/metric
+  (see scripts/bench_thresholds.json), the commands whose daemon-forwarded
+  call must beat a cold subprocess call, a ceiling on the CLI's entry cost (a
+  cold call less the bare interpreter start and the in-process time), and,
+  with --baseline RESULTS.json, a maximum relative slowdown against a
+  previous run. Any violation is listed
+  and the run exits 1.
+
+Usage:
+  python scripts/bench_memstack_db.py                         # 1k corpus, all modes
+  python scripts/bench_memstack_db.py --sizes 1k,100k --modes inprocess
+  python scripts/bench_memstack_db.py --sizes 1m --commands search,get-sessions
+  python scripts/bench_memstack_db.py --out bench.json --baseline old.json \\
+      --thresholds scripts/bench_thresholds.json
+"""
+
+import argparse
+import compileall
+import contextlib
+import json
+import os
+import platform
+import random
+import shlex
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+CLI_PATH = REPO_ROOT / "db" / "memstack-db.py"
+DEFAULT_THRESHOLDS = REPO_ROOT / "scripts" / "bench_thresholds.json"
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+MODES = ("inprocess", "subprocess", "daemon")
+PROJECTS = 40
+ZIPF_S = 1.1
+GLOBAL_INSIGHT_SHARE = 0.05
+INSIGHT_TYPES = ("decision", "gotcha", "lesson", "pattern", "warning", "failed_approach",
+                 "architecture")
+
+# Searchable vocabulary. Query cases draw from TERMS so they always have hits.
+TERMS = (
+    "auth", "authentication", "cache", "migration", "schema", "index", "deploy", "webhook",
+    "session", "diary", "insight", "docker", "railway", "netlify", "stripe", "supabase",
+    "sqlite", "postgres", "latency", "timeout", "retry", "queue", "worker", "cron", "token",
+    "refactor", "pagination", "cursor", "embedding", "vector", "bridge", "loader", "hook",
+    "lint", "release", "version", "marketplace", "plugin", "skill", "frontmatter", "regex",
+    "parser", "tokenizer", "chunk", "upload", "invoice", "pricing", "onboarding", "dashboard",
+)
+VERBS = ("Fixed", "Added", "Refactored", "Removed", "Investigated", "Documented", "Tuned",
+         "Wired", "Migrated", "Hardened", "Split", "Renamed", "Cached", "Tested")
+NOUNS = ("the", "a", "new", "flaky", "slow", "broken", "shared", "legacy", "per-project",
+         "async", "batched", "nightly", "optional", "default")
+
+
+def load_cli():
+    sys.path.insert(0, str(CLI_PATH.parent))
+    import memstack_db
+    return memstack_db
+
+
+# ── corpus ────────────────────────────────────────────────────────────────────
+
+def _sentence_pool(rng, n=4000):
+    pool = []
+    for _ in range(n):
+        words = [rng.choice(VERBS)]
+        for _ in range(rng.randint(4, 14)):
+            words.append(rng.choice(TERMS) if rng.random() < 0.45 else rng.choice(NOUNS))
+        pool.append(" ".join(words))
+    return pool
+
+
+def _bullets(rng, pool, lo, hi):
+    """Markdown bullet list of roughly lo..hi characters ("" when hi is 0)."""
+    target = rng.randint(lo, hi)
+    out, size = [], 0
+    while size < target:
+        line = "- " + rng.choice(pool)
+        out.append(line)
+        size += len(line) + 1
+    return "\n".join(out)
+
+
+def _project_weights():
+    return [1 / (rank ** ZIPF_S) for rank in range(1, PROJECTS + 1)]
+
+
+def generate_sessions(n, seed):
+    """Yield session dicts; deterministic for a given (n, seed)."""
+    rng = random.Random(f"sessions:{seed}")
+    pool = _sentence_pool(rng)
+    projects = [f"project-{i:02d}" for i in range(PROJECTS)]
+    weights = _project_weights()
+    start = date(2023, 1, 1)
+    for _ in range(n):
+        project = rng.choices(projects, weights)[0]
+        day = (start + timedelta(days=rng.randint(0, 3 * 365))).isoformat()
+        fields = {
+            "accomplished": _bullets(rng, pool, 300, 1500),
+            "files_changed": _bullets(rng, pool, 100, 600),
+            "commits": _bullets(rng, pool, 80, 400),
+            "decisions": _bullets(rng, pool, 0, 600) if rng.random() < 0.7 else "",
+            "problems": _bullets(rng, pool, 0, 800) if rng.random() < 0.5 else "",
+            "next_steps": _bullets(rng, pool, 80, 400),
+        }
+        raw = [f"# Session Diary: {project} ({day})"]
+        for title, key in (("Accomplished", "accomplished"), ("Files Changed", "files_changed"),
+                           ("Commits", "commits"), ("Decisions", "decisions"),
+                           ("Problems and Solutions", "problems"), ("Next Steps", "next_steps")):
+            if fields[key]:
+                raw.append(f"## {title}\n{fields[key]}")
+        yield dict(fields, project=project, date=day, duration=f"~{rng.randint(1, 6)} hours",
+                   raw_markdown="\n\n".join(raw))
+
+
+def generate_insights(n, seed):
+    rng = random.Random(f"insights:{seed}")
+    pool = _sentence_pool(rng)
+    projects = [f"project-{i:02d}" for i in range(PROJECTS)]
+    weights = _project_weights()
+    start = datetime(2023, 1, 1, tzinfo=timezone.utc)
+    for _ in range(n):
+        project = None if rng.random() < GLOBAL_INSIGHT_SHARE else rng.choices(projects, weights)[0]
+        sentences = [rng.choice(pool) for _ in range(rng.randint(1, 4))]
+        yield {
+            "project": project,
+            "type": rng.choice(INSIGHT_TYPES),
+            "content": ". ".join(sentences),
+            "context": f"Session {(start + timedelta(days=rng.randint(0, 1095))).date()}",
+            "tags": ",".join(rng.sample(TERMS, rng.randint(1, 3))),
+            "created_at": (start + timedelta(seconds=rng.randint(0, 3 * 365 * 86400)))
+            .strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def build_corpus(cli, path, n, seed):
+    """Create the corpus database at path (schema via the CLI's own migrations)."""
+    started = time.perf_counter()
+    cli.DB_PATH = path
+    conn = cli.get_db()
+    for chunk in _chunks(generate_sessions(n, seed), 5000):
+        params = [cli.session_params(s) for s in chunk]
+        for sql in cli.SESSION_WRITE_SQL:
+            conn.executemany(sql, params)
+        conn.commit()
+    for chunk in _chunks(generate_insights(n, seed), 5000):
+        conn.executemany(
+            """INSERT INTO insights (project, type, content, context, tags, created_at)
+               VALUES (:project, :type, :content, :context, :tags, :created_at)""",
+            chunk,
+        )
+        conn.commit()
+    rng = random.Random(f"context:{seed}")
+    pool = _sentence_pool(rng, 500)
+    for i in range(PROJECTS):
+        project = f"project-{i:02d}"
+        conn.execute(
+            """INSERT INTO project_context (project, status, architecture_decisions,
+               known_issues, backlog) VALUES (?, 'active', ?, ?, ?)""",
+            (project, _bullets(rng, pool, 200, 800), _bullets(rng, pool, 100, 400),
+             _bullets(rng, pool, 100, 400)),
+        )
+        for task in range(1, rng.randint(5, 30)):
+            conn.execute(
+                "INSERT INTO plans (project, task_number, description, status) VALUES (?, ?, ?, ?)",
+                (project, task, rng.choice(pool), rng.choice(("pending", "completed"))),
+            )
+    conn.commit()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("ANALYZE")
+    conn.close()
+    return round(time.perf_counter() - started, 2)
+
+
+def corpus_path(workdir, label, seed):
+    return Path(workdir) / f"corpus-{label}-seed{seed}.db"
+
+
+# ── cases ─────────────────────────────────────────────────────────────────────
+
+def cases(seed):
+    """(name, argv) pairs; write cases use counters so every call is distinct."""
+    rng = random.Random(f"cases:{seed}")
+    hot = "project-00"
+    counter = iter(range(10 ** 9))
+
+    def session():
+        return json.dumps({"project": hot, "date": "2026-06-01",
+                           "accomplished": f"- bench write {next(counter)}"})
+
+    def insight():
+        return json.dumps({"project": hot, "type": "decision",
+                           "content": f"bench insight {next(counter)}"})
+
+    def plan_task():
+        return json.dumps({"project": "bench-plan", "task_number": next(counter) % 50 + 1,
+                           "description": "bench task"})
+
+    return [
+        ("init", lambda: ["init"]),
+        ("add-session", lambda: ["add-session", session()]),
+        ("add-insight", lambda: ["add-insight", insight()]),
+        ("set-context", lambda: ["set-context", json.dumps(
+            {"project": hot, "last_session_date": "2026-06-01"})]),
+        ("add-plan-task", lambda: ["add-plan-task", plan_task()]),
+        ("update-task", lambda: ["update-task", json.dumps(
+            {"project": hot, "task_number": 1, "status": "completed"})]),
+        ("search", lambda: ["search", rng.choice(TERMS)]),
+        ("search-phrase", lambda: ["search", '"{} {}"'.format(rng.choice(VERBS), "the")]),
+        ("search-prefix", lambda: ["search", rng.choice(TERMS)[:3] + "*", "--project", hot]),
+        ("get-sessions", lambda: ["get-sessions", hot]),
+        ("get-insights", lambda: ["get-insights", hot, "--limit", "50"]),
+        ("get-insights-all", lambda: ["get-insights", f"project-{rng.randint(20, 39):02d}"]),
+        ("get-context", lambda: ["get-context", hot]),
+        ("get-plan", lambda: ["get-plan", hot]),
+        ("export-md", lambda: ["export-md", f"project-{rng.randint(20, 39):02d}"]),
+        ("stats", lambda: ["stats"]),
+    ]
+
+
+# ── timing ────────────────────────────────────────────────────────────────────
+
+def percentile(sorted_samples, pct):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_samples:
+        return None
+    rank = max(1, -(-len(sorted_samples) * pct // 100))
+    return sorted_samples[int(rank) - 1]
+
+
+def summarize(samples_ms):
+    ordered = sorted(samples_ms)
+    return {
+        "n": len(ordered),
+        "p50_ms": round(percentile(ordered, 50), 3),
+        "p95_ms": round(percentile(ordered, 95), 3),
+        "p99_ms": round(percentile(ordered, 99), 3),
+        "mean_ms": round(sum(ordered) / len(ordered), 3),
+    }
+
+
+def time_inprocess(cli, parser, argv_fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        args = parser.parse_args(argv_fn())
+        started = time.perf_counter()
+        code, output = cli.run_command(args)
+        samples.append((time.perf_counter() - started) * 1000)
+        if code:
+            raise RuntimeError(f"{args.command} failed: {output[:300]}")
+    return samples
+
+
+def time_subprocess(argv_fn, iterations, env):
+    samples = []
+    for _ in range(iterations):
+        argv = [sys.executable, str(CLI_PATH), *argv_fn()]
+        started = time.perf_counter()
+        proc = subprocess.run(argv, env=env, capture_output=True)
+        samples.append((time.perf_counter() - started) * 1000)
+        if proc.returncode:
+            raise RuntimeError(f"{shlex.join(argv[2:3])} failed: {proc.stdout[:300]!r}")
+    return samples
+
+
+def time_interpreter(iterations):
+    """A bare `python -c pass`: the part of a cold call the CLI cannot shed."""
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], capture_output=True)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+@contextlib.contextmanager
+def running_daemon(env, socket_path):
+    proc = subprocess.Popen([sys.executable, str(CLI_PATH), "serve", "--socket", str(socket_path)],
+                            env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        proc.stdout.readline()  # {"ok": true, ...} once listening
+        yield
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def bench_corpus(cli, db_path, modes, commands, iterations, seed):
+    parser = cli.build_parser()
+    selected = [(name, fn) for name, fn in cases(seed) if not commands or name in commands]
+    results = {name: {} for name, _ in selected}
+    base_env = dict(os.environ, MEMSTACK_SQLITE_PATH=str(db_path), MEMSTACK_NO_DAEMON="1")
+
+    if "inprocess" in modes:
+        cli.DB_PATH = db_path
+        for name, argv_fn in selected:
+            time_inprocess(cli, parser, argv_fn, 1)  # warm the page cache
+            results[name]["inprocess"] = summarize(time_inprocess(cli, parser, argv_fn, iterations))
+
+    if "subprocess" in modes:
+        for name, argv_fn in selected:
+            results[name]["subprocess"] = summarize(time_subprocess(argv_fn, iterations, base_env))
+
+    if "daemon" in modes and hasattr(socket, "AF_UNIX"):
+        with tempfile.TemporaryDirectory() as tmp:
+            sock = Path(tmp) / "bench.sock"
+            env = dict(base_env, MEMSTACK_SOCKET=str(sock))
+            env.pop("MEMSTACK_NO_DAEMON")
+            with running_daemon(env, sock):
+                for name, argv_fn in selected:
+                    results[name]["daemon"] = summarize(time_subprocess(argv_fn, iterations, env))
+    return results
+
+
+# ── regression gate ───────────────────────────────────────────────────────────
+
+def check_thresholds(results, thresholds, baseline):
+    """List of human-readable violations (empty when the run passes)."""
+    violations = []
+    for label, limits in (thresholds.get("limits") or {}).items():
+        corpus = results["corpora"].get(label)
+        if not corpus:
+            continue
+        for command, by_mode in limits.items():
+            for mode, metrics in by_mode.items():
+                measured = corpus["commands"].get(command, {}).get(mode)
+                if not measured:
+                    continue
+                for metric, ceiling in metrics.items():
+                    if measured[metric] > ceiling:
+                        violations.append(
+                            f"{label} {command} [{mode}] {metric} = {measured[metric]} > {ceiling}")
+
+    # Forwarding exists to skip the backend's startup: it has to be faster.
+    metric = thresholds.get("daemon_metric", "p50_ms")
+    for command in thresholds.get("daemon_beats_subprocess") or ():
+        for label, corpus in results["corpora"].items():
+            by_mode = corpus["commands"].get(command, {})
+            if "daemon" in by_mode and "subprocess" in by_mode:
+                forwarded, cold = by_mode["daemon"][metric], by_mode["subprocess"][metric]
+                if forwarded >= cold:
+                    violations.append(f"{label} {command} [daemon] {metric} = {forwarded} "
+                                      f">= [subprocess] {cold}")
+
+    # What a cold call pays before the command runs: imports and argv parsing.
+    metric = thresholds.get("entry_metric", "p50_ms")
+    ceiling = thresholds.get("max_entry_ms")
+    interpreter = results.get("interpreter")
+    if ceiling is not None and interpreter:
+        for command in thresholds.get("entry_cases") or ():
+            for label, corpus in results["corpora"].items():
+                by_mode = corpus["commands"].get(command, {})
+                if "subprocess" in by_mode and "inprocess" in by_mode:
+                    entry = round(by_mode["subprocess"][metric] - by_mode["inprocess"][metric]
+                                  - interpreter[metric], 3)
+                    if entry > ceiling:
+                        violations.append(f"{label} {command} entry {metric} = {entry} > {ceiling}")
+
+    max_regression = thresholds.get("max_regression")
+    if baseline and max_regression is not None:
+        metric = thresholds.get("regression_metric", "p95_ms")
+        floor = thresholds.get("regression_floor_ms", 1.0)
+        for label, corpus in results["corpora"].items():
+            old_corpus = baseline.get("corpora", {}).get(label)
+            if not old_corpus:
+                continue
+            for command, by_mode in corpus["commands"].items():
+                for mode, measured in by_mode.items():
+                    old = old_corpus["commands"].get(command, {}).get(mode)
+                    if not old:
+                        continue
+                    # Sub-millisecond timings are noise-dominated; compare from a floor.
+                    allowed = max(old[metric], floor) * (1 + max_regression)
+                    if measured[metric] > allowed:
+                        violations.append(
+                            f"{label} {command} [{mode}] {metric} {old[metric]} -> "
+                            f"{measured[metric]} (> +{max_regression:.0%})")
+    return violations
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark db/memstack-db.py on synthetic corpora")
+    ap.add_argument("--sizes", default="1k", help="comma list of " + ",".join(SIZES))
+    ap.add_argument("--modes", default=",".join(MODES), help="comma list of " + ",".join(MODES))
+    ap.add_argument("--commands", default="", help="comma list of case names (default: all)")
+    ap.add_argument("--iterations", type=int, default=30)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--workdir", default=str(Path(tempfile.gettempdir()) / "memstack-bench"))
+    ap.add_argument("--rebuild", action="store_true", help="regenerate cached corpora")
+    ap.add_argument("--out", default=None, help="write results JSON here (default: stdout)")
+    ap.add_argument("--baseline", default=None, help="previous results JSON to compare against")
+    ap.add_argument("--thresholds", default=None,
+                    help=f"threshold file (e.g. {DEFAULT_THRESHOLDS.relative_to(REPO_ROOT)})")
+    args = ap.parse_args()
+
+    labels = [s.strip().lower() for s in args.sizes.split(",") if s.strip()]
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = [s for s in labels if s not in SIZES] + [m for m in modes if m not in MODES]
+    if unknown:
+        ap.error(f"unknown size/mode: {', '.join(unknown)}")
+    commands = {c.strip() for c in args.commands.split(",") if c.strip()}
+
+    cli = load_cli()
+    # Time installed behaviour: bytecode cached, as it is after the first run
+    # anywhere PYTHONDONTWRITEBYTECODE is not set.
+    compileall.compile_dir(str(CLI_PATH.parent), quiet=1)
+    Path(args.workdir).mkdir(parents=True, exist_ok=True)
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "schema_version": cli.SCHEMA_VERSION,
+        "seed": args.seed,
+        "iterations": args.iterations,
+        "corpora": {},
+    }
+    if "subprocess" in modes:
+        time_interpreter(1)
+        results["interpreter"] = summarize(time_interpreter(args.iterations))
+    for label in labels:
+        path = corpus_path(args.workdir, label, args.seed)
+        build_seconds = None
+        if args.rebuild or not path.exists():
+            for suffix in ("", "-wal", "-shm"):
+                Path(str(path) + suffix).unlink(missing_ok=True)
+            print(f"building {label} corpus at {path} ...", file=sys.stderr)
+            build_seconds = build_corpus(cli, path, SIZES[label], args.seed)
+        print(f"benchmarking {label} ...", file=sys.stderr)
+        commands_result = bench_corpus(cli, path, modes, commands, args.iterations, args.seed)
+        results["corpora"][label] = {
+            "sessions": SIZES[label],
+            "insights": SIZES[label],
+            "db_size_bytes": path.stat().st_size,
+            "build_seconds": build_seconds,
+            "commands": commands_result,
+        }
+
+    text = json.dumps(results, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+    if args.thresholds:
+        thresholds = json.loads(Path(args.thresholds).read_text(encoding="utf-8"))
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8")) if args.baseline else None
+        violations = check_thresholds(results, thresholds, baseline)
+        for v in violations:
+            print(f"REGRESSION: {v}", file=sys.stderr)
+        if violations:
+            sys.exit(1)
+        print("thresholds: ok", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+stress_memstack_db.py
+Concurrent-writer stress test for the SQLite memory backend (db/memstack-db.py).
+
+Spawns N worker processes that share one database and, until the deadline,
+issue a weighted mix of add-session, add-insight and search calls through the
+CLI's own handlers (run_command), the way several sessions on one machine do.
+Each process loads the module fresh, so every call opens its own connection
+and competes for the write lock exactly as separate CLI launches would.
+
+Reported per operation: count, failures, latency percentiles and how many
+calls took longer than --slow-ms (they waited on the lock). Also: total
+throughput, lock retries taken by the write-retry loop, a sample of failure
+messages, and an integrity check that every acknowledged write is present.
+
+Usage:
+  python scripts/stress_memstack_db.py                        # 8 processes, 10 s
+  python scripts/stress_memstack_db.py --processes 16 --duration 30
+  python scripts/stress_memstack_db.py --mix add-session=1,search=9
+  python scripts/stress_memstack_db.py --busy-timeout-ms 0    # lean on the retry loop
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+CLI_PATH = REPO_ROOT / "db" / "memstack-db.py"
+
+DEFAULT_MIX = "add-session=3,add-insight=3,search=4"
+WORDS = ("harbor", "crane", "ledger", "schema", "deploy", "cursor", "index", "widget",
+         "kernel", "beacon", "quorum", "lantern")
+
+
+def load_cli():
+    sys.path.insert(0, str(CLI_PATH.parent))
+    import memstack_db
+    return memstack_db
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = int(weight or 1)
+    return mix
+
+
+def percentile(sorted_samples, pct):
+    if not sorted_samples:
+        return 0.0
+    k = (len(sorted_samples) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_samples) - 1)
+    return sorted_samples[lo] + (sorted_samples[hi] - sorted_samples[lo]) * (k - lo)
+
+
+# ── worker ────────────────────────────────────────────────────────────────────
+
+def _request(op, rng, worker, seq):
+    text = " ".join(rng.choice(WORDS) for _ in range(8))
+    if op == "add-session":
+        return {"json": json.dumps({
+            "project": f"stress-{worker % 4}", "date": f"2026-01-{seq % 28 + 1:02d}",
+            "accomplished": f"- {text}", "raw_markdown": f"# w{worker} s{seq}\n{text}\n"})}
+    if op == "add-insight":
+        return {"json": json.dumps({
+            "project": f"stress-{worker % 4}", "type": "decision",
+            "content": f"w{worker} s{seq}: {text}"})}
+    return {"query": rng.choice(WORDS), "limit": 10}
+
+
+def worker(worker_id, env, mix, deadline, seed, queue):
+    os.environ.update(env)
+    cli = load_cli()
+    defaults = cli._command_defaults(cli.build_parser())
+    rng = random.Random(seed * 1000 + worker_id)
+    ops, weights = zip(*mix.items())
+    samples = {op: [] for op in ops}
+    failures = {op: 0 for op in ops}
+    errors = []
+    written = {"add-session": 0, "add-insight": 0}
+    seq = 0
+    while time.time() < deadline:
+        op = rng.choices(ops, weights)[0]
+        seq += 1
+        args = argparse.Namespace(command=op, **{**defaults[op], **_request(op, rng, worker_id, seq)})
+        started = time.perf_counter()
+        code, output = cli.run_command(args)
+        samples[op].append((time.perf_counter() - started) * 1000)
+        if code != 0:
+            failures[op] += 1
+            if len(errors) < 5:
+                errors.append(f"{op}: {output.strip()[:200]}")
+        elif op in written:
+            written[op] += 1
+    queue.put({"samples": samples, "failures": failures, "errors": errors,
+               "written": written, "lock_retries": cli.lock_retries})
+
+
+# ── driver ────────────────────────────────────────────────────────────────────
+
+def main():
+    ap = argparse.ArgumentParser(description="Multi-process write/read stress for memstack-db.py")
+    ap.add_argument("--processes", type=int, default=8)
+    ap.add_argument("--duration", type=float, default=10.0, help="seconds of traffic")
+    ap.add_argument("--mix", default=DEFAULT_MIX, help=f"op=weight list (default: {DEFAULT_MIX})")
+    ap.add_argument("--db", default=None, help="database file (default: a fresh temp file)")
+    ap.add_argument("--busy-timeout-ms", type=int, default=None,
+                    help="override busy_timeout for the workers")
+    ap.add_argument("--slow-ms", type=float, default=100.0,
+                    help="calls slower than this count as lock waits")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", default=None, help="write results JSON here (default: stdout)")
+    args = ap.parse_args()
+
+    mix = parse_mix(args.mix)
+    unknown = [op for op in mix if op not in ("add-session", "add-insight", "search")]
+    if unknown:
+        ap.error(f"unknown op in --mix: {', '.join(unknown)}")
+
+    workdir = Path(tempfile.mkdtemp(prefix="memstack-stress-"))
+    db_path = Path(args.db) if args.db else workdir / "memstack.db"
+    env = {
+        "MEMSTACK_SQLITE_PATH": str(db_path),
+        "MEMSTACK_NO_DAEMON": "1",
+        # Keep the skill-loader bridge out of the measurement.
+        "MEMSTACK_DB_PATH": str(workdir / "loader.db"),
+        "MEMSTACK_BRIDGE_DRAIN": "off",
+    }
+    if args.busy_timeout_ms is not None:
+        env["MEMSTACK_BUSY_TIMEOUT_MS"] = str(args.busy_timeout_ms)
+
+    # Create and migrate up front so workers measure traffic, not schema setup.
+    os.environ.update(env)
+    cli = load_cli()
+    conn = cli.get_db()
+    before = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+              for t in ("sessions", "insights")}
+    conn.close()
+
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    deadline = time.time() + args.duration + 1.0  # +1 s: let every worker finish importing
+    procs = [ctx.Process(target=worker, args=(i, env, mix, deadline, args.seed, queue))
+             for i in range(args.processes)]
+    started = time.perf_counter()
+    for p in procs:
+        p.start()
+    reports = [queue.get() for _ in procs]
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - started
+
+    ops = {}
+    total_calls = total_failures = lock_retries = 0
+    written = {"add-session": 0, "add-insight": 0}
+    errors = []
+    for op in mix:
+        samples = sorted(s for r in reports for s in r["samples"][op])
+        failures = sum(r["failures"][op] for r in reports)
+        total_calls += len(samples)
+        total_failures += failures
+        ops[op] = {
+            "n": len(samples),
+            "failures": failures,
+            "p50_ms": round(percentile(samples, 50), 3),
+            "p95_ms": round(percentile(samples, 95), 3),
+            "p99_ms": round(percentile(samples, 99), 3),
+            "max_ms": round(samples[-1], 3) if samples else 0.0,
+            "lock_waits": sum(1 for s in samples if s > args.slow_ms),
+        }
+    for r in reports:
+        lock_retries += r["lock_retries"]
+        errors.extend(r["errors"])
+        for op in written:
+            written[op] += r["written"][op]
+
+    conn = sqlite3.connect(db_path)
+    after = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+             for t in ("sessions", "insights")}
+    integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    conn.close()
+    lost = {
+        "sessions": written["add-session"] - (after["sessions"] - before["sessions"]),
+        "insights": written["add-insight"] - (after["insights"] - before["insights"]),
+    }
+
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "db": str(db_path),
+        "processes": args.processes,
+        "duration_s": round(elapsed, 2),
+        "mix": mix,
+        "busy_timeout_ms": args.busy_timeout_ms,
+        "throughput_ops_s": round(total_calls / elapsed, 1) if elapsed else 0.0,
+        "calls": total_calls,
+        "failures": total_failures,
+        "lock_retries": lock_retries,
+        "ops": ops,
+        "errors": errors[:10],
+        "integrity_check": integrity,
+        "acknowledged_but_missing": lost,
+    }
+    text = json.dumps(results, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    if total_failures or integrity != "ok" or any(lost.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
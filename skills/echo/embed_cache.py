@@ -0,0 +1,179 @@
+"""
+Echo Skill — Embedding Cache
+Disk-backed cache of embedding vectors shared by index-sessions.py and
+search.py, so text that was embedded once is never sent to the model again:
+not on a --force rebuild, not when a file is touched or re-chunked, and not
+for a repeated search query.
+
+Vectors live in a SQLite file (memory/vectors/embeddings.db) as float32
+blobs keyed by (provider, model, content_hash), where content_hash is the
+sha256 of the embedded text. The cache is bounded by size: once the blobs
+pass MEMSTACK_EMBED_CACHE_MB (default 256), the least recently used rows
+are evicted. MEMSTACK_EMBED_CACHE_MB=0 turns the cache off.
+
+A cache that cannot be opened or written is skipped, never fatal: embedding
+then works exactly as it does without one.
+"""
+
+import hashlib
+import os
+import sqlite3
+import time
+from array import array
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent.resolve()
+PROJECT_ROOT = SCRIPT_DIR.parent.parent
+CACHE_PATH = PROJECT_ROOT / "memory" / "vectors" / "embeddings.db"
+DEFAULT_CACHE_MB = 256
+# Evict down to this fraction of the limit, so eviction runs rarely
+EVICT_TO = 0.9
+
+MODELS = {"local": "all-MiniLM-L6-v2", "openai": "text-embedding-3-small"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    provider     TEXT NOT NULL,
+    model        TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    vector       BLOB NOT NULL,
+    used_at      REAL NOT NULL,
+    PRIMARY KEY (provider, model, content_hash)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_embeddings_used ON embeddings(used_at);
+"""
+
+
+def cache_limit() -> int:
+    """Cache size limit in bytes, from MEMSTACK_EMBED_CACHE_MB."""
+    try:
+        mb = float(os.environ.get("MEMSTACK_EMBED_CACHE_MB", DEFAULT_CACHE_MB))
+    except ValueError:
+        mb = DEFAULT_CACHE_MB
+    return max(0, int(mb * 1024 * 1024))
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def pack(vector) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def unpack(blob: bytes) -> list[float]:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingCache:
+    """float32 vectors in SQLite, keyed by (provider, model, content_hash)."""
+
+    def __init__(self, path=None, max_bytes=None):
+        self.path = Path(path) if path else CACHE_PATH
+        self.max_bytes = cache_limit() if max_bytes is None else max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path), timeout=5)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def get_many(self, provider: str, model: str, hashes) -> dict:
+        """content_hash -> vector for those of ``hashes`` in the cache; marks them used."""
+        hashes = list(dict.fromkeys(hashes))
+        if not hashes:
+            return {}
+        found = {}
+        # Stay under SQLite's bound-parameter limit
+        for i in range(0, len(hashes), 500):
+            chunk = hashes[i : i + 500]
+            rows = self.conn.execute(
+                "SELECT content_hash, vector FROM embeddings WHERE provider = ? AND model = ?"
+                f" AND content_hash IN ({','.join('?' * len(chunk))})",
+                [provider, model, *chunk],
+            ).fetchall()
+            found.update((h, unpack(blob)) for h, blob in rows)
+        if found:
+            with self.conn:
+                self.conn.executemany(
+                    "UPDATE embeddings SET used_at = ? WHERE provider = ? AND model = ?"
+                    " AND content_hash = ?",
+                    [(time.time(), provider, model, h) for h in found],
+                )
+        return found
+
+    def put_many(self, provider: str, model: str, vectors: dict) -> None:
+        """Store content_hash -> vector pairs, then evict down to the size limit."""
+        if not vectors:
+            return
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (provider, model, content_hash, vector, used_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [(provider, model, h, pack(v), now) for h, v in vectors.items()],
+            )
+            self.evict()
+
+    def size(self) -> int:
+        return self.conn.execute(
+            "SELECT COALESCE(SUM(length(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def evict(self) -> int:
+        """Drop least recently used rows once the cache passes its size limit."""
+        total = self.size()
+        if total <= self.max_bytes:
+            return 0
+        target = total - int(self.max_bytes * EVICT_TO)
+        freed, doomed = 0, []
+        for provider, model, h, size in self.conn.execute(
+            "SELECT provider, model, content_hash, length(vector) FROM embeddings"
+            " ORDER BY used_at"
+        ):
+            if freed >= target:
+                break
+            doomed.append((provider, model, h))
+            freed += size
+        self.conn.executemany(
+            "DELETE FROM embeddings WHERE provider = ? AND model = ? AND content_hash = ?",
+            doomed,
+        )
+        return len(doomed)
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def cached_embedder(embed_fn, provider: str, model: str | None = None, cache=None):
+    """Wrap embed_fn(texts) -> vectors so only texts missing from the cache are embedded.
+
+    Returns embed_fn itself when the cache is off or cannot be opened.
+    """
+    model = model or MODELS.get(provider, provider)
+    if cache is None:
+        if cache_limit() == 0:
+            return embed_fn
+        try:
+            cache = EmbeddingCache()
+        except (sqlite3.Error, OSError):
+            return embed_fn
+
+    def embed(texts: list[str]) -> list[list[float]]:
+        hashes = [text_hash(t) for t in texts]
+        try:
+            known = cache.get_many(provider, model, hashes)
+        except sqlite3.Error:
+            known = {}
+        missing = {h: t for h, t in zip(hashes, texts) if h not in known}
+        if missing:
+            fresh = dict(zip(missing, embed_fn(list(missing.values()))))
+            try:
+                cache.put_many(provider, model, fresh)
+            except sqlite3.Error:
+                pass
+            # Same float32 precision whether a vector came from the model or the cache
+            known.update((h, unpack(pack(v))) for h, v in fresh.items())
+        return [known[h] for h in hashes]
+
+    embed.cache = cache
+    return embed
@@ -29,6 +29,14 @@ SESSIONS_DIR = MEMORY_DIR / "sessions"
 PLANS_DIR = MEMORY_DIR / "plans"
 VECTORS_DIR = MEMORY_DIR / "vectors" / "lancedb"
 COLLECTION = "memstack_sessions"
+# Per-file size, mtime and hash, so unchanged files are never opened
+MANIFEST_PATH = VECTORS_DIR / "manifest.json"
+
+# Section boundaries come from the same tokenizer db/migrate.py imports with.
+sys.path.insert(0, str(PROJECT_ROOT / "db"))
+sys.path.insert(0, str(SCRIPT_DIR))
+from embed_cache import MODELS, cached_embedder  # noqa: E402
+from markdown_sections import iter_sections  # noqa: E402
 
 
 # --- Embedding ---
@@ -60,51 +68,32 @@ def get_embedder(provider_override: str | None = None):
             import openai
             client = openai.OpenAI()
             # Quick connectivity test
-            client.embeddings.create(input=["test"], model="text-embedding-3-small")
+            client.embeddings.create(input=["test"], model=MODELS["openai"])
 
             def openai_embed(texts: list[str]) -> list[list[float]]:
-                resp = client.embeddings.create(input=texts, model="text-embedding-3-small")
+                resp = client.embeddings.create(input=texts, model=MODELS["openai"])
                 return [d.embedding for d in resp.data]
 
-            return openai_embed, "openai"
+            return cached_embedder(openai_embed, "openai"), "openai"
         except Exception:
             return None, "openai-failed"
 
     try:
         from sentence_transformers import SentenceTransformer
-        model = SentenceTransformer("all-MiniLM-L6-v2")
+        model = SentenceTransformer(MODELS["local"])
 
         def local_embed(texts: list[str]) -> list[list[float]]:
             return model.encode(texts).tolist()
 
-        return local_embed, "local"
+        return cached_embedder(local_embed, "local"), "local"
     except ImportError:
         return None, "none"
 
 
 # --- Chunking ---
 
-_HEADING_RE = re.compile(r"^(#{1,6})\s+(.+)$", re.MULTILINE)
-
-
 def chunk_markdown(text: str, source: str) -> list[dict]:
     """Split markdown by headings into chunks with metadata."""
-    lines = text.split("\n")
-    headings: list[tuple[int, int, str]] = []
-    for i, line in enumerate(lines):
-        m = _HEADING_RE.match(line)
-        if m:
-            headings.append((i, len(m.group(1)), m.group(2).strip()))
-
-    sections: list[tuple[int, int, str, int]] = []
-    if not headings or headings[0][0] > 0:
-        end = headings[0][0] if headings else len(lines)
-        default_title = Path(source).stem or "General"
-        sections.append((0, end, default_title, 0))
-    for idx, (line_idx, level, title) in enumerate(headings):
-        next_start = headings[idx + 1][0] if idx + 1 < len(headings) else len(lines)
-        sections.append((line_idx, next_start, title, level))
-
     chunks = []
     # Extract date and project from filename
     stem = Path(source).stem
@@ -114,16 +103,16 @@ def chunk_markdown(text: str, source: str) -> list[dict]:
     file_project = date_match.group(2) if date_match else stem
     file_type = "plan" if parent == "plans" else "session"
 
-    for start, end, heading, level in sections:
-        content = "\n".join(lines[start:end]).strip()
+    for section in iter_sections(text):
+        content = section["text"].strip()
         if not content or len(content) < 20:
             continue
         content_hash = hashlib.sha256(content.encode()).hexdigest()[:16]
         chunks.append({
-            "id": f"{Path(source).name}:{start}:{content_hash}",
+            "id": f"{Path(source).name}:{section['line']}:{content_hash}",
             "content": content,
             "source": source,
-            "section_title": heading,
+            "section_title": section["title"] if section["level"] else stem or "General",
             "date": file_date,
             "project": file_project,
             "type": file_type,
@@ -143,14 +132,113 @@ def get_indexable_files() -> list[Path]:
     return files
 
 
-def run_index(force: bool = False, provider_override: str | None = None) -> dict:
-    """Index all session and plan markdown files into the vector DB."""
+def load_manifest() -> dict:
+    """path -> {size, mtime_ns, hash} of every file as of the last successful run."""
+    try:
+        return json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(manifest: dict) -> None:
+    MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = MANIFEST_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, MANIFEST_PATH)
+
+
+def changed_files(files: list[Path], manifest: dict) -> tuple[list, int, dict]:
+    """Split files on the manifest with stat() alone.
+
+    Returns ([(path, stat entry) to read], unchanged count, {path: entry} of
+    the unchanged files, to carry into the next manifest).
+    """
+    changed, kept = [], {}
+    for f in files:
+        try:
+            st = f.stat()
+        except OSError:
+            continue
+        entry = {"path": str(f), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        known = manifest.get(entry["path"])
+        if known and (known["size"], known["mtime_ns"]) == (entry["size"], entry["mtime_ns"]):
+            kept[entry["path"]] = known
+        else:
+            changed.append((f, entry))
+    return changed, len(kept), kept
+
+
+def select_columns(table, columns: list[str], where: str | None = None):
+    """Arrow batches of just ``columns`` (rows matching ``where``).
+
+    Read through the Lance dataset, so vectors and content a caller did not
+    ask for are never loaded. Without the pylance package to_lance() raises
+    ImportError, and the query builder does the projection instead. Any other
+    failure propagates: silently reading nothing would leave stale rows behind.
+    """
+    try:
+        dataset = table.to_lance()
+    except ImportError:
+        query = table.search().select(columns).limit(max(1, table.count_rows(where)))
+        if where:
+            query = query.where(where)
+        return query.to_arrow().to_batches()
+    return dataset.to_batches(columns=columns, filter=where)
+
+
+def stored_values(table, column: str) -> set:
+    """Distinct values of one column, read alone in Arrow batches.
+
+    Never materializes vectors or content: on a large index that is gigabytes.
+    """
+    values = set()
+    for batch in select_columns(table, [column]):
+        values.update(batch.column(0).to_pylist())
+    return values
+
+
+def stored_vectors(table, hashes: set[str]) -> dict:
+    """content_hash -> stored vector for those of ``hashes`` already in the table."""
+    if not hashes:
+        return {}
+    found = {}
+    for batch in select_columns(table, ["content_hash", "vector"],
+                                f"content_hash IN ({sql_list(sorted(hashes))})"):
+        found.update(zip(batch.column(0).to_pylist(), batch.column(1).to_pylist()))
+    return found
+
+
+def sql_list(values) -> str:
+    """Values as a quoted SQL list for a Lance filter predicate."""
+    return ", ".join("'" + str(v).replace("'", "''") + "'" for v in values)
+
+
+def recorded_provider() -> str | None:
+    """The provider the stored vectors were built with (metadata.json)."""
+    try:
+        return json.loads((VECTORS_DIR / "metadata.json").read_text(encoding="utf-8")).get("provider")
+    except (OSError, ValueError):
+        return None
+
+
+def run_index(force: bool = False, provider_override: str | None = None,
+              files: list | None = None, embedder: tuple | None = None) -> dict:
+    """Index session and plan markdown files into the vector DB.
+
+    ``files`` limits the run to those files (the watch command's batches;
+    --force is a full rebuild and ignores it). ``embedder`` is a
+    get_embedder() result to reuse instead of loading the model again.
+
+    Rows are reconciled per source file: an edited file's rows are deleted
+    and its new chunk set added, and rows of files that no longer exist are
+    removed, so the index stays clean without --force.
+    """
     try:
         import lancedb
     except ImportError:
         return {"ok": False, "error": "lancedb not installed. Run: pip install lancedb"}
 
-    embed_fn, provider = get_embedder(provider_override=provider_override)
+    embed_fn, provider = embedder or get_embedder(provider_override=provider_override)
     if embed_fn is None:
         if provider == "openai-missing-key":
             return {
@@ -172,66 +260,76 @@ def run_index(force: bool = False, provider_override: str | None = None) -> dict
                      "(pip install sentence-transformers).",
         }
 
-    files = get_indexable_files()
+    full = force or files is None
+    files = get_indexable_files() if full else [Path(f) for f in files]
+    # A file named in a partial run that no longer exists had its rows orphaned
+    gone = set() if full else {str(f) for f in files if not f.exists()}
     if not files:
         return {"ok": True, "chunks_indexed": 0, "files_scanned": 0, "embedding": provider}
 
-    # Collect all chunks
+    # Only files whose size or mtime moved since the last run are opened
+    manifest = {} if force else load_manifest()
+    changed, unchanged, seen = changed_files(files, manifest)
+
+    # Re-chunk each edited file whole: its rows are replaced as a set
+    replaced: set[str] = set()
     all_chunks = []
-    for f in files:
+    for f, entry in changed:
         try:
-            text = f.read_text(encoding="utf-8")
+            data = f.read_bytes()
         except Exception:
             continue
-        all_chunks.extend(chunk_markdown(text, str(f)))
-
-    if not all_chunks:
-        return {"ok": True, "chunks_indexed": 0, "files_scanned": len(files), "embedding": provider}
+        digest = hashlib.sha256(data).hexdigest()
+        seen[entry["path"]] = {**entry, "hash": digest}
+        if digest == manifest.get(entry["path"], {}).get("hash"):
+            continue  # touched, not edited
+        replaced.add(str(f))
+        all_chunks.extend(chunk_markdown(data.decode("utf-8"), str(f)))
+
+    if full:
+        manifest = seen  # files that vanished drop out
+    else:
+        manifest.update(seen)
+        for source in gone:
+            manifest.pop(source, None)
 
     # Connect to LanceDB
     VECTORS_DIR.mkdir(parents=True, exist_ok=True)
     db = lancedb.connect(str(VECTORS_DIR))
-
-    # Check for existing data to skip duplicates
-    existing_hashes: set[str] = set()
     table_names = db.list_tables().tables
-    if not force and COLLECTION in table_names:
-        table = db.open_table(COLLECTION)
-        try:
-            existing = table.to_list()
-            existing_hashes = set(r["content_hash"] for r in existing)
-        except Exception:
-            pass
+    if force and COLLECTION in table_names:
+        db.drop_table(COLLECTION)
+        table_names = db.list_tables().tables
+    table = db.open_table(COLLECTION) if COLLECTION in table_names else None
 
-    # Filter to new chunks only (unless --force)
-    if not force:
-        new_chunks = [c for c in all_chunks if c["content_hash"] not in existing_hashes]
-    else:
-        new_chunks = all_chunks
+    if table is not None and full:
+        # Rows of files that vanished since they were indexed
+        listed = {str(f) for f in files}
+        gone = {s for s in stored_values(table, "source") if s not in listed}
 
-    if not new_chunks:
-        return {
-            "ok": True,
-            "chunks_indexed": 0,
-            "files_scanned": len(files),
-            "embedding": provider,
-            "message": "All chunks already indexed",
-        }
+    # Vectors already stored for identical text are reused, not re-embedded
+    # (only when the table was built by this provider)
+    reuse = {}
+    if table is not None and recorded_provider() == provider:
+        reuse = stored_vectors(table, {c["content_hash"] for c in all_chunks})
+    to_embed = list({c["content_hash"]: c for c in all_chunks
+                     if c["content_hash"] not in reuse}.values())
 
     # Embed
-    texts = [c["content"] for c in new_chunks]
+    texts = [c["content"] for c in to_embed]
     # Batch embeddings in groups of 50 to avoid API limits
     all_vectors = []
     for i in range(0, len(texts), 50):
         batch = texts[i : i + 50]
         all_vectors.extend(embed_fn(batch))
+    reuse.update((c["content_hash"], v) for c, v in zip(to_embed, all_vectors))
 
     # Build records for LanceDB
     records = []
-    for chunk, vector in zip(new_chunks, all_vectors):
+    for chunk in all_chunks:
         records.append({
             "id": chunk["id"],
-            "vector": vector,
+            "vector": reuse[chunk["content_hash"]],
             "content": chunk["content"],
             "source": chunk["source"],
             "section_title": chunk["section_title"],
@@ -241,29 +339,37 @@ def run_index(force: bool = False, provider_override: str | None = None) -> dict
             "content_hash": chunk["content_hash"],
         })
 
-    # Upsert into LanceDB
-    if force and COLLECTION in table_names:
-        db.drop_table(COLLECTION)
-        table_names = db.list_tables().tables
-
-    if COLLECTION in table_names:
-        table = db.open_table(COLLECTION)
-        table.add(records)
-    else:
-        db.create_table(COLLECTION, records)
-
-    # Store embedding metadata so search.py uses the same provider
-    dimension = len(all_vectors[0]) if all_vectors else 0
-    metadata = {"provider": provider, "dimension": dimension}
-    metadata_path = VECTORS_DIR / "metadata.json"
-    metadata_path.write_text(json.dumps(metadata), encoding="utf-8")
-
-    return {
+    # Reconcile per source: drop every row of an edited or vanished file,
+    # then add the file's current chunk set
+    stale = (replaced | gone) if table is not None else set()
+    if stale:
+        table.delete(f"source IN ({sql_list(sorted(stale))})")
+    if records:
+        if table is not None:
+            table.add(records)
+        else:
+            db.create_table(COLLECTION, records)
+
+    if all_vectors:
+        # Store embedding metadata so search.py uses the same provider
+        metadata = {"provider": provider, "dimension": len(all_vectors[0])}
+        metadata_path = VECTORS_DIR / "metadata.json"
+        metadata_path.write_text(json.dumps(metadata), encoding="utf-8")
+    # Recorded only now, so a failed run re-reads the same files next time
+    save_manifest(manifest)
+
+    result = {
         "ok": True,
         "chunks_indexed": len(records),
-        "files_scanned": len(files),
+        "chunks_embedded": len(all_vectors),
+        "files_scanned": len(changed),
+        "files_unchanged": unchanged,
+        "sources_removed": len(gone),
         "embedding": provider,
     }
+    if not stale and not records:
+        result["message"] = "All chunks already indexed"
+    return result
 
 
 def main():
@@ -40,6 +40,10 @@ PROJECT_ROOT = SCRIPT_DIR.parent.parent
 VECTORS_DIR = PROJECT_ROOT / "memory" / "vectors" / "lancedb"
 COLLECTION = "memstack_sessions"
 
+# Query vectors come from the same cache the indexer fills
+sys.path.insert(0, str(SCRIPT_DIR))
+from embed_cache import MODELS, cached_embedder  # noqa: E402
+
 
 def _wants_openai(explicit: str | None = None) -> bool:
     """Whether OpenAI embeddings are explicitly opted into.
@@ -77,21 +81,21 @@ def get_embedder(required_provider: str | None = None):
             client = openai.OpenAI()
 
             def openai_embed(texts: list[str]) -> list[list[float]]:
-                resp = client.embeddings.create(input=texts, model="text-embedding-3-small")
+                resp = client.embeddings.create(input=texts, model=MODELS["openai"])
                 return [d.embedding for d in resp.data]
 
-            return openai_embed, "openai"
+            return cached_embedder(openai_embed, "openai"), "openai"
         except Exception:
             return None, "none"
 
     try:
         from sentence_transformers import SentenceTransformer
-        model = SentenceTransformer("all-MiniLM-L6-v2")
+        model = SentenceTransformer(MODELS["local"])
 
         def local_embed(texts: list[str]) -> list[list[float]]:
             return model.encode(texts).tolist()
 
-        return local_embed, "local"
+        return cached_embedder(local_embed, "local"), "local"
     except ImportError:
         return None, "none"
 
@@ -0,0 +1,82 @@
+"""Shared fixtures: load the memstack_db module against a throwaway database."""
+
+import argparse
+import importlib.util
+import json
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "db" / "memstack_db.py"
+
+
+def load_cli():
+    # A fresh copy per test, so module state (DB_PATH, _shared_db) never leaks.
+    spec = importlib.util.spec_from_file_location("memstack_db_cli", MODULE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def cli(tmp_path, monkeypatch):
+    """The CLI module with DB_PATH pointed at a fresh file under tmp_path."""
+    module = load_cli()
+    monkeypatch.setattr(module, "DB_PATH", tmp_path / "memstack.db")
+    # Keep the skill-loader bridge away from any real loader store on this machine.
+    monkeypatch.setenv("MEMSTACK_DB_PATH", str(tmp_path / "loader.db"))
+    return module
+
+
+@pytest.fixture
+def run(cli, capsys):
+    """Invoke a cmd_* handler and return its parsed JSON output.
+
+    Arguments the test omits take their argparse defaults, as on the CLI.
+    """
+    defaults = cli._command_defaults(cli.build_parser())
+
+    def _run(command, **kwargs):
+        handler = getattr(cli, "cmd_" + command.replace("-", "_"))
+        for key, value in kwargs.items():
+            if isinstance(value, dict):
+                kwargs[key] = json.dumps(value)
+        handler(argparse.Namespace(command=command, **{**defaults[command], **kwargs}))
+        out = capsys.readouterr().out
+        try:
+            return json.loads(out)
+        except json.JSONDecodeError:
+            return out
+    return _run
+
+
+@pytest.fixture
+def traced(cli, monkeypatch):
+    """Collect every statement the commands run, with parameters expanded."""
+    statements = []
+    real_get_db = cli.get_db
+
+    def get_db(*args, **kwargs):
+        conn = real_get_db(*args, **kwargs)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    monkeypatch.setattr(cli, "get_db", get_db)
+    return statements
+
+
+@pytest.fixture
+def query_plans(cli):
+    """EXPLAIN QUERY PLAN detail lines for each SELECT in a list of statements."""
+    def _plans(statements):
+        conn = sqlite3.connect(cli.DB_PATH)
+        try:
+            return {
+                sql: [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+                for sql in statements
+                if sql.lstrip().upper().startswith("SELECT")
+            }
+        finally:
+            conn.close()
+    return _plans
@@ -0,0 +1,105 @@
+"""MemStackDB: the in-process API the CLI commands are thin wrappers over."""
+
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+SHIM = Path(__file__).resolve().parents[1] / "db" / "memstack-db.py"
+
+
+@pytest.fixture
+def db(cli):
+    with cli.MemStackDB() as instance:
+        yield instance
+
+
+def test_rows_come_back_as_python_objects(db):
+    session_id = db.add_session({"project": "p", "date": "2026-04-01",
+                                 "accomplished": "wired the api", "raw_markdown": "# raw"})
+    db.add_insight({"project": "p", "type": "decision", "content": "api over subprocess"})
+    db.add_plan_task({"project": "p", "task_number": 1, "description": "ship it"})
+    assert db.update_task({"project": "p", "task_number": 1, "status": "completed"})
+    assert not db.update_task({"project": "p", "task_number": 9, "status": "completed"})
+    db.set_context({"project": "p", "status": "active"})
+
+    sessions = db.get_sessions("p", raw=True)
+    assert [(s["id"], s["raw_markdown"]) for s in sessions] == [(session_id, "# raw")]
+    assert [i["content"] for i in db.get_insights("p", fields=["content"])] == [
+        "api over subprocess"]
+    assert [t["status"] for t in db.get_plan("p")] == ["completed"]
+    assert db.get_context("p")["status"] == "active"
+    assert db.get_context("nobody") is None
+    assert {r["type"] for r in db.search("api")} == {"session", "insight"}
+    assert db.stats()["sessions"] == 1
+    assert "wired the api" in db.export_md("p")
+
+
+def test_writes_share_one_connection(db):
+    db.add_session({"project": "p"})
+    conn = db.connection()
+    db.add_session({"project": "p"})
+    db.set_context({"project": "p", "status": "active"})
+    assert db.connection() is conn
+
+
+def test_readers_are_pooled_per_thread(db):
+    db.add_session({"project": "p"})
+    with db.reading() as first:
+        pass
+    with db.reading() as again:
+        assert again is first  # returned to the pool and handed out again
+
+    # Threads reading at the same time each hold their own connection.
+    barrier = threading.Barrier(3)
+    held = []
+
+    def read():
+        with db.reading() as conn:
+            held.append(conn)
+            barrier.wait()
+            conn.execute("SELECT COUNT(*) FROM sessions").fetchone()
+
+    threads = [threading.Thread(target=read) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len({id(c) for c in held}) == 3
+    with pytest.raises(sqlite3.OperationalError, match="readonly"):
+        with db.reading() as conn:
+            conn.execute("DELETE FROM sessions")
+
+
+def test_bad_input_raises_instead_of_exiting(db):
+    with pytest.raises(ValueError, match="Missing required field: project"):
+        db.add_session({})
+    with pytest.raises(ValueError, match="search mode"):
+        db.search("x", mode="fuzzy")
+
+
+def test_cli_output_matches_the_api(db, run):
+    run("add-plan-task", json={"project": "p", "task_number": 1, "description": "one"})
+    assert run("get-plan", project="p")["tasks"] == db.get_plan("p")
+    page = run("get-sessions", project="p")
+    assert page["sessions"] == db.get_sessions("p")
+
+
+def test_closed_instance_refuses_work(cli):
+    db = cli.MemStackDB()
+    db.add_session({"project": "p"})
+    db.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        db.get_plan("p")
+
+
+def test_hyphenated_script_still_runs_the_cli(tmp_path):
+    env = dict(os.environ, MEMSTACK_SQLITE_PATH=str(tmp_path / "m.db"), MEMSTACK_NO_DAEMON="1",
+               MEMSTACK_DB_PATH=str(tmp_path / "loader.db"))
+    proc = subprocess.run([sys.executable, str(SHIM), "stats"], env=env,
+                          capture_output=True, text=True, check=True)
+    assert '"sessions": 0' in proc.stdout
@@ -0,0 +1,122 @@
+"""archive: old rows move to memstack-archive.db; search/export-md read both."""
+
+import datetime
+import sqlite3
+import threading
+
+import pytest
+
+
+def seed(cli, run):
+    run("add-session", json={"project": "p", "date": "2020-01-01",
+                             "accomplished": "ancient harbor work", "raw_markdown": "# old"})
+    run("add-session", json={"project": "p", "date": "2099-01-01",
+                             "accomplished": "recent harbor work"})
+    conn = sqlite3.connect(cli.DB_PATH)
+    conn.execute("INSERT INTO insights (project, type, content, created_at) "
+                 "VALUES ('p', 'decision', 'harbor insight from long ago', '2020-02-02 00:00:00')")
+    conn.commit()
+    conn.close()
+
+
+def count(path, table):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_parse_cutoff(cli):
+    today = datetime.date(2026, 3, 31)
+    assert cli.parse_cutoff("30d", today) == "2026-03-01"
+    assert cli.parse_cutoff("2w", today) == "2026-03-17"
+    assert cli.parse_cutoff("1y", today) == "2025-03-31"
+    assert cli.parse_cutoff("2025-06-01") == "2025-06-01"
+    with pytest.raises(ValueError):
+        cli.parse_cutoff("last tuesday")
+
+
+def test_archive_moves_old_rows(cli, run):
+    seed(cli, run)
+    assert run("archive", older_than="2021-01-01", dry_run=True)["sessions"] == 1
+    assert not cli.archive_path().exists()
+
+    out = run("archive", older_than="2021-01-01")
+    assert (out["sessions"], out["insights"]) == (1, 1)
+    assert count(cli.DB_PATH, "sessions") == 1 and count(cli.DB_PATH, "raw_blobs") == 0
+    archive = cli.archive_path()
+    assert count(archive, "sessions") == 1 and count(archive, "insights") == 1
+    assert count(archive, "raw_blobs") == 1
+    assert run("stats")["sessions"] == 1
+    # Nothing left to move; rerunning is harmless.
+    assert run("archive", older_than="2021-01-01")["sessions"] == 0
+
+
+def test_search_and_export_read_both_databases(cli, run):
+    seed(cli, run)
+    run("archive", older_than="2021-01-01")
+
+    results = run("search", query="harbor")["results"]
+    assert len(results) == 3
+    archived = [r for r in results if r.get("archived")]
+    assert {r["type"] for r in archived} == {"session", "insight"}
+    assert len(run("search", query="harbor", hot_only=True)["results"]) == 1
+
+    exported = run("export-md", project="p", raw=True)
+    assert "### 2020-01-01" in exported and "# old" in exported
+    assert "harbor insight from long ago" in exported
+    assert "2020-01-01" not in run("export-md", project="p", hot_only=True)
+
+
+def test_search_pages_across_both(cli, run):
+    seed(cli, run)
+    run("archive", older_than="2021-01-01")
+    first = run("search", query="harbor", limit=2)
+    second = run("search", query="harbor", limit=2, after=first["next_cursor"])
+    ids = [(r["type"], r["id"]) for r in first["results"] + second["results"]]
+    assert len(set(ids)) == 3
+
+
+def test_queued_bridge_insights_stay_hot(cli, run, monkeypatch):
+    monkeypatch.setattr(cli, "bridge_disabled_reason", lambda: None)
+    monkeypatch.setenv("MEMSTACK_BRIDGE_DRAIN", "off")
+    run("add-insight", json={"project": "p", "type": "lesson", "content": "keep me"})
+    conn = sqlite3.connect(cli.DB_PATH)
+    conn.execute("UPDATE insights SET created_at = '2020-01-01 00:00:00'")
+    conn.commit()
+    conn.close()
+    assert run("archive", older_than="2021-01-01")["insights"] == 0
+
+
+def test_dry_run_reads_past_a_writer(cli, run, monkeypatch):
+    seed(cli, run)
+    monkeypatch.setenv("MEMSTACK_BUSY_TIMEOUT_MS", "0")
+    monkeypatch.setattr(cli, "_pragmas", None)
+    writer = sqlite3.connect(cli.DB_PATH, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        out = run("archive", older_than="2021-01-01", dry_run=True)
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+    assert (out["sessions"], out["insights"]) == (1, 1)
+    assert cli.lock_retries == 0
+
+
+def test_every_attempt_closes_its_connection(cli, run, monkeypatch):
+    seed(cli, run)
+    monkeypatch.setenv("MEMSTACK_BUSY_TIMEOUT_MS", "0")
+    monkeypatch.setattr(cli, "_pragmas", None)
+    opened, get_db = [], cli.get_db
+    monkeypatch.setattr(cli, "get_db", lambda *a, **kw: opened.append(get_db(*a, **kw)) or opened[-1])
+    writer = sqlite3.connect(cli.DB_PATH, check_same_thread=False, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    timer = threading.Timer(0.2, lambda: (writer.execute("ROLLBACK"), writer.close()))
+    timer.start()
+    assert run("archive", older_than="2021-01-01")["sessions"] == 1
+    timer.join()
+    assert cli.lock_retries >= 1 and len(opened) == cli.lock_retries + 1
+    for conn in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
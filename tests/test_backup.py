@@ -0,0 +1,83 @@
+"""backup: online snapshots via the backup API or VACUUM INTO, verified and rotated."""
+
+import json
+import sqlite3
+import threading
+
+import pytest
+
+
+def count_sessions(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_snapshot_is_consistent_while_writers_run(cli, run, tmp_path):
+    for day in range(1, 30):
+        run("add-session", json={"project": "p", "date": f"2026-01-{day:02d}",
+                                 "accomplished": "x" * 2000})
+    stop = threading.Event()
+
+    def writer():
+        with cli.MemStackDB() as db:
+            while not stop.is_set():
+                db.add_session({"project": "w", "accomplished": "during backup"})
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        out = run("backup", dest=str(tmp_path / "snaps"), pages=2, sleep_ms=1)
+    finally:
+        stop.set()
+        thread.join()
+
+    snapshot = tmp_path / "snaps" / out["snapshot"].rsplit("/", 1)[-1]
+    assert out["method"] == "backup" and out["steps"] > 1 and out["integrity"] == "ok"
+    assert count_sessions(snapshot) >= 29
+    assert cli.file_sha256(snapshot) == out["sha256"]
+    assert (tmp_path / "snaps" / (snapshot.name + ".sha256")).read_text().startswith(out["sha256"])
+    conn = sqlite3.connect(snapshot)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    conn.close()
+    assert not list((tmp_path / "snaps").glob("*.partial"))
+
+
+def test_vacuum_snapshot_and_rotation(cli, run, tmp_path):
+    run("add-session", json={"project": "p", "accomplished": "keep me"})
+    dest = tmp_path / "snaps"
+    outs = [run("backup", dest=str(dest), vacuum=True, keep=2) for _ in range(3)]
+    assert [o["method"] for o in outs] == ["vacuum"] * 3
+    assert outs[2]["removed"] == [outs[0]["snapshot"]]
+    left = cli.list_snapshots(dest, cli.DB_PATH.stem)
+    assert [str(p) for p in left] == [outs[1]["snapshot"], outs[2]["snapshot"]]
+    assert sorted(p.name for p in dest.iterdir()) == sorted(
+        [p.name for p in left] + [p.name + ".sha256" for p in left])
+    assert count_sessions(left[-1]) == 1
+
+
+@pytest.mark.parametrize("keep", ["0", "-1", "two"])
+def test_keep_must_be_at_least_one(cli, tmp_path, keep, capsys):
+    with pytest.raises(SystemExit):
+        cli.build_parser().parse_args(["backup", "--keep", keep])
+    assert "at least 1" in capsys.readouterr().err
+    with cli.MemStackDB() as db, pytest.raises(ValueError):
+        db.backup(tmp_path / "snaps", keep=0)
+    assert not (tmp_path / "snaps").exists()
+
+
+def test_verify_flags_a_damaged_snapshot(cli, run, tmp_path, capsys):
+    run("add-session", json={"project": "p", "accomplished": "x"})
+    dest = tmp_path / "snaps"
+    out = run("backup", dest=str(dest))
+    assert run("backup", dest=str(dest), verify=True)["ok"] is True
+
+    with open(out["snapshot"], "r+b") as f:
+        f.seek(200)
+        f.write(b"\xff")
+    with pytest.raises(SystemExit):
+        run("backup", dest=str(dest), verify=True)
+    report = json.loads(capsys.readouterr().out)
+    assert report["ok"] is False and report["snapshots"][0]["sha256_ok"] is False
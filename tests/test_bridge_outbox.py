@@ -0,0 +1,132 @@
+"""Bridge outbox: add-insight queues, bridge-drain mirrors with retry/backoff."""
+
+import json
+import sqlite3
+
+import pytest
+
+
+class RecordingLoader:
+    def __init__(self, fail=False):
+        self.lessons = []
+        self.lookups = 0
+        self.fail = fail
+
+    def find_project_dirs_by_name(self, name):
+        self.lookups += 1
+        return ["/work/alpha"] if name == "alpha" else []
+
+    def insert_lesson(self, title, body, type_value, *, idempotency_key=None, **kwargs):
+        if self.fail:
+            raise sqlite3.OperationalError("database is locked")
+        self.lessons.append((title, type_value, dict(kwargs, idempotency_key=idempotency_key)))
+        return len(self.lessons)
+
+
+@pytest.fixture
+def loader(cli, monkeypatch):
+    loader = RecordingLoader()
+    monkeypatch.setattr(cli, "bridge_disabled_reason", lambda: None)
+    monkeypatch.setattr(cli, "_import_loader", lambda: (loader, None))
+    monkeypatch.setenv("MEMSTACK_BRIDGE_DRAIN", "off")
+    return loader
+
+
+def outbox(cli):
+    conn = sqlite3.connect(cli.DB_PATH)
+    conn.row_factory = sqlite3.Row
+    try:
+        return [dict(r) for r in conn.execute("SELECT * FROM bridge_outbox ORDER BY id")]
+    finally:
+        conn.close()
+
+
+def drain(cli, run, **kwargs):
+    return run("bridge-drain", **kwargs)
+
+
+def test_add_insight_queues_without_touching_the_loader(cli, run, loader):
+    out = run("add-insight", json={"project": "alpha", "type": "lesson", "content": "Use WAL."})
+    assert out["bridge_queued"] == 1
+    assert loader.lessons == [] and loader.lookups == 0
+    [row] = outbox(cli)
+    assert row["status"] == "pending" and row["insight_id"] == out["id"]
+    assert row["idempotency_key"].startswith(f"memstack-insight:{out['id']}:")
+
+
+def test_non_procedural_types_are_not_queued(cli, run, loader):
+    out = run("add-insight", json={"project": "alpha", "type": "decision", "content": "x"})
+    assert "bridge_queued" not in out
+    assert outbox(cli) == []
+
+
+def test_disabled_bridge_is_reported_not_queued(cli, run):
+    out = run("add-insight", json={"project": "alpha", "type": "lesson", "content": "x"})
+    assert out["bridge_skipped"] == "MEMSTACK_DB_PATH is set"
+    assert outbox(cli) == []
+
+
+def test_drain_mirrors_a_batch_with_one_resolution(cli, run, loader):
+    for i in range(4):
+        run("add-insight", json={"project": "alpha", "type": "gotcha", "content": f"L{i}. More"})
+    out = drain(cli, run)
+    assert out["claimed"] == 4 and out["bridged"] == 4 and out["pending"] == 0
+    assert loader.lookups == 1
+    assert loader.lessons[0][0] == "L0"
+    assert all(kw["idempotency_key"] for _, _, kw in loader.lessons)
+    assert {r["status"] for r in outbox(cli)} == {"done"}
+    # Settled rows are never picked up again.
+    assert drain(cli, run)["claimed"] == 0
+
+
+def test_unknown_project_is_skipped(cli, run, loader):
+    run("add-insight", json={"project": "nowhere", "type": "lesson", "content": "x"})
+    assert drain(cli, run)["skipped"] == 1
+    [row] = outbox(cli)
+    assert row["status"] == "skipped"
+    assert "nowhere" in json.loads(row["result"])["bridge_skipped"]
+
+
+def test_loader_errors_back_off_then_fail(cli, run, loader):
+    run("add-insight", json={"project": "alpha", "type": "lesson", "content": "x"})
+    loader.fail = True
+    out = drain(cli, run, max_attempts=2)
+    assert out["retrying"] == 1
+    [row] = outbox(cli)
+    assert row["status"] == "pending" and row["attempts"] == 1 and row["last_error"]
+    # Not due yet: the backoff pushed next_attempt_at into the future.
+    assert drain(cli, run, max_attempts=2)["claimed"] == 0
+
+    conn = sqlite3.connect(cli.DB_PATH)
+    conn.execute("UPDATE bridge_outbox SET next_attempt_at = datetime('now', '-1 second')")
+    conn.commit()
+    conn.close()
+    assert drain(cli, run, max_attempts=2)["failed"] == 1
+    assert outbox(cli)[0]["status"] == "failed"
+
+
+def test_loader_without_idempotency_key_still_bridges(cli, run, loader, monkeypatch):
+    calls = []
+
+    def insert_lesson(title, body, type_value, *, project_dir, stack_tags, created_at):
+        calls.append(title)
+        return 1
+
+    monkeypatch.setattr(loader, "insert_lesson", insert_lesson)
+    run("add-insight", json={"project": "alpha", "type": "lesson", "content": "x"})
+    assert drain(cli, run)["bridged"] == 1
+    assert calls == ["x"]
+
+
+def test_stats_reports_outbox(cli, run, loader):
+    run("add-insight", json={"project": "alpha", "type": "lesson", "content": "x"})
+    assert run("stats")["bridge_outbox"] == {"pending": 1}
+
+
+def test_daemon_requests_record_the_client_cwd(cli, loader, tmp_path):
+    args = cli.build_parser().parse_args(
+        ["add-insight", json.dumps({"project": "alpha", "type": "lesson", "content": "x"})])
+    code, _output = cli.run_command(args, cwd=str(tmp_path / "client"))
+    assert code == 0
+    assert [row["cwd"] for row in outbox(cli)] == [str(tmp_path / "client")]
+    assert cli._safe_cwd() != str(tmp_path / "client")  # reset after the request
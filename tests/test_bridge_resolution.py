@@ -10,16 +10,15 @@ These tests pin the three reasons apart, and pin the auto-registration guard:
 cwd must corroborate the name, so an ad-hoc label cannot mint a project.
 """
 
-import importlib.util
 import os
+import sys
 from pathlib import Path
 
 import pytest
 
-MODULE_PATH = Path(__file__).resolve().parents[1] / "db" / "memstack-db.py"
-_spec = importlib.util.spec_from_file_location("memstack_db_cli", MODULE_PATH)
-mdb = importlib.util.module_from_spec(_spec)
-_spec.loader.exec_module(mdb)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "db"))
+
+import memstack_db as mdb  # noqa: E402
 
 
 class FakeLoader:
@@ -0,0 +1,87 @@
+"""get_db: connection profiles, overrides, and the mode=ro read path."""
+
+import json
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+def config(cli, tmp_path, monkeypatch):
+    """Point CONFIG_PATH at a temp config.json with the given "db" section."""
+    def _write(db_section):
+        path = tmp_path / "config.json"
+        path.write_text(json.dumps({"db": db_section}), encoding="utf-8")
+        monkeypatch.setattr(cli, "CONFIG_PATH", path)
+    monkeypatch.delenv("MEMSTACK_DB_PROFILE", raising=False)
+    _write({})
+    return _write
+
+
+def pragma(conn, name):
+    return conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def test_default_profile_is_applied(cli, config):
+    conn = cli.get_db()
+    assert pragma(conn, "synchronous") == 1  # NORMAL
+    assert pragma(conn, "busy_timeout") == 5000
+    assert pragma(conn, "cache_size") == -16000
+    assert pragma(conn, "temp_store") == 2  # MEMORY
+    assert pragma(conn, "journal_mode") == "wal"
+    conn.close()
+
+
+def test_env_profile_beats_config_and_config_pragmas_override(cli, config, monkeypatch):
+    config({"profile": "safe", "pragmas": {"busy_timeout": 1234}})
+    conn = cli.get_db()
+    assert pragma(conn, "synchronous") == 2  # FULL
+    assert pragma(conn, "busy_timeout") == 1234
+    conn.close()
+
+    cli._pragmas = None
+    monkeypatch.setenv("MEMSTACK_DB_PROFILE", "fast")
+    conn = cli.get_db()
+    assert pragma(conn, "cache_size") == -64000
+    assert pragma(conn, "busy_timeout") == 1234
+    conn.close()
+
+
+@pytest.mark.parametrize("section", [
+    {"profile": "turbo"},
+    {"pragmas": {"cache_size": "1; DROP TABLE sessions"}},
+])
+def test_bad_settings_are_rejected(cli, config, section):
+    config(section)
+    with pytest.raises(ValueError):
+        cli.get_db()
+
+
+def test_readonly_connection_cannot_write(cli, config):
+    cli.get_db().close()
+    conn = cli.get_db(readonly=True)
+    assert conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] == 0
+    with pytest.raises(sqlite3.OperationalError, match="readonly"):
+        conn.execute("INSERT INTO sessions (project, date) VALUES ('p', 'd')")
+    conn.close()
+
+
+def test_readonly_falls_back_to_create_and_migrate(cli, config):
+    assert not cli.DB_PATH.exists()
+    conn = cli.get_db(readonly=True)
+    assert pragma(conn, "user_version") == cli.SCHEMA_VERSION
+    conn.close()
+
+    # A database left behind by an older version is migrated before reading.
+    raw = sqlite3.connect(cli.DB_PATH)
+    raw.execute("PRAGMA user_version = 1")
+    raw.close()
+    conn = cli.get_db(readonly=True)
+    conn.execute("INSERT INTO sessions (project, date) VALUES ('p', 'd')")  # read-write
+    conn.close()
+
+
+def test_read_commands_see_committed_writes(run, config):
+    run("add-session", json={"project": "p", "date": "2026-01-01"})
+    assert run("get-sessions", project="p", limit=5)["count"] == 1
+    assert run("stats")["sessions"] == 1
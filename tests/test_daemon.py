@@ -0,0 +1,157 @@
+"""serve: JSON-lines daemon on a Unix socket, and the thin-client fallback."""
+
+import importlib.util
+import json
+import socket
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+CLIENT_PATH = Path(__file__).resolve().parents[1] / "db" / "memstack-db.py"
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs AF_UNIX")
+
+
+@pytest.fixture
+def daemon(cli, tmp_path):
+    """A live MemStackServer on its own shared MemStackDB, torn down after the test."""
+    path = tmp_path / "memstack.sock"
+    cli._shared_db = cli.MemStackDB()
+    server = cli.make_server(path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield path
+    server.shutdown()
+    server.server_close()
+    cli._shared_db.close()
+    cli._shared_db = None
+
+
+def test_request_reply_matches_in_process_output(cli, daemon):
+    reply = cli.daemon_request(
+        {"command": "add-session", "json": {"project": "p", "date": "2026-03-01",
+                                            "accomplished": "wired the daemon"}},
+        socket_path=daemon,
+    )
+    assert reply["exit"] == 0
+    assert json.loads(reply["output"]) == {"ok": True, "id": 1}
+
+    reply = cli.daemon_request({"command": "search", "query": "daemon"}, socket_path=daemon)
+    hits = json.loads(reply["output"])["results"]
+    assert [h["id"] for h in hits] == [1]
+
+
+def test_one_connection_carries_many_requests(daemon):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(daemon))
+        reader = sock.makefile("rb")
+        for _ in range(3):
+            sock.sendall(b'{"command": "stats"}\n')
+            reply = json.loads(reader.readline())
+            assert reply["exit"] == 0
+            assert json.loads(reply["output"])["sessions"] == 0
+
+
+def test_validation_errors_come_back_as_exit_codes(cli, daemon):
+    reply = cli.daemon_request({"command": "add-session", "json": {}}, socket_path=daemon)
+    assert reply["exit"] == 1
+    assert "Missing required field: project" in reply["output"]
+    reply = cli.daemon_request({"command": "nope"}, socket_path=daemon)
+    assert reply["exit"] == 1
+
+
+def test_shared_connection_survives_requests(cli, daemon):
+    for _ in range(2):
+        reply = cli.daemon_request({"command": "get-plan", "project": "p"}, socket_path=daemon)
+        assert reply["exit"] == 0
+
+
+def test_no_daemon_means_in_process_fallback(cli, tmp_path):
+    assert cli.daemon_request({"command": "stats"}, socket_path=tmp_path / "absent.sock") is None
+    stale = tmp_path / "stale.sock"
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(str(stale))
+    sock.close()  # file exists, nobody listening
+    assert cli.daemon_request({"command": "stats"}, socket_path=stale) is None
+
+
+def test_client_on_another_database_runs_locally(cli, daemon, tmp_path):
+    other = tmp_path / "other.db"
+    request = {"command": "add-session", "db": str(other),
+               "json": {"project": "p", "date": "2026-03-01", "accomplished": "elsewhere"}}
+    assert cli.daemon_request(request, socket_path=daemon) is None
+    reply = cli.daemon_request({**request, "db": str(cli.DB_PATH)}, socket_path=daemon)
+    assert reply["exit"] == 0
+    stats = cli.daemon_request({"command": "stats"}, socket_path=daemon)
+    assert json.loads(stats["output"])["sessions"] == 1
+
+
+def test_batch_jobs_and_ndjson_are_declined(cli, daemon):
+    for command in ("archive", "backup", "dedupe"):
+        assert cli.daemon_request({"command": command}, socket_path=daemon) is None
+    request = {"argv": ["get-sessions", "p", "--ndjson"]}
+    assert cli.daemon_request(request, socket_path=daemon) is None
+
+
+def test_client_with_other_bridge_settings_runs_locally(cli, daemon, monkeypatch):
+    # The client redirected the loader store (which turns bridging off); the
+    # daemon did not, so it must not queue the client's insight for mirroring.
+    monkeypatch.delenv("MEMSTACK_DB_PATH")
+    request = {"command": "add-insight", "json": {"project": "p", "type": "lesson",
+                                                  "content": "stay local"},
+               "env": {"MEMSTACK_DB_PATH": "/tmp/elsewhere.db"}}
+    assert cli.daemon_request(request, socket_path=daemon) is None
+    assert json.loads(cli.daemon_request({"command": "stats"},
+                                         socket_path=daemon)["output"])["insights"] == 0
+    reply = cli.daemon_request({**request, "env": {}}, socket_path=daemon)
+    assert reply["exit"] == 0
+
+
+@pytest.fixture
+def client(cli, daemon, monkeypatch):
+    """db/memstack-db.py, the thin client, pointed at the test daemon."""
+    spec = importlib.util.spec_from_file_location("memstack_thin_client", CLIENT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.delenv("MEMSTACK_NO_DAEMON", raising=False)
+    monkeypatch.setattr(module, "SOCKET_PATH", str(daemon))
+    monkeypatch.setattr(module, "DB_PATH", str(cli.DB_PATH))
+    return module
+
+
+def test_thin_client_forwards_argv(client):
+    code, output = client.forward(
+        ["add-session", '{"project": "p", "date": "2026-03-01", "accomplished": "thin"}'])
+    assert code == 0 and json.loads(output) == {"ok": True, "id": 1}
+    code, output = client.forward(["get-sessions", "p", "--fields", "id,accomplished"])
+    assert json.loads(output)["sessions"] == [{"id": 1, "accomplished": "thin"}]
+
+
+def test_thin_client_runs_locally_what_the_daemon_declines(client):
+    assert client.forward(["get-sessions", "p", "--ndjson"]) is None
+    assert client.forward(["get-sessions"]) is None  # usage error: argparse reports it here
+    assert client.forward(["--help"]) is None
+    assert client.forward(["backup"]) is None
+
+
+def test_thin_client_imports_no_backend():
+    # The forwarding path must not pay for memstack_db, sqlite3 or argparse.
+    code = ("import runpy, sys; runpy.run_path(sys.argv[1], run_name='client');"
+            "print(sorted({'memstack_db', 'sqlite3', 'argparse'} & set(sys.modules)))")
+    out = subprocess.run([sys.executable, "-c", code, str(CLIENT_PATH)],
+                         capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
+
+
+def test_backend_import_leaves_rarely_used_modules_unloaded():
+    # Every cold CLI call imports memstack_db: the daemon, watcher and bridge
+    # spawner load their modules when they run, not at import.
+    code = ("import sys; sys.path.insert(0, sys.argv[1]); import memstack_db;"
+            "print(sorted({'socketserver', 'concurrent.futures', 'subprocess', 'socket',"
+            " 'signal', 'inspect', 'importlib.util'} & set(sys.modules)))")
+    out = subprocess.run([sys.executable, "-c", code, str(CLIENT_PATH.parent)],
+                         capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
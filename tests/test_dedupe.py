@@ -0,0 +1,87 @@
+"""Near-duplicate insights: MinHash/LSH lookup on add-insight, and `dedupe`."""
+
+import json
+import sqlite3
+
+import pytest
+
+LESSON = "Always run the migrations before deploying the api service to production"
+REWORDED = "always run migrations before deploying the API service to production!"
+
+
+def query(cli, sql, *params):
+    conn = sqlite3.connect(cli.DB_PATH)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def test_signatures_estimate_similarity(cli):
+    same = cli.signature_similarity(cli.minhash_signature(LESSON), cli.minhash_signature(LESSON))
+    close = cli.signature_similarity(cli.minhash_signature(LESSON),
+                                     cli.minhash_signature(REWORDED))
+    far = cli.signature_similarity(cli.minhash_signature(LESSON),
+                                   cli.minhash_signature("cache invalidation needs a counter"))
+    assert same == 1.0 and close >= 0.6 and far < 0.2
+    assert len(cli.lsh_buckets(cli.minhash_signature(LESSON))) == cli.LSH_BANDS
+
+
+def test_near_duplicate_merges_into_the_stored_insight(cli, run):
+    first = run("add-insight", json={"project": "p", "type": "lesson", "content": LESSON,
+                                     "tags": "deploy"})
+    again = run("add-insight", json={"project": "p", "type": "lesson", "content": REWORDED,
+                                     "tags": "Deploy, db"})
+    assert again["merged"] and again["id"] == first["id"] == again["duplicate_of"]
+    assert again["seen_count"] == 2 and "bridge_queued" not in again
+    [(count, tags, last_seen)] = query(cli, "SELECT seen_count, tags, last_seen FROM insights")
+    assert (count, tags) == (2, "deploy,db") and last_seen
+    assert [r[0] for r in query(cli, "SELECT tag FROM insight_tags ORDER BY tag")] == ["db", "deploy"]
+
+
+def test_scope_is_project_and_type(run):
+    run("add-insight", json={"project": "p", "type": "lesson", "content": LESSON})
+    assert "merged" not in run("add-insight", json={"project": "q", "type": "lesson",
+                                                    "content": LESSON})
+    assert "merged" not in run("add-insight", json={"project": "p", "type": "gotcha",
+                                                    "content": LESSON})
+
+
+def test_reject_and_keep(cli, run, capsys):
+    run("add-insight", json={"project": "p", "type": "lesson", "content": LESSON})
+    with pytest.raises(SystemExit):
+        run("add-insight", json={"project": "p", "type": "lesson", "content": REWORDED},
+            on_duplicate="reject")
+    out = json.loads(capsys.readouterr().out)
+    assert out["ok"] is False and out["duplicate_of"] == 1
+    kept = run("add-insight", json={"project": "p", "type": "lesson", "content": REWORDED},
+               on_duplicate="keep")
+    assert kept["id"] == 2
+    assert query(cli, "SELECT COUNT(*) FROM insights") == [(2,)]
+
+
+def test_dedupe_collapses_stored_duplicates(cli, run):
+    for content in (LESSON, "unrelated note about caching", REWORDED, LESSON):
+        run("add-insight", json={"project": "p", "type": "lesson", "content": content,
+                                 "tags": "x"}, on_duplicate="keep")
+    preview = run("dedupe", dry_run=True)
+    assert [(p["id"], p["duplicate_of"]) for p in preview["pairs"]] == [(3, 1), (4, 1)]
+    assert preview["merged"] == 0 and query(cli, "SELECT COUNT(*) FROM insights") == [(4,)]
+
+    out = run("dedupe")
+    assert out["merged"] == 2 and out["scanned"] == 4
+    assert query(cli, "SELECT id, seen_count FROM insights ORDER BY id") == [(1, 3), (2, 1)]
+    assert query(cli, "SELECT DISTINCT insight_id FROM insight_lsh ORDER BY 1") == [(1,), (2,)]
+    assert run("dedupe")["merged"] == 0
+
+
+def test_migration_signs_existing_insights(cli):
+    conn = sqlite3.connect(cli.DB_PATH)
+    conn.executescript(cli.SCHEMA_PATH.read_text())
+    conn.executemany("INSERT INTO insights (project, type, content) VALUES ('p', 'lesson', ?)",
+                     [(LESSON,), (REWORDED,)])
+    conn.commit()
+    conn.close()
+    with cli.MemStackDB() as db:
+        assert db.dedupe(dry_run=True)["pairs"] == [
+            {"id": 2, "duplicate_of": 1, "similarity": pytest.approx(0.75, abs=0.25)}]
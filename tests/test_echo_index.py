@@ -0,0 +1,155 @@
+"""Echo indexer bookkeeping that runs without lancedb or an embedding model."""
+
+import importlib.util
+import os
+import re
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+INDEXER_PATH = Path(__file__).resolve().parents[1] / "skills" / "echo" / "index-sessions.py"
+
+
+@pytest.fixture
+def indexer(tmp_path, monkeypatch):
+    spec = importlib.util.spec_from_file_location("echo_index", INDEXER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.setattr(module, "MANIFEST_PATH", tmp_path / "vectors" / "manifest.json")
+    return module
+
+
+def test_manifest_round_trips_atomically(indexer):
+    assert indexer.load_manifest() == {}
+    indexer.save_manifest({"a.md": {"size": 1, "mtime_ns": 2, "hash": "h"}})
+    assert indexer.load_manifest() == {"a.md": {"size": 1, "mtime_ns": 2, "hash": "h"}}
+    assert [p.name for p in indexer.MANIFEST_PATH.parent.iterdir()] == ["manifest.json"]
+
+
+def test_changed_files_needs_only_stat(indexer, tmp_path):
+    same, edited, new = (tmp_path / n for n in ("same.md", "edited.md", "new.md"))
+    for f in (same, edited, new):
+        f.write_text("text")
+    manifest = {}
+    for f in (same, edited):
+        st = f.stat()
+        manifest[str(f)] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": "h"}
+    os.utime(edited, ns=(0, 0))
+
+    changed, unchanged, kept = indexer.changed_files([same, edited, new, tmp_path / "gone.md"],
+                                                     manifest)
+    assert [f.name for f, _ in changed] == ["edited.md", "new.md"]
+    assert unchanged == 1 and kept == {str(same): manifest[str(same)]}
+    assert changed[0][1] == {"path": str(edited), "size": 4, "mtime_ns": 0}
+
+
+class FakeColumn:
+    def __init__(self, values):
+        self.values = values
+
+    def to_pylist(self):
+        return list(self.values)
+
+
+class FakeBatch:
+    def __init__(self, rows, columns):
+        self.rows, self.columns = rows, columns
+
+    def column(self, i):
+        return FakeColumn([row[self.columns[i]] for row in self.rows])
+
+
+class FakeTable:
+    """The slice of a LanceDB table run_index uses, over a list of dicts."""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.deletes, self.batch_columns = [], []
+
+    def add(self, records):
+        self.rows.extend(records)
+
+    def delete(self, predicate):
+        self.deletes.append(predicate)
+        doomed = set(re.findall(r"'((?:[^']|'')*)'", predicate))
+        self.rows = [r for r in self.rows if r["source"].replace("'", "''") not in doomed]
+
+    def to_lance(self):
+        return self
+
+    def to_batches(self, columns, filter=None):
+        self.batch_columns.append(columns)
+        wanted = set(re.findall(r"'([^']*)'", filter)) if filter else None
+        rows = [r for r in self.rows if wanted is None or r["content_hash"] in wanted]
+        return [FakeBatch(rows, columns)]
+
+
+@pytest.fixture
+def lance(monkeypatch, indexer, tmp_path):
+    tables = {}
+    db = SimpleNamespace(
+        list_tables=lambda: SimpleNamespace(tables=list(tables)),
+        open_table=tables.__getitem__,
+        create_table=lambda name, records: tables.__setitem__(name, FakeTable(records)),
+        drop_table=tables.__delitem__,
+    )
+    monkeypatch.setitem(sys.modules, "lancedb", SimpleNamespace(connect=lambda path: db))
+    monkeypatch.setattr(indexer, "VECTORS_DIR", tmp_path / "vectors")
+    return tables
+
+
+def test_stored_values_streams_one_column(indexer):
+    table = FakeTable([{"source": "a.md"}, {"source": "b.md"}, {"source": "a.md"}])
+    assert indexer.stored_values(table, "source") == {"a.md", "b.md"}
+    assert table.batch_columns == [["source"]]
+
+
+def test_scan_failures_are_not_swallowed(indexer):
+    class Broken(FakeTable):
+        def to_lance(self):
+            raise OSError("corrupt dataset")
+
+    with pytest.raises(OSError):
+        indexer.stored_values(Broken([]), "source")
+
+
+def test_index_replaces_changed_sources_and_drops_removed_ones(indexer, lance, tmp_path,
+                                                                monkeypatch):
+    notes = {name: tmp_path / f"2026-05-0{i}-{name}.md"
+             for i, name in enumerate(("edited", "kept", "removed"), 1)}
+    for name, path in notes.items():
+        path.write_text(f"# {name}\n\n## Work\nThe {name} file holds this paragraph.\n")
+    monkeypatch.setattr(indexer, "get_indexable_files",
+                        lambda: [p for p in notes.values() if p.exists()])
+    embedded = []
+
+    def embed(texts):
+        embedded.extend(texts)
+        return [[float(len(t))] for t in texts]
+
+    embedder = (embed, "local")
+    assert indexer.run_index(embedder=embedder)["chunks_indexed"] == 3
+    table = lance[indexer.COLLECTION]
+    kept_rows = [r for r in table.rows if r["source"] == str(notes["kept"])]
+
+    notes["edited"].write_text("# edited\n\n## Work\nRewritten: the edited file changed.\n")
+    notes["removed"].unlink()
+    embedded.clear()
+    result = indexer.run_index(embedder=embedder)
+
+    assert result["files_scanned"] == 1 and result["sources_removed"] == 1
+    assert embedded == [r["content"] for r in table.rows
+                        if r["source"] == str(notes["edited"])]  # only the new text
+    by_source = {}
+    for row in table.rows:
+        by_source.setdefault(row["source"], []).append(row)
+    assert set(by_source) == {str(notes["edited"]), str(notes["kept"])}
+    assert [r["content"] for r in by_source[str(notes["edited"])]] == [
+        "## Work\nRewritten: the edited file changed."]
+    assert by_source[str(notes["kept"])] == kept_rows  # untouched
+
+
+def test_sql_list_quotes_paths(indexer):
+    assert indexer.sql_list(["a.md", "it's.md"]) == "'a.md', 'it''s.md'"
@@ -0,0 +1,62 @@
+"""Echo's embedding cache: only text it has not seen reaches the model."""
+
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+CACHE_PATH = Path(__file__).resolve().parents[1] / "skills" / "echo" / "embed_cache.py"
+
+
+@pytest.fixture
+def embed_cache():
+    spec = importlib.util.spec_from_file_location("echo_embed_cache", CACHE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def fake_model(calls):
+    def embed(texts):
+        calls.append(list(texts))
+        return [[float(len(t)), 0.5] for t in texts]
+    return embed
+
+
+def test_only_new_text_is_embedded(embed_cache, tmp_path):
+    calls = []
+    path = tmp_path / "embeddings.db"
+    embed = embed_cache.cached_embedder(fake_model(calls), "local",
+                                        cache=embed_cache.EmbeddingCache(path))
+    assert embed(["alpha", "beta", "alpha"]) == [[5.0, 0.5], [4.0, 0.5], [5.0, 0.5]]
+    assert calls == [["alpha", "beta"]]
+
+    # A new process (a --force rebuild, a search) reads the same file
+    embed = embed_cache.cached_embedder(fake_model(calls), "local",
+                                        cache=embed_cache.EmbeddingCache(path))
+    assert embed(["beta", "gamma"]) == [[4.0, 0.5], [5.0, 0.5]]
+    assert calls[1:] == [["gamma"]]
+
+    # Another model never sees these vectors
+    other = embed_cache.cached_embedder(fake_model(calls), "local", model="other",
+                                        cache=embed_cache.EmbeddingCache(path))
+    other(["alpha"])
+    assert calls[2:] == [["alpha"]]
+
+
+def test_least_recently_used_rows_are_evicted(embed_cache, tmp_path):
+    # Each two-float vector is 8 bytes: room for four
+    cache = embed_cache.EmbeddingCache(tmp_path / "embeddings.db", max_bytes=32)
+    for h in "abcd":
+        cache.put_many("local", "m", {h: [1.0, 2.0]})
+    cache.get_many("local", "m", ["a"])  # a is now the most recently used
+    cache.put_many("local", "m", {"e": [5.0, 5.0]})
+    # Over the limit: the oldest rows go until the cache is back under 90% of it
+    assert sorted(cache.get_many("local", "m", "abcde")) == ["a", "d", "e"]
+    assert cache.size() == 24
+
+
+def test_zero_size_turns_the_cache_off(embed_cache, monkeypatch):
+    monkeypatch.setenv("MEMSTACK_EMBED_CACHE_MB", "0")
+    model = fake_model([])
+    assert embed_cache.cached_embedder(model, "local") is model
@@ -0,0 +1,101 @@
+"""search --mode hybrid|semantic: echo vector hits fused with FTS by RRF."""
+
+import threading
+import types
+
+import pytest
+
+
+@pytest.fixture
+def echo(cli, monkeypatch):
+    """A stand-in for skills/echo/search.py that records how it was called."""
+    calls = []
+    module = types.SimpleNamespace(results=[], calls=calls)
+
+    def run_search(query, top_k=5):
+        calls.append((query, top_k, threading.current_thread().name))
+        return list(module.results)
+
+    module.run_search = run_search
+    monkeypatch.setattr(cli, "_echo_search", module)
+    return module
+
+
+def chunk(project, date, content, type_="session", source="memory/sessions/x.md"):
+    return {"content": content, "source": source, "section_title": "Accomplished",
+            "score": 0.9, "date": date, "project": project, "type": type_}
+
+
+def seed(run):
+    run("add-session", json={"project": "p", "date": "2026-01-01", "accomplished": "tuned the harbor"})
+    run("add-session", json={"project": "p", "date": "2026-01-02", "accomplished": "harbor cranes"})
+    run("add-session", json={"project": "p", "date": "2026-01-03", "accomplished": "quay lighting"})
+
+
+def test_hybrid_fuses_both_rankings(cli, run, echo):
+    seed(run)
+    echo.results = [
+        chunk("p", "2026-01-02", "harbor cranes"),
+        chunk("p", "2026-01-03", "quay lighting"),
+        chunk("p", "", "- [ ] dredge the channel", type_="plan", source="memory/plans/p.md"),
+    ]
+    out = run("search", query="harbor", mode="hybrid")
+    results = out["results"]
+    assert out["mode"] == "hybrid"
+    # 2026-01-02 is in both lists, so it outranks everything found once.
+    assert results[0]["date"] == "2026-01-02"
+    assert results[0]["matched_by"] == ["lexical", "semantic"]
+    assert {r["date"] for r in results if r["type"] == "session"} == {
+        "2026-01-01", "2026-01-02", "2026-01-03"}
+    [plan] = [r for r in results if r["type"] == "plan"]
+    assert plan["id"] is None and plan["source"] == "memory/plans/p.md"
+    assert all(a["score"] >= b["score"] for a, b in zip(results, results[1:]))
+    # The vector search ran on a worker thread, alongside the FTS query.
+    assert echo.calls[0][2] != threading.current_thread().name
+
+
+def test_semantic_mode_skips_fts(cli, run, echo):
+    seed(run)
+    echo.results = [chunk("p", "2026-01-03", "quay lighting")]
+    results = run("search", query="harbor", mode="semantic")["results"]
+    assert [r["date"] for r in results] == ["2026-01-03"]
+    assert results[0]["matched_by"] == ["semantic"] and results[0]["type"] == "session"
+
+
+def test_echo_errors_leave_lexical_results(cli, run, monkeypatch):
+    seed(run)
+    monkeypatch.setattr(cli, "_semantic_hits", lambda query, top_k: ([], "lancedb not installed"))
+    out = run("search", query="harbor", mode="hybrid")
+    assert out["semantic_error"] == "lancedb not installed"
+    assert len(out["results"]) == 2
+
+
+def test_fused_results_page_by_position(cli, run, echo):
+    seed(run)
+    echo.results = [chunk("p", "2026-01-03", "quay lighting")]
+    first = run("search", query="harbor", mode="hybrid", limit=2)
+    second = run("search", query="harbor", mode="hybrid", limit=2, after=first["next_cursor"])
+    dates = [r["date"] for r in first["results"] + second["results"]]
+    assert sorted(dates) == ["2026-01-01", "2026-01-02", "2026-01-03"]
+
+
+def test_chunk_from_a_shared_day_links_to_no_session(cli, run, echo):
+    run("add-session", json={"project": "p", "date": "2026-01-04", "accomplished": "morning"})
+    run("add-session", json={"project": "p", "date": "2026-01-04", "accomplished": "evening"})
+    echo.results = [chunk("p", "2026-01-04", "evening dredging")]
+    [result] = run("search", query="dredging", mode="semantic")["results"]
+    assert result["id"] is None and result["source"] == "memory/sessions/x.md"
+
+
+def test_imported_chunk_links_by_source_file(cli, run, echo):
+    run("init")
+    conn = cli.get_db()
+    conn.execute("INSERT INTO sessions (project, date, accomplished, source) "
+                 "VALUES ('p', '2026-01-05', 'imported', 'sessions/2026-01-05-p.md')")
+    conn.commit()
+    conn.close()
+    echo.results = [chunk("p", "2026-01-05", "x", source="/home/u/memory/sessions/2026-01-05-p.md"),
+                    chunk("p", "2026-01-05", "y", source="/home/u/memory/sessions/other.md")]
+    first, second = run("search", query="x", mode="semantic")["results"]
+    assert first["accomplished"] == "imported"
+    assert second["id"] is None and second["source"].endswith("other.md")
@@ -0,0 +1,110 @@
+"""ingest: chunked NDJSON bulk load with per-line errors and queued bridging."""
+
+import argparse
+import json
+import sqlite3
+import threading
+
+import pytest
+
+
+def ingest(cli, capsys, tmp_path, kind, lines, chunk_size=500):
+    path = tmp_path / f"{kind}.ndjson"
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    code = 0
+    try:
+        cli.cmd_ingest(argparse.Namespace(kind=kind, file=str(path), chunk_size=chunk_size))
+    except SystemExit as exc:
+        code = exc.code
+    return code, json.loads(capsys.readouterr().out)
+
+
+def count(cli, table):
+    conn = sqlite3.connect(cli.DB_PATH)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_sessions_load_in_chunks(cli, capsys, tmp_path):
+    lines = [json.dumps({"project": "p", "date": f"2026-01-{d:02d}"}) for d in range(1, 8)]
+    code, out = ingest(cli, capsys, tmp_path, "sessions", lines, chunk_size=3)
+    assert code == 0 and out["ok"]
+    assert out["written"] == 7 and out["chunks"] == 3
+    assert count(cli, "sessions") == 7
+
+
+def test_bad_lines_are_reported_without_aborting(cli, capsys, tmp_path):
+    lines = [
+        json.dumps({"content": "first", "type": "bug"}),
+        "{not json",
+        json.dumps({"type": "lesson"}),
+        "",
+        json.dumps(["not", "an", "object"]),
+        json.dumps({"content": "last"}),
+    ]
+    code, out = ingest(cli, capsys, tmp_path, "insights", lines)
+    assert code == 1 and not out["ok"]
+    assert out["written"] == 2
+    assert [e["line"] for e in out["errors"]] == [2, 3, 5]
+    assert out["errors"][1]["error"] == "Missing required field: content"
+    conn = sqlite3.connect(cli.DB_PATH)
+    types = [r[0] for r in conn.execute("SELECT type FROM insights ORDER BY id")]
+    conn.close()
+    assert types == ["gotcha", "decision"]  # normalize_type applies in bulk too
+
+
+def test_a_failing_row_only_loses_its_own_line(cli, capsys, tmp_path):
+    lines = [
+        json.dumps({"project": "p", "task_number": 1, "description": "ok"}),
+        json.dumps({"project": "p", "task_number": 2, "description": "bad", "status": {"x": 1}}),
+        json.dumps({"project": "p", "task_number": 3, "description": "ok"}),
+    ]
+    code, out = ingest(cli, capsys, tmp_path, "plan-tasks", lines)
+    assert out["written"] == 2
+    assert [e["line"] for e in out["errors"]] == [2]
+    assert count(cli, "plans") == 2
+
+
+def test_plan_tasks_upsert(cli, capsys, tmp_path):
+    task = {"project": "p", "task_number": 1, "description": "v1"}
+    ingest(cli, capsys, tmp_path, "plan-tasks", [json.dumps(task)])
+    task.update(description="v2", status="completed")
+    ingest(cli, capsys, tmp_path, "plan-tasks", [json.dumps(task)])
+    assert count(cli, "plans") == 1
+
+
+@pytest.mark.parametrize("chunk_size", [1, 100])
+def test_ingested_insights_queue_bridge_mirrors(cli, capsys, tmp_path, monkeypatch, chunk_size):
+    monkeypatch.setattr(cli, "bridge_disabled_reason", lambda: None)
+    monkeypatch.setenv("MEMSTACK_BRIDGE_DRAIN", "off")
+    lines = [json.dumps({"project": "alpha", "type": t, "content": f"c{i}"})
+             for i, t in enumerate(["lesson", "decision", "gotcha"])]
+    _, out = ingest(cli, capsys, tmp_path, "insights", lines, chunk_size=chunk_size)
+    assert out["bridge_queued"] == 2
+    assert count(cli, "bridge_outbox") == 2
+
+
+def test_locked_chunks_are_retried(cli, run, capsys, tmp_path, monkeypatch):
+    run("init")
+    monkeypatch.setenv("MEMSTACK_BUSY_TIMEOUT_MS", "0")
+    monkeypatch.setattr(cli, "_pragmas", None)
+    holder = sqlite3.connect(cli.DB_PATH, check_same_thread=False, isolation_level=None)
+    holder.execute("BEGIN IMMEDIATE")
+    timer = threading.Timer(0.2, lambda: (holder.execute("COMMIT"), holder.close()))
+    timer.start()
+    lines = [json.dumps({"project": "p", "date": f"2026-01-{d:02d}"}) for d in range(1, 5)]
+    code, out = ingest(cli, capsys, tmp_path, "sessions", lines, chunk_size=2)
+    timer.join()
+    assert code == 0 and out["written"] == 4 and out["chunks"] == 2
+    assert cli.lock_retries >= 1
+
+
+def test_missing_file_is_a_json_error(cli, capsys, tmp_path):
+    with pytest.raises(SystemExit) as exc:
+        cli.cmd_ingest(argparse.Namespace(kind="sessions", file=str(tmp_path / "absent.ndjson"),
+                                          chunk_size=500))
+    assert exc.value.code == 1
+    out = json.loads(capsys.readouterr().out)
+    assert out["ok"] is False and "absent.ndjson" in out["error"]
@@ -0,0 +1,79 @@
+"""insight_tags: a normalized tag index behind --tag filters and the tags command."""
+
+import sqlite3
+
+
+def query(cli, sql, *params):
+    conn = sqlite3.connect(cli.DB_PATH)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def test_normalization_is_shared_with_the_bridge(cli):
+    assert cli.normalize_tags(" API, #deploy,,api , Release  Notes") == [
+        "api", "deploy", "release notes"]
+    assert cli.normalize_tags(["Ops", "ops"]) == ["ops"]
+    assert cli.normalize_tags(None) == []
+    assert cli._lesson_tags("API, api") == ["api"]
+    assert cli._lesson_tags(" , ") is None
+
+
+def test_tag_filter_matches_whole_tags_only(run):
+    run("add-insight", json={"project": "p", "content": "cache the token", "tags": "API, Auth"})
+    run("add-insight", json={"project": "p", "content": "ship fast", "tags": "rapid"})
+    run("add-insight", json={"project": None, "content": "global rule", "tags": "api"})
+    ids = [i["id"] for i in run("get-insights", project="p", tag=["api"])["insights"]]
+    assert ids == [3, 1]
+    ids = [i["id"] for i in run("get-insights", project="p", tag=["#API", "auth"])["insights"]]
+    assert ids == [1]
+    assert run("get-insights", project="p", tag=["nope"])["insights"] == []
+
+
+def test_search_tag_keeps_only_tagged_insights(run):
+    run("add-session", json={"project": "p", "date": "2026-01-01", "accomplished": "token work"})
+    run("add-insight", json={"project": "p", "content": "token refresh", "tags": "auth"})
+    run("add-insight", json={"project": "p", "content": "token format", "tags": "api"})
+    hits = run("search", query="token", tag=["auth"])["results"]
+    assert [(h["type"], h["id"]) for h in hits] == [("insight", 1)]
+
+
+def test_tags_command_counts_frequencies(run):
+    run("add-insight", json={"project": "a", "content": "one", "tags": "db, api"})
+    run("add-insight", json={"project": "a", "content": "two", "tags": "db"})
+    run("add-insight", json={"project": "b", "content": "three", "tags": "db, ops"})
+    out = run("tags")
+    assert out["tags"] == [{"tag": "db", "count": 3}, {"tag": "api", "count": 1},
+                           {"tag": "ops", "count": 1}]
+    assert run("tags", project="b", limit=1)["tags"] == [{"tag": "db", "count": 1}]
+
+
+def test_tags_follow_ingest_delete_and_archive(cli, run, tmp_path):
+    ndjson = tmp_path / "insights.ndjson"
+    ndjson.write_text('{"project": "p", "content": "old", "tags": "legacy"}\n'
+                      '{"project": "p", "content": "new", "tags": "fresh"}\n')
+    run("ingest", kind="insights", file=str(ndjson))
+    assert query(cli, "SELECT tag, insight_id FROM insight_tags ORDER BY insight_id") == [
+        ("legacy", 1), ("fresh", 2)]
+
+    conn = sqlite3.connect(cli.DB_PATH)
+    conn.execute("UPDATE insights SET created_at = '2020-01-01' WHERE id = 1")
+    conn.commit()
+    conn.close()
+    run("archive", older_than="2021-01-01")
+    assert query(cli, "SELECT tag FROM insight_tags") == [("fresh",)]
+    hits = run("search", query="old", tag=["legacy"])["results"]
+    assert [(h["id"], h.get("archived")) for h in hits] == [(1, True)]
+
+
+def test_migration_backfills_existing_insights(cli):
+    conn = sqlite3.connect(cli.DB_PATH)
+    conn.executescript(cli.SCHEMA_PATH.read_text())
+    conn.executemany("INSERT INTO insights (project, type, content, tags) VALUES ('p', 'lesson', ?, ?)",
+                     [("a", "Docker, CI"), ("b", ""), ("c", None)])
+    conn.commit()
+    conn.close()
+    cli.get_db().close()
+    assert query(cli, "SELECT tag, insight_id FROM insight_tags ORDER BY insight_id, tag") == [
+        ("ci", 1), ("docker", 1)]
@@ -0,0 +1,74 @@
+"""markdown_sections: one tokenizer behind both the SQLite import and Echo chunks."""
+
+import importlib.util
+import sys
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / "db"))
+
+import migrate  # noqa: E402
+from markdown_sections import iter_sections, section_bodies  # noqa: E402
+
+DIARY = """Preamble line before any heading.
+# 2026-05-01 — app
+
+## Accomplished
+- built the parser
+
+### Detail
+- in one pass
+
+## Decisions
+- Tokenize once instead of per header
+```bash
+# not a heading, just a comment in a shell block
+make bench
+```
+
+## Session 2: afternoon
+
+## Accomplished
+- wired the chunker
+"""
+
+
+def load_indexer():
+    spec = importlib.util.spec_from_file_location(
+        "echo_index", REPO / "skills" / "echo" / "index-sessions.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_sections_cover_the_text_in_order():
+    sections = list(iter_sections(DIARY))
+    assert [(s["level"], s["title"]) for s in sections] == [
+        (0, ""), (1, "2026-05-01 — app"), (2, "Accomplished"), (3, "Detail"),
+        (2, "Decisions"), (2, "Session 2: afternoon"), (2, "Accomplished")]
+    assert "".join(s["text"] for s in sections) == DIARY
+    for s in sections:
+        assert DIARY[s["start"]:s["end"]] == s["text"]
+        assert DIARY.splitlines()[s["line"]] == s["text"].split("\n", 1)[0]
+    assert "make bench" in sections[4]["body"]  # the fenced "# ..." did not split it
+    assert list(iter_sections("")) == []
+
+
+def test_bodies_keep_subsections_and_first_occurrence():
+    bodies = section_bodies(iter_sections(DIARY))
+    assert bodies["Accomplished"] == "- built the parser\n\n### Detail\n- in one pass"
+    assert bodies["Decisions"].startswith("- Tokenize once")
+
+
+def test_importer_and_chunker_agree_on_boundaries(tmp_path):
+    path = tmp_path / "2026-05-01-app.md"
+    [entry] = migrate.parse_session_file(path, DIARY)
+    assert entry["accomplished"] == ("- built the parser\n\n### Detail\n- in one pass\n"
+                                     "- wired the chunker")
+    assert "# not a heading" in entry["decisions"]
+
+    chunks = load_indexer().chunk_markdown(DIARY, str(path))
+    assert [c["section_title"] for c in chunks] == [
+        "2026-05-01-app", "Accomplished", "Detail", "Decisions", "Session 2: afternoon",
+        "Accomplished"]
+    assert chunks[3]["id"].startswith("2026-05-01-app.md:9:")
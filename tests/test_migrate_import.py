@@ -0,0 +1,89 @@
+"""db/migrate.py: markdown diaries imported in one pass, keyed by (project, date)."""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "db"))
+
+import migrate  # noqa: E402
+
+DIARY = """# Session
+
+## Accomplished
+- shipped the {what}
+
+## Decisions
+- Chose {what} over the alternative for speed
+"""
+
+
+@pytest.fixture
+def memory(tmp_path):
+    sessions = tmp_path / "memory" / "sessions"
+    (sessions / "archive").mkdir(parents=True)
+    (sessions / "session-format.md").write_text("## Accomplished\n- template\n")
+    for day in range(1, 6):
+        (sessions / f"2026-03-0{day}-app.md").write_text(DIARY.format(what=f"feature {day}"))
+    (sessions / "archive" / "2025-12-01-app.md").write_text(DIARY.format(what="old thing"))
+    return tmp_path / "memory"
+
+
+def query(cli, sql):
+    conn = sqlite3.connect(cli.DB_PATH)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def test_pool_import_is_idempotent(cli, run, memory, monkeypatch, capsys):
+    run("init")
+    monkeypatch.setattr(migrate, "POOL_MIN_FILES", 2)
+    migrate.migrate(memory, db_path=cli.DB_PATH, config_path=memory / "none.json", workers=2)
+    assert "Sessions imported: 6" in capsys.readouterr().out
+    assert query(cli, "SELECT source FROM sessions ORDER BY id") == [
+        (f"sessions/2026-03-0{day}-app.md",) for day in range(1, 6)
+    ] + [("sessions/archive/2025-12-01-app.md",)]
+    assert query(cli, "SELECT COUNT(*) FROM insight_tags") == [(6,)]
+    assert query(cli, "SELECT COUNT(*) FROM raw_blobs") == [(6,)]
+
+    monkeypatch.setattr(migrate, "read_session_file", None)  # unchanged files are never opened
+    migrate.migrate(memory, db_path=cli.DB_PATH, config_path=memory / "none.json", workers=1)
+    out = capsys.readouterr().out
+    assert "Sessions imported: 0" in out and "Unchanged (not read): 6" in out
+    assert "Processing" not in out
+    assert query(cli, "SELECT COUNT(*) FROM insights") == [(6,)]
+
+
+def test_edited_diary_updates_its_session(cli, run, memory, capsys):
+    run("init")
+    migrate.migrate(memory, db_path=cli.DB_PATH, config_path=memory / "none.json", workers=1)
+    diary = memory / "sessions" / "2026-03-02-app.md"
+    diary.write_text(DIARY.format(what="feature 2") + "- Moved the cache into redis for real\n")
+    (memory / "sessions" / "2026-03-03-app.md").touch()
+    (memory / "sessions" / "2026-03-04-app.md").unlink()
+    capsys.readouterr()
+
+    migrate.migrate(memory, db_path=cli.DB_PATH, config_path=memory / "none.json", workers=1)
+    out = capsys.readouterr().out
+    assert "Sessions updated: 1" in out and "Insights extracted: 1" in out
+    assert "Unchanged (not read): 3" in out and "EXISTS" not in out
+    [(decisions,)] = query(cli, "SELECT decisions FROM sessions WHERE date = '2026-03-02'")
+    assert "redis" in decisions
+    assert query(cli, "SELECT COUNT(*) FROM sessions") == [(6,)]
+    assert query(cli, "SELECT COUNT(*) FROM raw_blobs") == [(6,)]
+    assert ("sessions/2026-03-04-app.md",) not in query(cli, "SELECT path FROM import_manifest")
+
+
+def test_days_written_or_archived_elsewhere_are_skipped(cli, run, memory, capsys):
+    run("add-session", json={"project": "app", "date": "2026-03-01", "accomplished": "diary"})
+    run("add-session", json={"project": "app", "date": "2025-12-01", "accomplished": "old"})
+    run("archive", older_than="2026-01-01")
+    migrate.migrate(memory, db_path=cli.DB_PATH, config_path=memory / "none.json", workers=1)
+    out = capsys.readouterr().out
+    assert "Sessions imported: 4" in out
+    assert "EXISTS: app 2026-03-01" in out and "EXISTS: app 2025-12-01" in out
+    assert query(cli, "SELECT COUNT(*) FROM sessions WHERE date = '2026-03-01'") == [(1,)]
@@ -0,0 +1,75 @@
+"""Schema migrations: numbered, idempotent steps, and index-ordered hot queries."""
+
+import sqlite3
+
+import pytest
+
+
+def versions(path):
+    conn = sqlite3.connect(path)
+    try:
+        recorded = [r[0] for r in conn.execute("SELECT version FROM schema_version ORDER BY version")]
+        return recorded, conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_fresh_database_applies_every_step(cli, run):
+    out = run("init")
+    assert out["migrated"] == [v for v, _, _ in cli.MIGRATIONS]
+    assert out["schema_version"] == cli.SCHEMA_VERSION
+    assert versions(cli.DB_PATH) == (list(range(1, cli.SCHEMA_VERSION + 1)), cli.SCHEMA_VERSION)
+
+
+def test_rerunning_is_a_no_op(cli, run):
+    run("init")
+    assert run("init")["migrated"] == []
+    conn = cli.get_db()
+    assert cli.migrate_schema(conn) == []
+    conn.close()
+
+
+def test_baseline_database_is_upgraded_in_place(cli, run):
+    conn = sqlite3.connect(cli.DB_PATH)
+    conn.executescript(cli.SCHEMA_PATH.read_text())
+    conn.execute("INSERT INTO sessions (project, date) VALUES ('p', '2025-01-01')")
+    conn.commit()
+    conn.close()
+
+    out = run("init")
+    assert out["migrated"] == list(range(2, cli.SCHEMA_VERSION + 1))
+    assert run("get-sessions", project="p", limit=5)["count"] == 1
+
+
+def test_a_failing_step_rolls_back_and_is_retried(cli, monkeypatch):
+    def boom(conn):
+        conn.execute("CREATE TABLE half_done (x)")
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(cli, "MIGRATIONS", cli.MIGRATIONS + [(99, "explodes", boom)])
+    monkeypatch.setattr(cli, "SCHEMA_VERSION", 99)
+    with pytest.raises(RuntimeError):
+        cli.get_db()
+    conn = sqlite3.connect(cli.DB_PATH)
+    assert conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'half_done'").fetchone() is None
+    assert conn.execute("PRAGMA user_version").fetchone()[0] < 99
+    conn.close()
+
+
+# ── hot queries are served in index order ─────────────────────────────────────
+
+@pytest.mark.parametrize("command, kwargs", [
+    ("get-sessions", {"project": "p", "limit": 5}),
+    ("get-insights", {"project": "p"}),
+    ("export-md", {"project": "p"}),
+])
+def test_no_temp_btree_sort(cli, run, traced, query_plans, command, kwargs):
+    run("add-session", json={"project": "p", "date": "2026-01-01", "accomplished": "x"})
+    run("add-insight", json={"project": "p", "type": "decision", "content": "y"})
+    del traced[:]
+    run(command, **kwargs)
+    plans = query_plans(traced)
+    assert plans, "command ran no SELECT"
+    for sql, plan in plans.items():
+        assert not any("TEMP B-TREE" in step for step in plan), (sql, plan)
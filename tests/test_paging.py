@@ -0,0 +1,92 @@
+"""Keyset paging, --fields projection and NDJSON streaming."""
+
+import json
+
+import pytest
+
+
+@pytest.fixture
+def corpus(run):
+    for day in range(1, 8):
+        run("add-session", json={"project": "p", "date": f"2026-02-{day:02d}",
+                                 "accomplished": f"shipped paging step {day}"})
+    # Same date twice: the id tie-break must keep pages disjoint.
+    run("add-session", json={"project": "p", "date": "2026-02-07", "accomplished": "paging again"})
+    for i in range(5):
+        run("add-insight", json={"project": "p" if i % 2 else None, "type": "lesson",
+                                 "content": f"paging insight {i}"})
+
+
+def walk(run, command, key, **kwargs):
+    pages, after = [], None
+    while True:
+        out = run(command, after=after, **kwargs)
+        pages.append([row["id"] for row in out[key]])
+        after = out["next_cursor"]
+        if after is None:
+            return pages
+
+
+def test_sessions_pages_are_disjoint_and_ordered(run, corpus):
+    pages = walk(run, "get-sessions", "sessions", project="p", limit=3)
+    flat = [i for page in pages for i in page]
+    assert [len(p) for p in pages] == [3, 3, 2]
+    assert flat == [8, 7, 6, 5, 4, 3, 2, 1]
+
+
+def test_insights_pages_include_globals(run, corpus):
+    pages = walk(run, "get-insights", "insights", project="p", limit=2)
+    assert sorted(i for page in pages for i in page) == [1, 2, 3, 4, 5]
+    assert run("get-insights", project="p")["next_cursor"] is None  # no --limit: one page
+
+
+def test_search_pages_follow_rank(run, corpus):
+    everything = run("search", query="paging", limit=100)["results"]
+    pages = walk(run, "search", "results", query="paging", limit=4)
+    assert [i for page in pages for i in page] == [r["id"] for r in everything]
+
+
+def test_fields_projection(run, corpus):
+    out = run("get-sessions", project="p", limit=2, fields="id,date")
+    assert all(set(row) == {"id", "date"} for row in out["sessions"])
+    out = run("get-insights", project="p", fields="content")
+    assert all(set(row) == {"content"} for row in out["insights"])
+    # Projection does not break paging: the sort key is read, just not returned.
+    assert out["next_cursor"] is None
+    out = run("search", query="paging", fields="type,id,score")
+    assert all(set(row) == {"type", "id", "score"} for row in out["results"])
+
+
+def test_ndjson_streams_rows_then_a_summary(run, corpus):
+    text = run("get-sessions", project="p", limit=3, ndjson=True)
+    lines = [json.loads(line) for line in text.splitlines()]
+    assert len(lines) == 4
+    assert lines[-1]["count"] == 3 and lines[-1]["next_cursor"]
+    assert "accomplished" in lines[0]
+
+
+@pytest.mark.parametrize("command, kwargs", [
+    ("get-sessions", {"project": "p", "fields": "bogus"}),
+    ("get-sessions", {"project": "p", "after": "not-a-cursor"}),
+])
+def test_bad_arguments_exit_cleanly(run, corpus, command, kwargs):
+    with pytest.raises(SystemExit):
+        run(command, **kwargs)
+
+
+def test_a_cursor_from_another_command_is_rejected(cli, run, corpus):
+    token = cli.encode_cursor("get-insights", ["2026-01-01", 1])
+    with pytest.raises(SystemExit):
+        run("get-sessions", project="p", after=token)
+
+
+@pytest.mark.parametrize("command, key, kwargs", [
+    ("get-sessions", "sessions", {"project": "p", "limit": 2}),
+    ("get-insights", "insights", {"project": "p", "limit": 2}),
+])
+def test_later_pages_still_avoid_a_sort(run, corpus, traced, query_plans, command, key, kwargs):
+    cursor = run(command, **kwargs)["next_cursor"]
+    del traced[:]
+    run(command, after=cursor, **kwargs)
+    for sql, plan in query_plans(traced).items():
+        assert not any("TEMP B-TREE" in step for step in plan), (sql, plan)
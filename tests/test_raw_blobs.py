@@ -0,0 +1,80 @@
+"""raw_markdown: compressed, content-addressed, and only read when asked for."""
+
+import argparse
+import json
+import sqlite3
+
+TEXT = "# Session Diary\n\n## Accomplished\n- shipped it\n" * 20
+
+
+def query(cli, sql, *params):
+    conn = sqlite3.connect(cli.DB_PATH)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def test_sessions_store_a_hash_and_share_blobs(cli, run):
+    run("add-session", json={"project": "p", "date": "2026-01-01", "raw_markdown": TEXT})
+    run("add-session", json={"project": "p", "date": "2026-01-02", "raw_markdown": TEXT})
+    run("add-session", json={"project": "p", "date": "2026-01-03"})
+    rows = query(cli, "SELECT raw_markdown, raw_hash FROM sessions ORDER BY id")
+    assert [r[0] for r in rows] == [None, None, None]
+    assert rows[0][1] == rows[1][1] and rows[2][1] is None
+    [(codec, size, stored)] = query(cli, "SELECT codec, size, length(data) FROM raw_blobs")
+    assert codec == "zlib" and size == len(TEXT) and stored < size
+
+
+def test_raw_is_only_read_on_request(cli, run, traced):
+    run("add-session", json={"project": "p", "date": "2026-01-01", "raw_markdown": TEXT})
+    traced.clear()
+    out = run("get-sessions", project="p")
+    assert "raw_markdown" not in out["sessions"][0]
+    run("export-md", project="p")
+    assert not any("raw_blobs" in s or "raw_markdown" in s for s in traced)
+
+    assert run("get-sessions", project="p", raw=True)["sessions"][0]["raw_markdown"] == TEXT
+    assert TEXT.strip() in run("export-md", project="p", raw=True)
+
+
+def test_deleting_the_last_reference_drops_the_blob(cli, run):
+    run("add-session", json={"project": "p", "date": "2026-01-01", "raw_markdown": TEXT})
+    run("add-session", json={"project": "p", "date": "2026-01-02", "raw_markdown": TEXT})
+    conn = sqlite3.connect(cli.DB_PATH)
+    conn.execute("DELETE FROM sessions WHERE date = '2026-01-01'")
+    conn.commit()
+    assert conn.execute("SELECT COUNT(*) FROM raw_blobs").fetchone()[0] == 1
+    conn.execute("DELETE FROM sessions")
+    conn.commit()
+    assert conn.execute("SELECT COUNT(*) FROM raw_blobs").fetchone()[0] == 0
+    conn.close()
+
+
+def test_migration_moves_inline_markdown(cli, run):
+    conn = sqlite3.connect(cli.DB_PATH)
+    conn.executescript(cli.SCHEMA_PATH.read_text())
+    conn.executemany("INSERT INTO sessions (project, date, raw_markdown) VALUES ('p', ?, ?)",
+                     [("2025-01-01", TEXT), ("2025-01-02", TEXT), ("2025-01-03", "")])
+    conn.commit()
+    conn.close()
+
+    out = run("get-sessions", project="p", raw=True, limit=5)
+    assert [s["raw_markdown"] for s in out["sessions"]] == [None, TEXT, TEXT]
+    assert query(cli, "SELECT COUNT(*) FROM sessions WHERE raw_markdown IS NOT NULL") == [(0,)]
+    assert query(cli, "SELECT COUNT(*) FROM raw_blobs") == [(1,)]
+
+
+def test_ingest_rolls_back_the_blob_of_a_rejected_line(cli, capsys, tmp_path):
+    path = tmp_path / "sessions.ndjson"
+    path.write_text("\n".join([
+        json.dumps({"project": "p", "date": "2026-01-01", "raw_markdown": "kept"}),
+        json.dumps({"project": "p", "date": {"bad": 1}, "raw_markdown": "dropped"}),
+    ]) + "\n", encoding="utf-8")
+    try:
+        cli.cmd_ingest(argparse.Namespace(kind="sessions", file=str(path), chunk_size=10))
+    except SystemExit:
+        pass
+    out = json.loads(capsys.readouterr().out)
+    assert out["written"] == 1
+    assert query(cli, "SELECT size FROM raw_blobs") == [(4,)]
@@ -0,0 +1,94 @@
+"""Result cache for get-context / get-plan / get-insights."""
+
+import sqlite3
+
+
+def test_repeat_reads_are_served_from_the_cache(cli, run, traced):
+    run("add-plan-task", json={"project": "p", "task_number": 1, "description": "a"})
+    first = run("get-plan", project="p")
+    traced.clear()
+    assert run("get-plan", project="p") == first
+    assert not any("FROM plans" in s for s in traced)
+    cache = run("stats")["result_cache"]
+    assert (cache["hits"], cache["misses"], cache["entries"]) == (1, 1, 1)
+
+
+def test_arguments_are_part_of_the_key(cli, run):
+    run("add-insight", json={"project": "p", "content": "one"})
+    run("add-insight", json={"project": "p", "content": "two"})
+    assert run("get-insights", project="p", limit=1)["count"] == 1
+    assert run("get-insights", project="p", limit=2)["count"] == 2
+    assert run("get-context", project="q")["status"] == "no context saved"
+
+
+def test_writes_to_cached_tables_invalidate(cli, run):
+    run("set-context", json={"project": "p", "status": "active"})
+    assert run("get-context", project="p")["status"] == "active"
+    run("set-context", json={"project": "p", "status": "paused"})
+    assert run("get-context", project="p")["status"] == "paused"
+
+    conn = sqlite3.connect(cli.DB_PATH)
+    conn.execute("UPDATE project_context SET status = 'completed'")
+    conn.commit()
+    conn.close()
+    assert run("get-context", project="p")["status"] == "completed"
+
+
+def test_session_writes_keep_the_cache(cli, run):
+    run("get-plan", project="p")
+    run("add-session", json={"project": "p", "date": "2026-01-01"})
+    run("get-plan", project="p")
+    assert run("stats")["result_cache"]["hits"] == 1
+
+
+def test_least_recently_used_entries_are_evicted(cli, run, monkeypatch):
+    run("get-plan", project="a")
+    conn = sqlite3.connect(cli.cache_path())
+    [(size,)] = conn.execute("SELECT size FROM entries").fetchall()
+    conn.close()
+    monkeypatch.setattr(cli, "cache_limit_bytes", lambda: int(size * 2.5))
+    run("get-plan", project="b")
+    run("get-plan", project="a")  # a is now fresher than b
+    run("get-plan", project="c")
+    cache = run("stats")["result_cache"]
+    assert cache["entries"] == 2 and cache["evictions"] == 1
+    run("get-plan", project="a")
+    assert run("stats")["result_cache"]["hits"] == 2
+
+
+def test_zero_size_disables_the_cache(cli, run, monkeypatch):
+    monkeypatch.setattr(cli, "cache_limit_bytes", lambda: 0)
+    run("get-plan", project="p")
+    assert not cli.cache_path().exists()
+
+
+def test_a_broken_cache_file_is_bypassed(cli, run):
+    run("init")
+    cli.cache_path().write_bytes(b"not a database" * 100)
+    assert run("get-plan", project="p")["total"] == 0
+
+
+def test_oversized_output_streams_without_being_held(cli, run, monkeypatch):
+    class Sink:
+        def __init__(self):
+            self.writes = []
+
+        def write(self, text):
+            self.writes.append(text)
+
+        def flush(self):
+            pass
+
+    sink = Sink()
+    tee = cli._CappedTee(sink, limit=10)
+    tee.write("12345")
+    assert tee.getvalue() == "12345"
+    tee.write("678901")
+    tee.write("more")
+    assert sink.writes == ["12345", "678901", "more"]  # written as produced
+    assert tee.getvalue() is None and tee.parts is None
+
+    monkeypatch.setattr(cli, "cache_limit_bytes", lambda: 10)
+    run("add-insight", json={"project": "p", "content": "longer than ten characters"})
+    assert run("get-insights", project="p")["count"] == 1
+    assert run("stats")["result_cache"]["entries"] == 0
@@ -0,0 +1,74 @@
+"""search: FTS5 ranking, snippets, phrase/prefix syntax and trigger sync."""
+
+import sqlite3
+
+
+def search(run, query, project=None, limit=10):
+    return run("search", query=query, project=project, limit=limit)["results"]
+
+
+def seed(run):
+    run("add-session", json={"project": "alpha", "date": "2026-01-02",
+                             "accomplished": "Fixed the authentication flow for SSO",
+                             "decisions": "Use PKCE everywhere"})
+    run("add-session", json={"project": "beta", "date": "2026-01-03",
+                             "accomplished": "Tuned the C++ build cache"})
+    run("add-insight", json={"project": "alpha", "type": "architecture",
+                             "content": "Authentication tokens live in the session store",
+                             "tags": "auth"})
+    run("set-context", json={"project": "alpha", "known_issues": "flaky authentication retries"})
+
+
+def test_merged_ranking_spans_all_three_tables(run):
+    seed(run)
+    kinds = {r["type"] for r in search(run, "authentication")}
+    assert kinds == {"session", "insight", "context"}
+
+
+def test_results_are_ordered_by_score_and_carry_snippets(run):
+    seed(run)
+    results = search(run, "authentication")
+    scores = [r["score"] for r in results]
+    assert scores == sorted(scores, reverse=True)
+    assert all("**" in r["snippet"] for r in results)
+
+
+def test_prefix_and_phrase_syntax(run):
+    seed(run)
+    assert search(run, "authent*")
+    assert search(run, "authent") == []
+    assert len(search(run, '"authentication flow"')) == 1
+    assert search(run, '"flow authentication"') == []
+
+
+def test_punctuation_is_not_parsed_as_fts_syntax(run):
+    seed(run)
+    hits = search(run, "C++ build")
+    assert [h["project"] for h in hits] == ["beta"]
+    assert search(run, "-") == []
+
+
+def test_project_filter_and_limit(run):
+    seed(run)
+    assert {r["project"] for r in search(run, "authentication", project="alpha")} == {"alpha"}
+    assert len(search(run, "authentication", limit=1)) == 1
+
+
+def test_updates_and_deletes_stay_in_sync(cli, run):
+    seed(run)
+    run("set-context", json={"project": "alpha", "known_issues": "nothing left"})
+    assert "context" not in {r["type"] for r in search(run, "authentication")}
+    conn = sqlite3.connect(cli.DB_PATH)
+    conn.execute("DELETE FROM sessions WHERE project = 'beta'")
+    conn.commit()
+    conn.close()
+    assert search(run, "cache") == []
+
+
+def test_migration_indexes_rows_written_before_it(cli, run):
+    conn = sqlite3.connect(cli.DB_PATH)
+    conn.executescript(cli.SCHEMA_PATH.read_text())
+    conn.execute("INSERT INTO insights (project, type, content) VALUES ('old', 'lesson', 'legacy row')")
+    conn.commit()
+    conn.close()
+    assert [r["project"] for r in search(run, "legacy")] == ["old"]
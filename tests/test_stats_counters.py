@@ -0,0 +1,76 @@
+"""stats reads trigger-maintained counters; --recount verifies and repairs them."""
+
+import sqlite3
+
+
+def sql(cli, *statements):
+    conn = sqlite3.connect(cli.DB_PATH)
+    try:
+        for statement in statements:
+            conn.execute(statement)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def test_counters_follow_writes(cli, run):
+    run("add-session", json={"project": "alpha", "date": "2026-01-01"})
+    run("add-session", json={"project": "alpha", "date": "2026-01-03"})
+    run("add-session", json={"project": "beta", "date": "2026-01-02"})
+    run("add-insight", json={"project": "alpha", "content": "x"})
+    run("add-insight", json={"content": "global"})
+    run("add-plan-task", json={"project": "alpha", "task_number": 1, "description": "a"})
+    run("add-plan-task", json={"project": "alpha", "task_number": 2, "description": "b"})
+    run("update-task", json={"project": "alpha", "task_number": 1, "status": "completed"})
+
+    out = run("stats")
+    assert (out["sessions"], out["insights"], out["plan_tasks"], out["open_tasks"]) == (3, 2, 2, 1)
+    assert out["sessions_by_project"] == {"alpha": 2, "beta": 1}
+    assert out["activity_by_project"]["alpha"]["last_session_date"] == "2026-01-03"
+    assert out["activity_by_project"]["alpha"]["open_tasks"] == 1
+
+
+def test_deletes_and_moves_are_counted(cli, run):
+    run("add-session", json={"project": "alpha", "date": "2026-01-01"})
+    run("add-session", json={"project": "alpha", "date": "2026-01-02"})
+    run("add-plan-task", json={"project": "alpha", "task_number": 1, "description": "a"})
+    sql(cli, "UPDATE sessions SET project = 'beta' WHERE date = '2026-01-02'",
+        "DELETE FROM plans")
+    out = run("stats")
+    assert out["sessions_by_project"] == {"alpha": 1, "beta": 1}
+    assert out["plan_tasks"] == 0 and out["open_tasks"] == 0
+
+
+def test_stats_does_not_scan_the_tables(cli, run, traced):
+    run("add-session", json={"project": "alpha", "date": "2026-01-01"})
+    traced.clear()
+    run("stats")
+    assert not any("FROM sessions" in s or "FROM insights" in s for s in traced)
+
+
+def test_recount_reports_and_repairs_drift(cli, run):
+    run("add-session", json={"project": "alpha", "date": "2026-01-01"})
+    run("add-insight", json={"project": "alpha", "content": "x"})
+    assert run("stats", recount=True)["recount"] == {"drift": [], "repaired": 0}
+
+    sql(cli, "UPDATE stats_counters SET sessions = 7", "DELETE FROM insights")
+    out = run("stats", recount=True)
+    [drift] = out["recount"]["drift"]
+    assert drift["project"] == "alpha" and drift["stored"]["sessions"] == 7
+    assert out["sessions"] == 1 and out["insights"] == 0
+    assert run("stats", recount=True)["recount"]["repaired"] == 0
+
+
+def test_migration_backfills_existing_rows(cli, run):
+    conn = sqlite3.connect(cli.DB_PATH)
+    conn.executescript(cli.SCHEMA_PATH.read_text())
+    conn.executemany("INSERT INTO sessions (project, date) VALUES (?, ?)",
+                     [("p", "2025-01-01"), ("p", "2025-02-01"), ("q", "2025-01-05")])
+    conn.execute("INSERT INTO plans (project, task_number, description) VALUES ('p', 1, 'd')")
+    conn.commit()
+    conn.close()
+
+    out = run("stats")
+    assert out["sessions_by_project"] == {"p": 2, "q": 1}
+    assert out["open_tasks"] == 1
+    assert run("stats", recount=True)["recount"]["repaired"] == 0
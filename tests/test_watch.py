@@ -0,0 +1,79 @@
+"""watch: changed memory markdown reaches SQLite (and the echo index) in batches."""
+
+import sys
+import threading
+
+import pytest
+
+DIARY = "# Session\n\n## Accomplished\n- {what}\n\n## Decisions\n- Picked {what} because it was fast\n"
+
+
+@pytest.fixture
+def memory(tmp_path):
+    (tmp_path / "memory" / "sessions" / "archive").mkdir(parents=True)
+    (tmp_path / "memory" / "plans").mkdir()
+    return tmp_path / "memory"
+
+
+class FakeWatcher:
+    """Replays scripted wait() results, then stops the loop."""
+
+    def __init__(self, script, stop):
+        self.script, self.stop, self.timeouts = list(script), stop, []
+
+    def wait(self, timeout):
+        self.timeouts.append(timeout)
+        if not self.script:
+            self.stop.set()
+            return set()
+        return self.script.pop(0)
+
+
+def test_bursts_are_debounced_into_one_batch(cli):
+    stop = threading.Event()
+    watcher = FakeWatcher([{"a.md"}, {"b.md", "a.md"}, set(), set(), {"c.md"}, set()], stop)
+    batches = list(cli.watch_batches(watcher, debounce=0.5, interval=2.0, stop=stop))
+    assert batches == [["a.md", "b.md"], ["c.md"]]
+    assert watcher.timeouts[:4] == [2.0, 0.5, 0.5, 2.0]  # quiet waits are the debounce
+
+
+@pytest.mark.parametrize("backend", ["poll", "inotify"])
+def test_watchers_report_created_modified_and_removed(cli, memory, backend):
+    if backend == "inotify" and not sys.platform.startswith("linux"):
+        pytest.skip("inotify is Linux-only")
+    sessions = memory / "sessions"
+    (sessions / "old.md").write_text("one")
+    watcher = cli.open_watcher(cli.watch_dirs(memory), backend)
+    try:
+        assert watcher.backend == backend
+        (sessions / "2026-06-01-app.md").write_text("new")
+        (sessions / "old.md").write_text("changed, and longer")
+        (memory / "plans" / "notes.txt").write_text("not markdown")
+        assert watcher.wait(0.2) == {str(sessions / "2026-06-01-app.md"), str(sessions / "old.md")}
+        (sessions / "old.md").unlink()
+        assert watcher.wait(0.2) == {str(sessions / "old.md")}
+        assert watcher.wait(0.05) == set()
+    finally:
+        watcher.close()
+
+
+def test_sync_imports_only_the_changed_diaries(cli, run, memory):
+    run("init")
+    first = memory / "sessions" / "2026-06-01-app.md"
+    first.write_text(DIARY.format(what="sqlite"))
+    out = cli.sync_memory_files(None, memory, vectors=False)
+    assert out["sessions"] == {"added": 1, "updated": 0, "insights": 1}
+
+    second = memory / "sessions" / "2026-06-02-app.md"
+    second.write_text(DIARY.format(what="inotify"))
+    (memory / "plans" / "roadmap.md").write_text("# Plan\n")
+    out = cli.sync_memory_files([second, memory / "plans" / "roadmap.md"], memory, vectors=False)
+    assert out["ok"] and out["sessions"] == {"added": 1, "updated": 0, "insights": 1}
+    assert [s["date"] for s in run("get-sessions", project="app")["sessions"]] == [
+        "2026-06-02", "2026-06-01"]
+    assert run("search", query="inotify")["results"][0]["type"] == "session"
+
+    first.unlink()
+    out = cli.sync_memory_files([first], memory, vectors=False)
+    assert out["removed"] == [str(first)] and "sessions" not in out
+    assert len(run("get-sessions", project="app")["sessions"]) == 2
@@ -0,0 +1,53 @@
+"""Concurrent writers: busy_timeout waits, BEGIN IMMEDIATE, bounded retry."""
+
+import sqlite3
+import threading
+
+import pytest
+
+
+def hold_write_lock(cli, seconds):
+    """Take the write lock from another connection; release it after ``seconds``."""
+    conn = sqlite3.connect(cli.DB_PATH, check_same_thread=False, isolation_level=None)
+    conn.execute("BEGIN IMMEDIATE")
+    timer = threading.Timer(seconds, lambda: (conn.execute("COMMIT"), conn.close()))
+    timer.start()
+    return timer
+
+
+def test_writer_waits_out_a_short_lock(cli, run):
+    run("init")
+    timer = hold_write_lock(cli, 0.3)
+    assert run("add-session", json={"project": "p", "date": "2026-01-01"})["ok"]
+    timer.join()
+    assert cli.lock_retries == 0
+
+
+def test_exhausted_busy_timeout_is_retried(cli, run, monkeypatch):
+    run("init")
+    monkeypatch.setenv("MEMSTACK_BUSY_TIMEOUT_MS", "0")
+    monkeypatch.setattr(cli, "_pragmas", None)
+    timer = hold_write_lock(cli, 0.2)
+    assert run("add-insight", json={"project": "p", "content": "x"})["ok"]
+    timer.join()
+    assert cli.lock_retries >= 1
+    assert run("stats")["insights"] == 1
+
+
+def test_gives_up_with_a_json_error(cli, run, monkeypatch, capsys):
+    run("init")
+    monkeypatch.setenv("MEMSTACK_BUSY_TIMEOUT_MS", "0")
+    monkeypatch.setattr(cli, "_pragmas", None)
+    monkeypatch.setattr(cli, "_retry_policy", lambda: (2, 0.001))
+    timer = hold_write_lock(cli, 1.0)
+    with pytest.raises(SystemExit) as exc:
+        run("set-context", json={"project": "p", "status": "active"})
+    timer.join()
+    assert exc.value.code == 1
+    assert "gave up after 2 retries" in capsys.readouterr().out
+    assert cli.lock_retries == 2
+
+
+def test_writes_take_the_lock_up_front(cli, run, traced):
+    run("add-plan-task", json={"project": "p", "task_number": 1, "description": "d"})
+    assert "BEGIN IMMEDIATE" in traced